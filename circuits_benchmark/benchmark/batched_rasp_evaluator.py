@@ -0,0 +1,268 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from tracr.rasp import rasp
+
+
+@dataclass
+class BatchedSOpValue:
+    """Value of an SOp over a batch of sequences: integer codes of shape [batch, seq_len] indexing into a table with the
+    distinct values taken by the SOp."""
+    codes: np.ndarray
+    table: List[Any]
+
+
+@dataclass
+class BatchedEvaluationContext:
+    """Inputs of a batched evaluation, plus the values already computed for each expression."""
+    tokens: BatchedSOpValue
+    batch_size: int
+    seq_len: int
+    values_by_expr_id: Dict[int, BatchedSOpValue | np.ndarray] = field(default_factory=dict)
+
+
+class BatchedRASPEvaluator:
+    """Evaluates RASP programs over a batch of sequences of the same length at once.
+
+    SOp values are represented as codes into a table of distinct values (see BatchedSOpValue), so that Map and
+    SequenceMap only need to call their function once per distinct value (pair), and selectors are represented as
+    boolean arrays of shape [batch, query, key]. Aggregate is a masked mean over the keys and SelectorWidth a row sum.
+    The semantics follow Tracr's per-sequence evaluator, including None propagation in Map and SequenceMap.
+    """
+
+    def __init__(self):
+        self._eval_fn_by_expr_type: Dict[type, Callable[[Any, BatchedEvaluationContext], Any]] = {
+            # Primitives
+            rasp.TokensType: self.eval_tokens,
+            rasp.IndicesType: self.eval_indices,
+            rasp.LengthType: self.eval_length,
+            # SOps
+            rasp.Map: self.eval_map,
+            rasp.SequenceMap: self.eval_sequence_map,
+            rasp.Full: self.eval_full,
+            rasp.ConstantSOp: self.eval_constant_sop,
+            rasp.SelectorWidth: self.eval_selector_width,
+            rasp.Aggregate: self.eval_aggregate,
+            # Selectors
+            rasp.Select: self.eval_select,
+            rasp.SelectorAnd: self.eval_selector_and,
+            rasp.SelectorOr: self.eval_selector_or,
+            rasp.SelectorNot: self.eval_selector_not,
+            rasp.ConstantSelector: self.eval_constant_selector,
+        }
+
+    def evaluate(self, program: rasp.SOp, token_codes: np.ndarray, vals: Sequence[Any]) -> np.ndarray:
+        """Evaluates the program on a batch of sequences of the same length (without BOS), given as codes of shape
+        [batch, seq_len] indexing into vals. Returns an object array of shape [batch, seq_len] with the outputs."""
+        assert isinstance(program, rasp.SOp), "Only SOps can be evaluated in batch"
+        batch_size, seq_len = token_codes.shape
+
+        tokens_table = np.empty(len(vals), dtype=object)
+        for i, val in enumerate(vals):
+            tokens_table[i] = val
+        tokens = compact_sop_value(token_codes.astype(np.int64), list(tokens_table))
+
+        ctx = BatchedEvaluationContext(tokens=tokens, batch_size=batch_size, seq_len=seq_len)
+        output = self._evaluate(program, ctx)
+
+        output_table = np.empty(len(output.table), dtype=object)
+        for i, value in enumerate(output.table):
+            output_table[i] = value
+
+        return output_table[output.codes]
+
+    def _evaluate(self, expr: rasp.RASPExpr, ctx: BatchedEvaluationContext) -> BatchedSOpValue | np.ndarray:
+        expr_id = id(expr)
+        if expr_id in ctx.values_by_expr_id:
+            return ctx.values_by_expr_id[expr_id]
+
+        # Look up the evaluation function through the MRO, so that subclasses such as LinearSequenceMap are handled by
+        # the function of their parent class.
+        eval_fn = None
+        for expr_type in type(expr).__mro__:
+            if expr_type in self._eval_fn_by_expr_type:
+                eval_fn = self._eval_fn_by_expr_type[expr_type]
+                break
+
+        if eval_fn is None:
+            raise NotImplementedError(f"Batched evaluation is not supported for {type(expr).__name__} expressions.")
+
+        value = eval_fn(expr, ctx)
+        ctx.values_by_expr_id[expr_id] = value
+
+        return value
+
+    def eval_tokens(self, expr: rasp.TokensType, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        return ctx.tokens
+
+    def eval_indices(self, expr: rasp.IndicesType, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        codes = np.broadcast_to(np.arange(ctx.seq_len, dtype=np.int64), (ctx.batch_size, ctx.seq_len))
+        return BatchedSOpValue(codes, list(range(ctx.seq_len)))
+
+    def eval_length(self, expr: rasp.LengthType, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        codes = np.zeros((ctx.batch_size, ctx.seq_len), dtype=np.int64)
+        return BatchedSOpValue(codes, [ctx.seq_len])
+
+    def eval_map(self, expr: rasp.Map, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        inner = self._evaluate(expr.inner, ctx)
+        table = [expr.f(x) if x is not None else None for x in inner.table]
+        return compact_sop_value(inner.codes, table)
+
+    def eval_sequence_map(self, expr: rasp.SequenceMap, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        fst = self._evaluate(expr.fst, ctx)
+        snd = self._evaluate(expr.snd, ctx)
+
+        # Apply the function only to the pairs of values that actually occur at the same position
+        n_snd = len(snd.table)
+        pair_codes, codes = unique_codes(fst.codes * n_snd + snd.codes, len(fst.table) * n_snd)
+
+        table = []
+        for pair_code in pair_codes.tolist():
+            x = fst.table[pair_code // n_snd]
+            y = snd.table[pair_code % n_snd]
+            table.append(expr.f(x, y) if x is not None and y is not None else None)
+
+        return compact_sop_value(codes, table)
+
+    def eval_full(self, expr: rasp.Full, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        codes = np.zeros((ctx.batch_size, ctx.seq_len), dtype=np.int64)
+        return BatchedSOpValue(codes, [expr.fill])
+
+    def eval_constant_sop(self, expr: rasp.ConstantSOp, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        if len(expr.value) != ctx.seq_len:
+            raise NotImplementedError("Batched evaluation requires constant SOps to match the input length.")
+
+        codes = np.broadcast_to(np.arange(ctx.seq_len, dtype=np.int64), (ctx.batch_size, ctx.seq_len))
+        return compact_sop_value(codes, list(expr.value))
+
+    def eval_selector_width(self, expr: rasp.SelectorWidth, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        selector = self._evaluate(expr.selector, ctx)
+        widths = selector.sum(axis=-1, dtype=np.int64)
+        return compact_sop_value(widths, list(range(selector.shape[-1] + 1)))
+
+    def eval_aggregate(self, expr: rasp.Aggregate, ctx: BatchedEvaluationContext) -> BatchedSOpValue:
+        selector = self._evaluate(expr.selector, ctx)  # [batch, query, key]
+        sop = self._evaluate(expr.sop, ctx)  # [batch, key]
+        default = expr.default
+
+        counts = selector.sum(axis=-1, dtype=np.int64)  # [batch, query]
+        codes = np.zeros(counts.shape, dtype=np.int64)
+        table = [default]
+
+        # When a single key is selected, the output only depends on the selected value, so we aggregate each value in
+        # the table once.
+        single = counts == 1
+        if single.any():
+            selected_key = selector.argmax(axis=-1)
+            selected_codes = np.take_along_axis(sop.codes, selected_key, axis=-1)
+            codes[single] = len(table) + selected_codes[single]
+            table.extend([_mean([x], default) for x in sop.table])
+
+        multiple = counts > 1
+        if multiple.any():
+            # Means of integers (and booleans) are computed as an exact masked sum divided by the number of selected keys.
+            is_int = np.array([isinstance(x, int) for x in sop.table], dtype=bool)
+            int_table = np.array([x if isinstance(x, int) else 0 for x in sop.table], dtype=np.int64)
+            selects_non_int = (selector & ~is_int[sop.codes][:, None, :]).any(axis=-1)
+
+            int_mean = multiple & ~selects_non_int
+            if int_mean.any():
+                sums = np.einsum("bqk,bk->bq", selector.astype(np.int64), int_table[sop.codes])
+                means, mean_codes = np.unique(sums[int_mean] / counts[int_mean], return_inverse=True)
+                codes[int_mean] = len(table) + mean_codes.reshape(-1)
+                table.extend(means.tolist())
+
+            # Any other value is aggregated one output at a time, exactly as Tracr's evaluator does.
+            for b, q in np.argwhere(multiple & selects_non_int).tolist():
+                selected = [sop.table[c] for c, s in zip(sop.codes[b].tolist(), selector[b, q].tolist()) if s]
+                codes[b, q] = len(table)
+                table.append(_mean(selected, default))
+
+        return compact_sop_value(codes, table)
+
+    def eval_select(self, expr: rasp.Select, ctx: BatchedEvaluationContext) -> np.ndarray:
+        keys = self._evaluate(expr.keys, ctx)
+        queries = self._evaluate(expr.queries, ctx)
+
+        # Evaluate the predicate only on the (query, key) pairs that occur together in some sequence
+        n_keys = len(keys.table)
+        pair_codes, codes = unique_codes(queries.codes[:, :, None] * n_keys + keys.codes[:, None, :],
+                                         len(queries.table) * n_keys)
+
+        predicate_table = np.array([bool(expr.predicate(keys.table[pair_code % n_keys],
+                                                        queries.table[pair_code // n_keys]))
+                                    for pair_code in pair_codes.tolist()], dtype=bool)
+
+        return predicate_table[codes]
+
+    def eval_selector_and(self, expr: rasp.SelectorAnd, ctx: BatchedEvaluationContext) -> np.ndarray:
+        return self._evaluate(expr.fst, ctx) & self._evaluate(expr.snd, ctx)
+
+    def eval_selector_or(self, expr: rasp.SelectorOr, ctx: BatchedEvaluationContext) -> np.ndarray:
+        return self._evaluate(expr.fst, ctx) | self._evaluate(expr.snd, ctx)
+
+    def eval_selector_not(self, expr: rasp.SelectorNot, ctx: BatchedEvaluationContext) -> np.ndarray:
+        return ~self._evaluate(expr.inner, ctx)
+
+    def eval_constant_selector(self, expr: rasp.ConstantSelector, ctx: BatchedEvaluationContext) -> np.ndarray:
+        selector = np.array(expr.value, dtype=bool)
+        if selector.shape != (ctx.seq_len, ctx.seq_len):
+            raise NotImplementedError("Batched evaluation requires constant selectors to match the input length.")
+
+        return np.broadcast_to(selector, (ctx.batch_size, ctx.seq_len, ctx.seq_len))
+
+
+def _mean(xs: Sequence[Any], default: Any) -> Any:
+    """Aggregates the selected values the same way Tracr's evaluator does."""
+    if not xs:
+        return default
+    exemplar = xs[0]
+    if isinstance(exemplar, (int, bool)):
+        return sum(xs) / len(xs)
+    elif len(xs) == 1:
+        return exemplar
+    else:
+        raise ValueError(f"Unsupported type for aggregation: {xs}")
+
+
+def unique_codes(codes: np.ndarray, n_codes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as np.unique(codes, return_inverse=True), keeping the shape of the codes in the inverse. Uses a counting
+    pass instead of sorting when the range of codes is small enough."""
+    if n_codes <= 4 * codes.size + 1024:
+        present = np.bincount(codes.reshape(-1), minlength=n_codes) > 0
+        inverse_by_code = np.cumsum(present) - 1
+        return np.flatnonzero(present), inverse_by_code[codes]
+
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, inverse.reshape(codes.shape)
+
+
+def compact_sop_value(codes: np.ndarray, table: List[Any]) -> BatchedSOpValue:
+    """Drops the table entries that are not used and merges duplicated values, so that functions applied on the table
+    are only called on values that actually occur in the batch."""
+    used_codes, codes = unique_codes(codes, len(table))
+
+    compact_table = []
+    compact_code_by_key = {}
+    compact_codes = np.empty(len(used_codes), dtype=np.int64)
+    for i, code in enumerate(used_codes.tolist()):
+        value = table[code]
+
+        # We include the type in the key to avoid merging values such as 1, 1.0 and True, which are equal in Python.
+        key = (type(value), value)
+        try:
+            compact_code = compact_code_by_key.get(key)
+        except TypeError:
+            # unhashable values are never merged
+            key, compact_code = None, None
+
+        if compact_code is None:
+            compact_code = len(compact_table)
+            compact_table.append(value)
+            if key is not None:
+                compact_code_by_key[key] = compact_code
+
+        compact_codes[i] = compact_code
+
+    return BatchedSOpValue(compact_codes[codes], compact_table)
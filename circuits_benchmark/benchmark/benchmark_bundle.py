@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, TYPE_CHECKING
+
+from circuits_benchmark.benchmark.tracr_dataset_cache import load_encoded_dataset, save_encoded_dataset
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset
+from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformer
+from circuits_benchmark.utils.atomic_write import atomic_write
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_granularity import circuit_granularity_options
+from circuits_benchmark.utils.cloudpickle import load_from_pickle, dump_to_pickle
+from circuits_benchmark.utils.project_paths import get_default_bundle_dir
+
+if TYPE_CHECKING:
+    from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+
+# Bump this version whenever the layout or the format of the bundle changes. Bundles of other versions are ignored.
+BENCHMARK_BUNDLE_VERSION = 1
+
+
+def get_bundle_dir(bundle_dir: str | None = None) -> str:
+    return os.path.join(bundle_dir or get_default_bundle_dir(), f"v{BENCHMARK_BUNDLE_VERSION}")
+
+
+def get_case_bundle_dir(case_name: str, bundle_dir: str | None = None) -> str:
+    return os.path.join(get_bundle_dir(bundle_dir), f"case_{case_name}")
+
+
+def get_bundled_dataset_key(params: Dict[str, Any]) -> str:
+    """Returns the name under which the dataset generated with the given parameters (see
+    TracrBenchmarkCase.get_dataset_params) is stored in a bundle."""
+    description = "\n".join(f"{name}: {value!r}" for name, value in sorted(params.items()))
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()[:16]
+
+
+def load_case_bundle_manifest(case: TracrBenchmarkCase) -> Dict[str, Any] | None:
+    """Reads the manifest of the bundle of a case, if there is one and it was built from the same Tracr compilation
+    of the case. The fingerprint of the case is only computed if the bundle exists. Use case.get_bundle_manifest to
+    read it only once per case instance."""
+    path = os.path.join(get_case_bundle_dir(case.get_name()), "manifest.json")
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Unable to load bundle manifest from {path}: {e}")
+        return None
+
+    if manifest["tracr_fingerprint"] != case.get_tracr_fingerprint():
+        print(f"Ignoring the bundle of case {case.get_name()}, since it was built for a different version of the case.")
+        return None
+
+    return manifest
+
+
+def load_bundled_hl_model(case: TracrBenchmarkCase, device) -> HookedTracrTransformer | None:
+    """Loads the HL model of a case from its bundle, if any."""
+    if case.get_bundle_manifest() is None:
+        return None
+
+    # safetensors is only needed for bundles, so it is imported here rather than by every case import
+    from safetensors.torch import load_file
+
+    case_dir = get_case_bundle_dir(case.get_name())
+    try:
+        artifact = load_from_pickle(os.path.join(case_dir, "hl_model.pkl"))
+        artifact["state_dict"] = load_file(os.path.join(case_dir, "hl_model.safetensors"), device=str(device))
+        return HookedTracrTransformer.from_precompiled_artifact(artifact, device=device)
+    except Exception as e:
+        print(f"Unable to load bundled HL model from {case_dir}: {e}")
+        return None
+
+
+def load_bundled_dataset(case: TracrBenchmarkCase, params: Dict[str, Any]) -> TracrEncodedDataset | None:
+    """Loads the encoded dataset generated with the given parameters from the bundle of a case, if it was bundled."""
+    manifest = case.get_bundle_manifest()
+    key = get_bundled_dataset_key(params)
+    if manifest is None or key not in manifest["datasets"]:
+        return None
+
+    dataset_dir = os.path.join(get_case_bundle_dir(case.get_name()), "datasets", key)
+    try:
+        return load_encoded_dataset(dataset_dir)
+    except Exception as e:
+        print(f"Unable to load bundled dataset from {dataset_dir}: {e}")
+        return None
+
+
+def load_bundled_gt_circuit(case: TracrBenchmarkCase, granularity: str) -> Circuit | None:
+    """Loads the ground truth circuit of a case for the given granularity from its bundle, if any."""
+    manifest = case.get_bundle_manifest()
+    if manifest is None or granularity not in manifest["gt_circuits"]:
+        return None
+
+    path = os.path.join(get_case_bundle_dir(case.get_name()), "gt_circuits", f"{granularity}.pkl")
+    try:
+        return load_from_pickle(path)
+    except Exception as e:
+        print(f"Unable to load bundled ground truth circuit from {path}: {e}")
+        return None
+
+
+def build_case_bundle(case: TracrBenchmarkCase,
+                      dataset_args: List[Dict[str, Any]],
+                      bundle_dir: str | None = None) -> str:
+    """Writes the bundle of a case: the weights of the HL model (as safetensors) plus its config, encoders and residual
+    stream labels, the encoded datasets generated by calling get_clean_data with each of the given arguments, and the
+    ground truth circuits for every granularity. The bundle is written to a temporary directory that replaces the
+    previous bundle of the case at the end. Returns the directory of the bundle.
+    Cases only load bundles from the default bundle dir (see get_default_bundle_dir), so other directories are only
+    useful to stage bundles, e.g. to archive them."""
+    from safetensors.torch import save_file
+
+    case_dir = get_case_bundle_dir(case.get_name(), bundle_dir)
+    os.makedirs(os.path.dirname(case_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(case_dir), suffix=".tmp")
+    try:
+        artifact = case.get_hl_model(device="cpu").get_precompiled_artifact()
+        save_file({k: v.contiguous() for k, v in artifact.pop("state_dict").items()},
+                  os.path.join(tmp_dir, "hl_model.safetensors"))
+        dump_to_pickle(os.path.join(tmp_dir, "hl_model.pkl"), artifact)
+
+        datasets = {}
+        for args in dataset_args:
+            assert args.get("seed", 42) is not None, "Only seeded datasets can be bundled"
+            params = case.get_dataset_params(**args)
+            dataset = case.get_clean_data(**args)
+
+            key = get_bundled_dataset_key(params)
+            os.makedirs(os.path.join(tmp_dir, "datasets", key))
+            save_encoded_dataset(os.path.join(tmp_dir, "datasets", key), dataset)
+            datasets[key] = params
+
+        gt_circuits = []
+        os.makedirs(os.path.join(tmp_dir, "gt_circuits"))
+        for granularity in circuit_granularity_options:
+            try:
+                circuit = case.get_hl_gt_circuit(granularity=granularity)
+            except Exception as e:
+                print(f"Unable to build the ground truth circuit of case {case.get_name()} for granularity "
+                      f"{granularity}: {e}")
+                continue
+            dump_to_pickle(os.path.join(tmp_dir, "gt_circuits", f"{granularity}.pkl"), circuit)
+            gt_circuits.append(granularity)
+
+        manifest = {
+            "version": BENCHMARK_BUNDLE_VERSION,
+            "case_name": case.get_name(),
+            "tracr_fingerprint": case.get_tracr_fingerprint(),
+            "datasets": datasets,
+            "gt_circuits": gt_circuits,
+        }
+        with atomic_write(os.path.join(tmp_dir, "manifest.json")) as f:
+            f.write(json.dumps(manifest, indent=2).encode("utf-8"))
+
+        os.chmod(tmp_dir, 0o755)  # mkdtemp creates directories accessible only by the owner
+        shutil.rmtree(case_dir, ignore_errors=True)
+        os.rename(tmp_dir, case_dir)
+        tmp_dir = None
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # the case reads its manifest only once, so make it read the new one
+    case.invalidate_bundle_manifest()
+
+    return case_dir
+
+
+def install_bundle(path: str, bundle_dir: str | None = None) -> List[str]:
+    """Installs the cases of a bundle (a directory, or an archive of one, as written by build_case_bundle) in the
+    bundle dir, replacing the bundles of the same cases. Returns the names of the installed cases."""
+    with tempfile.TemporaryDirectory() as extract_dir:
+        root = path
+        if os.path.isfile(path):
+            shutil.unpack_archive(path, extract_dir)
+            root = extract_dir
+
+        source_dir = os.path.join(root, f"v{BENCHMARK_BUNDLE_VERSION}")
+        if not os.path.isdir(source_dir):
+            raise ValueError(f"{path} does not contain a version {BENCHMARK_BUNDLE_VERSION} benchmark bundle")
+
+        installed_cases = []
+        for case_dir_name in sorted(os.listdir(source_dir)):
+            manifest_path = os.path.join(source_dir, case_dir_name, "manifest.json")
+            if not case_dir_name.startswith("case_") or not os.path.exists(manifest_path):
+                continue
+
+            target_dir = os.path.join(get_bundle_dir(bundle_dir), case_dir_name)
+            if os.path.abspath(target_dir) != os.path.abspath(os.path.join(source_dir, case_dir_name)):
+                shutil.rmtree(target_dir, ignore_errors=True)
+                shutil.copytree(os.path.join(source_dir, case_dir_name), target_dir)
+            installed_cases.append(case_dir_name[len("case_"):])
+
+    return installed_cases
@@ -1,10 +1,12 @@
 import random
 from typing import Set, List
 
+import numpy as np
 from tracr.rasp import rasp
 
 from circuits_benchmark.benchmark.common_programs import make_shuffle_dyck
 from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+from circuits_benchmark.benchmark.tracr_token_ids import sample_seq_lens, frame_token_codes
 from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
 from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformerBatchInput
 
@@ -65,6 +67,46 @@ class Case5(TracrBenchmarkCase):
 
         return input
 
+    def gen_balanced_input_ids(self, rng: np.random.Generator, count, min_seq_len, max_seq_len) -> np.ndarray:
+        """Vectorized version of gen_balanced_input: builds all the sequences at once, one position at a time, choosing
+        uniformly among the characters that still allow closing all the open parentheses/brackets."""
+        sorted_vocab = sorted(self.get_vocab())
+        codes = {char: i for i, char in enumerate(sorted_vocab)}
+        open_codes = [codes['('], codes['{']]
+        close_codes = [codes[')'], codes['}']]
+
+        seq_lens = sample_seq_lens(rng, count, min_seq_len, max_seq_len)
+        token_codes = np.zeros((count, max_seq_len - 1), dtype=np.int64)
+        open_counts = np.zeros((count, len(open_codes)), dtype=np.int64)
+
+        for pos in range(max_seq_len - 1):
+            space_left = seq_lens - 1 - pos
+            open_total = open_counts.sum(axis=1)
+
+            allowed = np.zeros((count, len(sorted_vocab)), dtype=bool)
+            allowed[:, close_codes] = open_counts > 0
+            allowed[:, codes['x']] = open_total + 1 <= space_left
+            allowed[:, open_codes] = (open_total + 2 <= space_left)[:, None]
+
+            # pick the k-th allowed character, with k uniform among the allowed ones
+            k = (rng.random(count) * allowed.sum(axis=1)).astype(np.int64)
+            chars = (allowed.cumsum(axis=1) > k[:, None]).argmax(axis=1)
+            token_codes[:, pos] = chars
+
+            active = space_left > 0
+            for i in range(len(open_codes)):
+                open_counts[:, i] += active & (chars == open_codes[i])
+                open_counts[:, i] -= active & (chars == close_codes[i])
+
+        return frame_token_codes(token_codes, seq_lens, len(sorted_vocab))
+
+    def gen_random_input_ids(self, rng: np.random.Generator, n_samples, min_seq_len, max_seq_len) -> np.ndarray:
+        """Same as sample_data, but vectorized: half of the data has balanced parentheses/brackets and half is random."""
+        balanced_data_count = n_samples // 2
+        balanced_input_ids = self.gen_balanced_input_ids(rng, balanced_data_count, min_seq_len, max_seq_len)
+        random_input_ids = super().gen_random_input_ids(rng, n_samples - balanced_data_count, min_seq_len, max_seq_len)
+        return np.concatenate([balanced_input_ids, random_input_ids])
+
     def sample_data(self, count, min_seq_len, max_seq_len) -> (
     HookedTracrTransformerBatchInput, HookedTracrTransformerBatchInput):
         """Samples random data for this benchmark case, making sure that we get half of the data with balanced parentheses/brakets and half with unbalanced ones."""
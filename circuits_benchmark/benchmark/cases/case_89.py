@@ -1,10 +1,12 @@
 import random
 from typing import Set, List
 
+import numpy as np
 from tracr.rasp import rasp
 
 from circuits_benchmark.benchmark import vocabs
 from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+from circuits_benchmark.benchmark.tracr_token_ids import sample_seq_lens, frame_token_codes
 from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
 from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformerBatchInput
 
@@ -34,6 +36,27 @@ class Case89(TracrBenchmarkCase):
         # Sort the sampled sequence to ensure it is in increasing order
         return list(sorted(random_sequence))
 
+    def gen_true_input_ids(self, rng: np.random.Generator, count, min_seq_len, max_seq_len) -> np.ndarray:
+        """Vectorized version of get_true_input: each sequence is a random subset of the vocab, sorted in increasing
+        order."""
+        n_vals = len(self.get_vocab())
+        seq_lens = sample_seq_lens(rng, count, min_seq_len, max_seq_len)
+
+        # keep the first values of a random permutation of the vocab, and push the positions after the end of each
+        # sequence to the right when sorting
+        token_codes = rng.random((count, n_vals)).argsort(axis=1)[:, :max_seq_len - 1]
+        token_codes[np.arange(max_seq_len - 1)[None, :] >= seq_lens[:, None] - 1] = n_vals
+        token_codes.sort(axis=1)
+
+        return frame_token_codes(token_codes, seq_lens, n_vals)
+
+    def gen_random_input_ids(self, rng: np.random.Generator, n_samples, min_seq_len, max_seq_len) -> np.ndarray:
+        """Same as sample_data, but vectorized: half of the data is sorted in increasing order and half is random."""
+        true_data_count = n_samples // 2
+        true_input_ids = self.gen_true_input_ids(rng, true_data_count, min_seq_len, max_seq_len)
+        random_input_ids = super().gen_random_input_ids(rng, n_samples - true_data_count, min_seq_len, max_seq_len)
+        return np.concatenate([true_input_ids, random_input_ids])
+
     def sample_data(
         self,
         count,
@@ -1,7 +1,11 @@
+from __future__ import annotations
+
+import inspect
 import itertools
+import os
 import random
 from functools import partial
-from typing import Optional, Sequence, Set, Callable
+from typing import Optional, Sequence, Set, Callable, Dict, Tuple, TYPE_CHECKING
 
 import numpy as np
 import torch as t
@@ -10,16 +14,28 @@ from iit.model_pairs.ll_model import LLModel
 from iit.utils.correspondence import Correspondence
 from jaxtyping import Float
 from torch import Tensor
-from tracr.compiler import compiling
-from tracr.compiler.compiling import TracrOutput
 from tracr.rasp import rasp
 from tracr.rasp.rasp import RASPExpr
 from transformer_lens import HookedTransformer
 from transformer_lens.hook_points import HookedRootModule
 
+from circuits_benchmark.benchmark.batched_rasp_evaluator import BatchedRASPEvaluator
+from circuits_benchmark.benchmark.benchmark_bundle import load_bundled_hl_model, load_bundled_dataset, \
+    load_bundled_gt_circuit, load_case_bundle_manifest
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
+from circuits_benchmark.benchmark.tracr_compilation_cache import fingerprint_tracr_compilation, \
+    load_cached_tracr_output, cache_tracr_output, get_precompiled_hl_model_path
+from circuits_benchmark.benchmark import batched_rasp_evaluator, tracr_dataset, tracr_sharded_data, tracr_token_ids
+from circuits_benchmark.benchmark.tracr_corruption import CORRUPTION_STRATEGIES, get_permutation_indices, \
+    get_same_length_indices, resample_positions
 from circuits_benchmark.benchmark.tracr_dataset import TracrDataset
-from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset
+from circuits_benchmark.benchmark.tracr_dataset_cache import fingerprint_dataset, load_cached_encoded_dataset, \
+    cache_encoded_dataset
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset, TracrEncodedDatasetView
+from circuits_benchmark.benchmark.tracr_sharded_data import sample_data_in_shards, gen_all_data_in_shards
+from circuits_benchmark.benchmark.tracr_token_ids import get_framed_vocab, enumerate_token_ids, get_seq_lens, \
+    token_ids_to_values, values_to_token_ids, make_object_array, encode_token_ids, decode_token_ids, sample_token_ids, \
+    SAMPLING_RNG_VERSION
 from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
 from circuits_benchmark.metrics.validation_metrics import l2_metric, kl_metric
 from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformer, \
@@ -31,12 +47,48 @@ from circuits_benchmark.utils.iit import make_ll_cfg_for_case
 from circuits_benchmark.utils.iit.correspondence import TracrCorrespondence
 from circuits_benchmark.utils.iit.tracr_model_pair import TracrModelPair
 
+if TYPE_CHECKING:
+    # The Tracr compiler pulls in JAX and Haiku, so it is only imported when a program actually needs to be compiled
+    # (see get_tracr_output).
+    from tracr.compiler.compiling import TracrOutput
+
+# Per-process cache of HL models, keyed by case name, device and whether the model is pruned. See
+# TracrBenchmarkCase.get_hl_model.
+hl_models_cache: Dict[Tuple[str, str, bool], HookedTracrTransformer] = {}
+
+
+def clear_hl_models_cache():
+    """Removes all the cached HL models."""
+    hl_models_cache.clear()
+
 
 class TracrBenchmarkCase(BenchmarkCase):
 
     def __init__(self):
         super().__init__()
         self.tracr_output: TracrOutput | None = None
+        self.tracr_fingerprint: str | None = None
+
+        # Manifest of the bundle of this case (see get_bundle_manifest), read on first use.
+        self.bundle_manifest: Dict | None = None
+        self.bundle_manifest_loaded = False
+
+        # Cases that define their own ground truth can not be evaluated with the batched RASP evaluator
+        self.batched_rasp_evaluation = \
+            type(self).get_correct_output_for_input is TracrBenchmarkCase.get_correct_output_for_input
+        self.batched_rasp_evaluation_validated = False
+
+        # Whether the compiled HL model matches the RASP program on a validation sample, so that labels can be decoded
+        # from it when requested (see get_clean_data). None until the first time compiled labels are requested.
+        self.compiled_model_labels_validated: bool | None = None
+
+        # Scheme used to draw random data (see tracr_token_ids.SAMPLING_RNG_VERSION). Set it to 1 to reproduce datasets
+        # generated before batched sampling was introduced.
+        self.sampling_rng_version = SAMPLING_RNG_VERSION
+
+        # Number of worker processes used to generate and label data (see tracr_sharded_data). 0 generates the data in
+        # the current process.
+        self.data_workers = 0
 
     def get_program(self) -> rasp.SOp:
         """Returns the RASP program to be compiled by Tracr."""
@@ -69,7 +121,7 @@ class TracrBenchmarkCase(BenchmarkCase):
             ll_model = self.get_ll_model()
 
         if hl_model is None:
-            hl_model = self.get_hl_model()
+            hl_model = self.get_hl_model(copy=True)
 
         if hl_ll_corr is None:
             hl_ll_corr = self.get_correspondence(rand=rand_correspondence)
@@ -120,12 +172,108 @@ class TracrBenchmarkCase(BenchmarkCase):
     def get_hl_model(
         self,
         device: str | t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu"),
-        *args, **kwargs
+        *args,
+        copy: bool = False,
+        pruned: bool = False,
+        **kwargs
     ) -> HookedTracrTransformer:
         """Returns the transformer_lens reference model for this benchmark case.
-        In IIT terminology, this is the HL model."""
-        tracr_output = self.get_tracr_output()
-        return HookedTracrTransformer.from_tracr_model(tracr_output.model, device=device, *args, **kwargs)
+        In IIT terminology, this is the HL model.
+        Models are cached per case and device for the whole process, so callers that modify the returned model (e.g., by
+        registering hooks, changing its parameters or wrapping it in an IITHLModel or a model pair) must pass copy=True
+        to get their own instance.
+        With pruned=True, the dimensions of the residual stream that don't affect the output are removed (see
+        build_pruned_hl_model)."""
+        if args or kwargs:
+            # Extra arguments for the model constructor may produce a different model, so we don't cache it
+            tracr_output = self.get_tracr_output()
+            hl_model = HookedTracrTransformer.from_tracr_model(tracr_output.model, device=device, *args, **kwargs)
+            return self.prune_hl_model(hl_model) if pruned else hl_model
+
+        key = (self.get_name(), str(device), pruned)
+        if key not in hl_models_cache:
+            hl_models_cache[key] = self.build_pruned_hl_model(device) if pruned else self.build_hl_model(device)
+
+        hl_model = hl_models_cache[key]
+        if copy:
+            return HookedTracrTransformer.from_hooked_tracr_transformer(hl_model)
+
+        return hl_model
+
+    def build_hl_model(self, device: str | t.device) -> HookedTracrTransformer:
+        """Builds the HL model from the benchmark bundle (see benchmark_bundle) or the precompiled weights stored on
+        disk, if any. This skips the Tracr compilation and does not import JAX. Otherwise, builds it from the Tracr output
+        and stores the precompiled weights for next time.
+        """
+        hl_model = load_bundled_hl_model(self, device)
+        if hl_model is not None:
+            return hl_model
+
+        path = get_precompiled_hl_model_path(self.get_tracr_fingerprint())
+        if os.path.exists(path):
+            try:
+                return HookedTracrTransformer.from_precompiled(path, device=device)
+            except Exception as e:
+                # A corrupted or incompatible artifact is treated as a cache miss, and will be overwritten.
+                print(f"Unable to load precompiled HL model from {path}: {e}")
+
+        hl_model = HookedTracrTransformer.from_tracr_model(self.get_tracr_output().model, device=device)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            hl_model.save_precompiled(path)
+        except Exception as e:
+            print(f"Unable to store precompiled HL model in {path}: {e}")
+
+        return hl_model
+
+    def build_pruned_hl_model(self, device: str | t.device) -> HookedTracrTransformer:
+        """Builds the HL model without the dimensions of the residual stream that are never read after being written
+        (see HookedTracrTransformer.prune_residual_stream)."""
+        return self.prune_hl_model(self.get_hl_model(device))
+
+    def prune_hl_model(self, hl_model: HookedTracrTransformer) -> HookedTracrTransformer:
+        """Returns the pruned version of an HL model of this case, after checking that it produces the same logits on a
+        random sample of inputs. Returns a copy of the original model if the check fails, so that the result is never the
+        given model itself (e.g., the cached unpruned model, which must not be shared with the pruned cache entry)."""
+        pruned_hl_model, _ = hl_model.prune_residual_stream()
+
+        # Use a separate generator so that the validation does not change the data being generated
+        input_ids = sample_token_ids(np.random.default_rng(0), len(self.get_vocab()), 1000,
+                                     self.get_min_seq_len(), self.get_max_seq_len())
+        encoded_inputs = encode_token_ids(input_ids, self.get_framed_vocab(),
+                                          hl_model.tracr_input_encoder).to(hl_model.device)
+        with t.no_grad():
+            max_diff = (hl_model(encoded_inputs) - pruned_hl_model(encoded_inputs)).abs().max().item()
+
+        if max_diff > 1e-5:
+            print(f"The pruned HL model of case {self.get_name()} does not match the original one (max logit difference "
+                  f"of {max_diff}). Using the original HL model.")
+            return HookedTracrTransformer.from_hooked_tracr_transformer(hl_model)
+
+        print(f"Pruned the residual stream of the HL model of case {self.get_name()} from {hl_model.cfg.d_model} to "
+              f"{pruned_hl_model.cfg.d_model} dimensions.")
+        return pruned_hl_model
+
+    def invalidate_hl_model_cache(self):
+        """Removes the cached HL models of this case (for all devices), so that they are built again on the next call to
+        get_hl_model."""
+        for key in [key for key in hl_models_cache if key[0] == self.get_name()]:
+            del hl_models_cache[key]
+
+    def get_bundle_manifest(self) -> Dict | None:
+        """Returns the manifest of the bundle of this case, if any (see benchmark_bundle). The manifest is read once per
+        case instance."""
+        if not self.bundle_manifest_loaded:
+            self.bundle_manifest = load_case_bundle_manifest(self)
+            self.bundle_manifest_loaded = True
+
+        return self.bundle_manifest
+
+    def invalidate_bundle_manifest(self):
+        """Makes the next call to get_bundle_manifest read the manifest again (e.g., after building the bundle)."""
+        self.bundle_manifest = None
+        self.bundle_manifest_loaded = False
 
     def get_correspondence(self, same_size: bool = False, rand:bool=False, ll_model=None, *args, **kwargs) -> Correspondence:
         """Returns the correspondence between the reference and the benchmark model."""
@@ -136,8 +284,10 @@ class TracrBenchmarkCase(BenchmarkCase):
             return TracrCorrespondence.from_output(self, tracr_output, rand=rand, ll_model=ll_model)
 
     def is_categorical(self) -> bool:
-        """Returns whether the benchmark case is categorical."""
-        return self.get_hl_model().is_categorical()
+        """Returns whether the benchmark case is categorical.
+        Tracr uses a categorical output encoder iff the output of the program is categorical, so we can tell without
+        compiling it."""
+        return rasp.is_categorical(self.get_program())
 
     def get_clean_data(self,
                        min_samples: Optional[int] = 10,
@@ -145,10 +295,19 @@ class TracrBenchmarkCase(BenchmarkCase):
                        seed: Optional[int] = 42,
                        unique_data: Optional[bool] = False,
                        variable_length_seqs: Optional[bool] = False,
-                       encoded_dataset: bool = True) -> TracrDataset | TracrEncodedDataset:
+                       encoded_dataset: bool = True,
+                       compiled_model_labels: bool = False,
+                       use_dataset_cache: bool = True) -> TracrDataset | TracrEncodedDataset:
         """Returns clean data for the benchmark case.
         If the number of unique datapoints is between min_samples and max_samples, returns all possible unique datapoints.
-        Otherwise, returns a random sample of max_samples datapoints."""
+        Otherwise, returns a random sample of max_samples datapoints.
+        If compiled_model_labels is True, the labels are decoded from a forward pass of the HL model instead of running
+        the RASP program, as long as both agree on a validation sample for this case.
+        Encoded datasets generated with a seed are cached on disk (see tracr_dataset_cache), so that later calls with the
+        same arguments map them from disk instead of generating them again. They are also served from the benchmark
+        bundle, if it contains them (see benchmark_bundle).
+        With variable_length_seqs, sequences are padded to the max length. Encoded datasets of causal HL models can then
+        be loaded in batches trimmed to their longest sequence (see TracrEncodedDataset.make_loader)."""
         max_seq_len = self.get_max_seq_len()
 
         if variable_length_seqs:
@@ -165,52 +324,106 @@ class TracrBenchmarkCase(BenchmarkCase):
             np.random.seed(seed)
             random.seed(seed)
 
-        input_data = None
+        dataset_fingerprint = None
+        if encoded_dataset and use_dataset_cache and seed is not None:
+            dataset_params = self.get_dataset_params(min_samples=min_samples,
+                                                     max_samples=max_samples,
+                                                     seed=seed,
+                                                     unique_data=unique_data,
+                                                     variable_length_seqs=variable_length_seqs,
+                                                     compiled_model_labels=compiled_model_labels)
+            dataset = load_bundled_dataset(self, dataset_params)
+            if dataset is not None:
+                return dataset
+
+            dataset_fingerprint = self.get_dataset_fingerprint(**dataset_params)
+            dataset = load_cached_encoded_dataset(dataset_fingerprint)
+            if dataset is not None:
+                return dataset
+
+        framed_vocab = self.get_framed_vocab()
+
+        # random data is drawn from its own generator, unless the legacy sampling scheme is used
+        rng = np.random.default_rng(seed)
+
+        input_ids = None
         output_data = None
         if min_samples is not None and max_samples is not None and min_samples < self.get_total_data_len() < max_samples:
             # the unique data is between min_samples and max_samples, produce all possible sequences for this vocab
-            input_data, output_data = self.gen_all_data(min_seq_len, max_seq_len)
+            input_ids, output_data = self.gen_all_data(min_seq_len, max_seq_len, compiled_model_labels)
         elif min_samples is None and max_samples is None:
             # we didn't get max_samples nor min_samples, produce all possible sequences for this vocab
-            input_data, output_data = self.gen_all_data(min_seq_len, max_seq_len)
+            input_ids, output_data = self.gen_all_data(min_seq_len, max_seq_len, compiled_model_labels)
         elif min_samples is not None and max_samples is None:
             if self.get_total_data_len() < min_samples:
                 # we have fewer data than the min_samples, produce at least min_samples, with repeating sequences
-                input_data, output_data = self.sample_data(min_samples, min_seq_len, max_seq_len)
+                input_ids, output_data = self.sample_data_as_token_ids(rng, min_samples, min_seq_len, max_seq_len,
+                                                                         compiled_model_labels)
             else:
-                input_data, output_data = self.gen_all_data(min_seq_len, max_seq_len)
+                input_ids, output_data = self.gen_all_data(min_seq_len, max_seq_len, compiled_model_labels)
         elif max_samples is not None:
             # produce at most max_samples
-            input_data, output_data = self.sample_data(max_samples, min_seq_len, max_seq_len)
+            input_ids, output_data = self.sample_data_as_token_ids(rng, max_samples, min_seq_len, max_seq_len,
+                                                                     compiled_model_labels)
 
         assert len(set([tuple(o) for o in output_data])) > 1, "All outputs are the same for this case"
 
-        unique_inputs = set()
         if unique_data:
-            # remove duplicates from input_data
-            unique_input_data = []
-            unique_output_data = []
-            for i in range(len(input_data)):
-                input = input_data[i]
-                if str(input) not in unique_inputs:
-                    unique_inputs.add(tuple(input))
-                    unique_input_data.append(input)
-                    unique_output_data.append(output_data[i])
-            input_data = unique_input_data
-            output_data = unique_output_data
+            # remove duplicates from input_data, keeping the first occurrence of each input in its original order
+            _, unique_indices = np.unique(input_ids, axis=0, return_index=True)
+            unique_indices.sort()
+            input_ids = input_ids[unique_indices]
+            output_data = output_data[unique_indices]
 
         # shuffle input_data and output_data maintaining the correspondence between input and output
-        indices = np.arange(len(input_data))
+        indices = np.arange(len(input_ids))
         np.random.shuffle(indices)
-        input_data: HookedTracrTransformerBatchInput = [input_data[i] for i in indices]
-        output_data = [output_data[i] for i in indices]
+        input_ids = input_ids[indices]
+        output_data = output_data[indices]
 
-        tracr_dataset = TracrDataset(input_data, output_data, self.get_hl_model())
+        dataset = TracrDataset.from_token_ids(input_ids, output_data, framed_vocab, self.get_hl_model())
 
         if encoded_dataset:
-            return tracr_dataset.get_encoded_dataset()
+            tracr_encoded_dataset = dataset.get_encoded_dataset()
+            if dataset_fingerprint is not None:
+                cache_encoded_dataset(dataset_fingerprint, tracr_encoded_dataset)
+            return tracr_encoded_dataset
         else:
-            return tracr_dataset
+            return dataset
+
+    def get_dataset_params(self,
+                           min_samples: Optional[int] = 10,
+                           max_samples: Optional[int] = 10,
+                           seed: Optional[int] = 42,
+                           unique_data: Optional[bool] = False,
+                           variable_length_seqs: Optional[bool] = False,
+                           compiled_model_labels: bool = False) -> Dict:
+        """Returns the parameters that determine the encoded dataset generated by get_clean_data with the given
+        arguments, including the settings of this case that affect the generation."""
+        return dict(min_samples=min_samples,
+                    max_samples=max_samples,
+                    seed=seed,
+                    unique_data=unique_data,
+                    variable_length_seqs=variable_length_seqs,
+                    compiled_model_labels=compiled_model_labels,
+                    sampling_rng_version=self.sampling_rng_version,
+                    sharded=self.uses_data_workers(compiled_model_labels))
+
+    def get_dataset_fingerprint(self, **params) -> str:
+        """Returns the fingerprint of the dataset generated by get_clean_data with the given arguments (see
+        tracr_dataset_cache)."""
+        source_files = [inspect.getfile(type(self))] + \
+                       [inspect.getfile(module) for module in [inspect.getmodule(TracrBenchmarkCase),
+                                                               batched_rasp_evaluator,
+                                                               tracr_dataset,
+                                                               tracr_sharded_data,
+                                                               tracr_token_ids]]
+        return fingerprint_dataset(self.get_tracr_fingerprint(), source_files, params)
+
+    def get_framed_vocab(self) -> np.ndarray:
+        """Returns the sorted vocab framed by BOS and PAD. Positions in this array are the token ids used to represent
+        sequences during data generation."""
+        return get_framed_vocab(self.get_vocab())
 
     def get_total_data_len(self):
         """Returns the total number of possible sequences for the vocab and sequence lengths."""
@@ -228,26 +441,108 @@ class TracrBenchmarkCase(BenchmarkCase):
                            min_samples: Optional[int] = 10,
                            max_samples: Optional[int] = 10,
                            seed: Optional[int] = 43,
-                           unique_data: Optional[bool] = False) -> TracrDataset | TracrEncodedDataset:
+                           unique_data: Optional[bool] = False,
+                           compiled_model_labels: bool = False,
+                           use_dataset_cache: bool = True,
+                           corruption: str = "resample",
+                           clean_data: TracrEncodedDataset | None = None) -> TracrDataset | TracrEncodedDataset:
         """Returns the corrupted data for the benchmark case.
-        Default implementation: re-generate clean data with a different seed."""
-        return self.get_clean_data(min_samples=min_samples, max_samples=max_samples, seed=seed, unique_data=unique_data)
-
-    def sample_data(self, n_samples: int, min_seq_len: int, max_seq_len: int):
-        """Samples random data for the benchmark case."""
+        Default implementation ("resample" corruption): re-generate clean data with a different seed.
+        The other corruption strategies (see tracr_corruption) derive the corrupted data from a pool of clean data
+        instead, using the seed to draw the pairing: clean_data if given (e.g., the clean data already used by the
+        caller), or otherwise the clean data generated with the same arguments and the default seed. The "permutation"
+        and "same_length" strategies return a view over the pool, so no data is generated, labeled or copied."""
+        if corruption not in CORRUPTION_STRATEGIES:
+            raise ValueError(f"Unknown corruption strategy {corruption}, expected one of {CORRUPTION_STRATEGIES}")
+
+        if corruption == "resample":
+            return self.get_clean_data(min_samples=min_samples, max_samples=max_samples, seed=seed,
+                                       unique_data=unique_data, compiled_model_labels=compiled_model_labels,
+                                       use_dataset_cache=use_dataset_cache)
+
+        if clean_data is None:
+            clean_data = self.get_clean_data(min_samples=min_samples, max_samples=max_samples,
+                                             unique_data=unique_data, compiled_model_labels=compiled_model_labels,
+                                             use_dataset_cache=use_dataset_cache)
+
+        rng = np.random.default_rng(seed)
+        seq_lens = clean_data.get_seq_lens().numpy()
+        if corruption == "permutation":
+            indices = get_permutation_indices(rng, len(clean_data))
+        elif corruption == "same_length":
+            indices = get_same_length_indices(rng, seq_lens)
+        else:
+            # the corrupted inputs are new sequences, so they are labeled and encoded the same way as clean data
+            framed_vocab = self.get_framed_vocab()
+            hl_model = self.get_hl_model()
+            clean_input_ids = decode_token_ids(clean_data.get_inputs(), framed_vocab, hl_model.tracr_input_encoder)
+            input_ids = resample_positions(rng, clean_input_ids, seq_lens)
+            output_data = self.get_correct_outputs(input_ids, compiled_model_labels)
+            return TracrDataset.from_token_ids(input_ids, output_data, framed_vocab, hl_model).get_encoded_dataset()
+
+        return TracrEncodedDatasetView(clean_data, t.from_numpy(indices))
+
+    def sample_data_as_token_ids(self,
+                                 rng: np.random.Generator,
+                                 n_samples: int,
+                                 min_seq_len: int,
+                                 max_seq_len: int,
+                                 compiled_model_labels: bool = False) -> (np.ndarray, np.ndarray):
+        """Samples random data for the benchmark case. Inputs are returned as token ids over the framed vocab, and outputs
+        as an object array of values framed by BOS and PAD.
+        With the current sampling scheme, inputs are drawn all at once from rng by gen_random_input_ids. Cases that
+        customize sample_data but not gen_random_input_ids, and the legacy sampling scheme (version 1), sample one
+        sequence at a time using sample_data and the global random number generators instead.
+        If data_workers is set, the data is sampled and labeled in shards by worker processes (see tracr_sharded_data).
+        See get_correct_outputs for compiled_model_labels.
+        """
+        if self.sampling_rng_version not in [1, SAMPLING_RNG_VERSION]:
+            raise ValueError(f"Unknown sampling RNG version {self.sampling_rng_version}")
+
+        if self.uses_data_workers(compiled_model_labels):
+            return sample_data_in_shards(self, rng, n_samples, min_seq_len, max_seq_len, self.data_workers)
+
+        has_batched_sampler = type(self).sample_data is TracrBenchmarkCase.sample_data or \
+            type(self).gen_random_input_ids is not TracrBenchmarkCase.gen_random_input_ids
+        if self.sampling_rng_version == 1 or not has_batched_sampler:
+            if type(self).sample_data is TracrBenchmarkCase.sample_data:
+                input_data, output_data = self.sample_data(n_samples, min_seq_len, max_seq_len,
+                                                           compiled_model_labels=compiled_model_labels)
+            else:
+                # custom samplers label their data themselves (e.g., with get_correct_output_for_input)
+                input_data, output_data = self.sample_data(n_samples, min_seq_len, max_seq_len)
+            return values_to_token_ids(input_data, self.get_framed_vocab()), make_object_array(output_data)
+
+        input_ids = self.gen_random_input_ids(rng, n_samples, min_seq_len, max_seq_len)
+        return input_ids, self.get_correct_outputs(input_ids, compiled_model_labels)
+
+    def gen_random_input_ids(self,
+                             rng: np.random.Generator,
+                             n_samples: int,
+                             min_seq_len: int,
+                             max_seq_len: int) -> np.ndarray:
+        """Draws a batch of random inputs as token ids over the framed vocab, with lengths between min_seq_len and
+        max_seq_len (both including BOS), padded with PAD up to max_seq_len.
+        Cases that need constrained inputs (e.g., balanced parentheses) can override this method with a vectorized
+        generator (see tracr_token_ids.frame_token_codes)."""
+        return sample_token_ids(rng, len(self.get_vocab()), n_samples, min_seq_len, max_seq_len)
+
+    def sample_data(self, n_samples: int, min_seq_len: int, max_seq_len: int, compiled_model_labels: bool = False):
+        """Samples random data for the benchmark case, one sequence at a time (legacy sampling scheme)."""
         vals = sorted(list(self.get_vocab()))
 
         input_data: HookedTracrTransformerBatchInput = []
-        output_data: HookedTracrTransformerBatchInput = []
-
         for _ in range(n_samples):
-            input, output = self.gen_random_input_output(vals, min_seq_len, max_seq_len)
-            input_data.append(input)
-            output_data.append(output)
+            input_data.append(self.gen_random_input(vals, min_seq_len, max_seq_len))
+
+        # compute the outputs for all the samples at once
+        input_ids = values_to_token_ids(input_data, self.get_framed_vocab())
+        output_data: HookedTracrTransformerBatchInput = self.get_correct_outputs(input_ids,
+                                                                                 compiled_model_labels).tolist()
 
         return input_data, output_data
 
-    def gen_random_input_output(self, vals, min_seq_len, max_seq_len) -> (Sequence, Sequence):
+    def gen_random_input(self, vals, min_seq_len, max_seq_len) -> Sequence:
         seq_len = random.randint(min_seq_len, max_seq_len)
 
         # figure out padding
@@ -255,49 +550,165 @@ class TracrBenchmarkCase(BenchmarkCase):
         pad = [TRACR_PAD] * pad_len
 
         sample = np.random.choice(vals, size=seq_len - 1).tolist()  # sample with replacement
-        output = self.get_correct_output_for_input(sample)
 
-        input = [TRACR_BOS] + sample + pad
-        output = [TRACR_BOS] + output + pad
+        return [TRACR_BOS] + sample + pad
 
-        return input, output
-
-    def gen_all_data(self, min_seq_len, max_seq_len) -> (
-        HookedTracrTransformerBatchInput, HookedTracrTransformerBatchInput):
-        """Generates all possible sequences for the vocab on this case."""
-        vals = sorted(list(self.get_vocab()))
+    def gen_random_input_output(self, vals, min_seq_len, max_seq_len) -> (Sequence, Sequence):
+        input = self.gen_random_input(vals, min_seq_len, max_seq_len)
 
-        input_data: HookedTracrTransformerBatchInput = []
-        output_data: HookedTracrTransformerBatchInput = []
+        seq_len = len(input) - input.count(TRACR_PAD)
+        output = self.get_correct_output_for_input(input[1:seq_len])
+        output = [TRACR_BOS] + output + input[seq_len:]
 
-        for seq_len in range(min_seq_len, max_seq_len + 1):
-            pad_len = max_seq_len - seq_len
-            pad = [TRACR_PAD] * pad_len
+        return input, output
 
-            count = len(vals) ** (seq_len - 1)
-            for index in range(count):
-                # we want to produce all possible sequences for these lengths, so we convert the index to base len(vals) and
-                # then convert each digit to the corresponding value in vals
-                sample = []
-                base = len(vals)
-                num = index
-                while num:
-                    sample.append(vals[num % base])
-                    num //= base
+    def gen_all_data(self, min_seq_len, max_seq_len, compiled_model_labels: bool = False) -> (np.ndarray, np.ndarray):
+        """Generates all possible sequences for the vocab on this case.
+        Inputs are returned as token ids over the framed vocab (see get_framed_vocab), and outputs as an object array of
+        values framed by BOS and PAD. If data_workers is set, the sequences are labeled by worker processes. See
+        get_correct_outputs for compiled_model_labels."""
+        if self.uses_data_workers(compiled_model_labels):
+            return gen_all_data_in_shards(self, min_seq_len, max_seq_len, self.data_workers)
+
+        input_ids = enumerate_token_ids(len(self.get_vocab()), min_seq_len, max_seq_len)
+        output_data = self.get_correct_outputs(input_ids, compiled_model_labels)
+        return input_ids, output_data
+
+    def uses_data_workers(self, compiled_model_labels: bool = False) -> bool:
+        """Returns whether data is generated in worker processes. Labels decoded from the compiled model are cheap to
+        compute, so they are always computed in the current process."""
+        return self.data_workers > 0 and not compiled_model_labels
+
+    def get_correct_outputs(self, input_ids: np.ndarray, compiled_model_labels: bool = False) -> np.ndarray:
+        """Returns the correct outputs, framed by BOS and PAD, for a batch of inputs expressed as token ids.
+        The outputs are decoded from the compiled model if compiled_model_labels is True and the compiled model passed
+        validation for this case, otherwise they are computed by evaluating the RASP program."""
+        if compiled_model_labels:
+            if self.compiled_model_labels_validated is None:
+                self.compiled_model_labels_validated = self.validate_compiled_model_labels()
+
+            if self.compiled_model_labels_validated:
+                return self.get_compiled_model_outputs(input_ids)
+
+        return self.get_rasp_outputs(input_ids)
+
+    def get_rasp_outputs(self, input_ids: np.ndarray) -> np.ndarray:
+        """Returns the outputs of the RASP program for a batch of inputs expressed as token ids.
+        By default, the RASP program is evaluated on the whole batch at once. The first batched evaluation is checked
+        against the per-sample evaluation, and we fall back to the latter if they disagree or if the program can not be
+        evaluated in batch."""
+        if self.batched_rasp_evaluation:
+            try:
+                output_data = self.get_correct_outputs_in_batch(input_ids)
+                if self.batched_rasp_evaluation_validated or self.validate_batched_rasp_evaluation(input_ids,
+                                                                                                   output_data):
+                    return output_data
+            except Exception as e:
+                print(f"Batched RASP evaluation failed for case {self.get_name()}: {e}")
+
+            print(f"Falling back to per-sample RASP evaluation for case {self.get_name()}.")
+            self.batched_rasp_evaluation = False
+
+        return self.get_correct_outputs_per_sample(input_ids)
+
+    def get_correct_outputs_in_batch(self, input_ids: np.ndarray, batch_size: int = 2 ** 16) -> np.ndarray:
+        """Returns the correct outputs for a batch of inputs expressed as token ids, evaluating the RASP program on
+        groups of sequences with the same length at once."""
+        framed_vocab = self.get_framed_vocab()
+        vals = framed_vocab[1:-1].tolist()
+        seq_lens = get_seq_lens(input_ids, framed_vocab)
 
-                if len(sample) < seq_len - 1:
-                    # extend with the first value in vocab to fill the sequence
-                    sample.extend([vals[0]] * (seq_len - 1 - len(sample)))
+        program = self.get_program()
+        evaluator = BatchedRASPEvaluator()
+
+        output_data = np.full(input_ids.shape, TRACR_PAD, dtype=object)
+        output_data[:, 0] = TRACR_BOS
+        for seq_len in np.unique(seq_lens).tolist():
+            rows = np.flatnonzero(seq_lens == seq_len)
+            for start in range(0, len(rows), batch_size):
+                batch_rows = rows[start:start + batch_size]
+                token_codes = input_ids[batch_rows, 1:seq_len] - 1
+                output_data[batch_rows, 1:seq_len] = evaluator.evaluate(program, token_codes, vals)
+
+        return output_data
+
+    def get_correct_outputs_per_sample(self, input_ids: np.ndarray) -> np.ndarray:
+        """Returns the correct outputs for a batch of inputs expressed as token ids, using get_correct_output_for_input
+        on each sequence."""
+        framed_vocab = self.get_framed_vocab()
+        seq_lens = get_seq_lens(input_ids, framed_vocab)
+
+        output_data = np.full(input_ids.shape, TRACR_PAD, dtype=object)
+        output_data[:, 0] = TRACR_BOS
+        for i in range(len(input_ids)):
+            sample = token_ids_to_values(input_ids[i, 1:seq_lens[i]], framed_vocab).tolist()
+            output = self.get_correct_output_for_input(sample)
+            for j, value in enumerate(output):
+                output_data[i, j + 1] = value
+
+        return output_data
+
+    def validate_batched_rasp_evaluation(self,
+                                         input_ids: np.ndarray,
+                                         output_data: np.ndarray,
+                                         n_samples: int = 100) -> bool:
+        """Checks that the outputs of the batched RASP evaluation are equal to the ones of the per-sample evaluation, on
+        an evenly spaced sample of the inputs. This is done only once per case."""
+        sample_indices = np.unique(np.linspace(0, len(input_ids) - 1, num=min(n_samples, len(input_ids)), dtype=int))
+        expected_output_data = self.get_correct_outputs_per_sample(input_ids[sample_indices])
+
+        if not (output_data[sample_indices] == expected_output_data).all():
+            print(f"Batched RASP evaluation does not match the per-sample evaluation for case {self.get_name()}.")
+            return False
+
+        self.batched_rasp_evaluation_validated = True
+        return True
 
-                # reverse the list to produce the sequence in the correct order
-                sample = sample[::-1]
+    def get_compiled_model_outputs(self, input_ids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        """Returns the outputs of the compiled HL model, decoded and framed by BOS and PAD, for a batch of inputs
+        expressed as token ids. Positions where the RASP program would output None get whatever the model decodes."""
+        framed_vocab = self.get_framed_vocab()
+        seq_lens = get_seq_lens(input_ids, framed_vocab)
+        hl_model = self.get_hl_model()
 
-                output = self.get_correct_output_for_input(sample)
+        decoded_outputs = []
+        for start in range(0, len(input_ids), batch_size):
+            encoded_inputs = encode_token_ids(input_ids[start:start + batch_size], framed_vocab,
+                                              hl_model.tracr_input_encoder).to(hl_model.device)
+            with t.no_grad():
+                logits = hl_model(encoded_inputs)
+            decoded_outputs.extend(hl_model.map_tl_output_to_tracr_output(logits))
+
+        output_data = make_object_array(decoded_outputs)
+        output_data[:, 0] = TRACR_BOS
+        output_data[np.arange(input_ids.shape[1])[None, :] >= seq_lens[:, None]] = TRACR_PAD
+
+        return output_data
+
+    def validate_compiled_model_labels(self, n_samples: int = 1000, atol: float = 1.e-2) -> bool:
+        """Checks that the outputs of the compiled HL model match the RASP outputs on a random sample of inputs. Positions
+        where the RASP program outputs None are not checked, and numerical outputs are compared up to atol."""
+        # Use a separate generator so that the validation does not change the data being generated
+        input_ids = sample_token_ids(np.random.default_rng(0), len(self.get_vocab()), n_samples,
+                                     self.get_min_seq_len(), self.get_max_seq_len())
+        expected_outputs = self.get_rasp_outputs(input_ids)
+        compiled_outputs = self.get_compiled_model_outputs(input_ids)
+
+        valid_positions = np.array([[x not in [TRACR_BOS, TRACR_PAD, None] for x in row] for row in expected_outputs],
+                                   dtype=bool)
+        if self.is_categorical():
+            matches = (expected_outputs[valid_positions] == compiled_outputs[valid_positions]).astype(bool)
+        else:
+            matches = np.isclose(expected_outputs[valid_positions].astype(float),
+                                 compiled_outputs[valid_positions].astype(float), atol=atol)
 
-                input_data.append([TRACR_BOS] + sample + pad)
-                output_data.append([TRACR_BOS] + output + pad)
+        if not matches.all():
+            print(f"Compiled model outputs do not match the RASP outputs for case {self.get_name()} "
+                  f"({(~matches).sum()} mismatches out of {len(matches)} positions). Labels will be computed using the "
+                  f"RASP program.")
+            return False
 
-        return input_data, output_data
+        return True
 
     def get_correct_output_for_input(self, input: Sequence) -> Sequence:
         """Returns the correct output for the given input.
@@ -342,38 +753,67 @@ class TracrBenchmarkCase(BenchmarkCase):
     def get_relative_path_from_root(self) -> str:
         return f"circuits_benchmark/benchmark/cases/case_{self.get_name()}.py"
 
-    def get_tracr_output(self) -> TracrOutput:
-        """Compiles a single case to a tracr model."""
+    def get_tracr_output(self, use_cache: bool = True) -> TracrOutput:
+        """Compiles a single case to a tracr model.
+        Compilation results are cached on disk (see tracr_compilation_cache), keyed by a fingerprint of the program and
+        the compilation arguments, so that new processes can skip the compilation."""
         if self.tracr_output is not None:
             return self.tracr_output
 
-        # Reset the RASPExpr ids to ensure reproducibility of Tracr labels
+        # Imported here rather than at the top of the module so that loading precompiled HL models does not pay for
+        # importing JAX and Haiku. This also sets up the JAX matmul precision used by Tracr models.
+        from circuits_benchmark.benchmark import tracr_compiler
+
+        if use_cache:
+            tracr_output = load_cached_tracr_output(self.get_tracr_fingerprint())
+            if tracr_output is not None:
+                self.tracr_output = tracr_output
+                return tracr_output
+
+        # Reset the RASPExpr ids to ensure reproducibility of Tracr labels. The program is built again after computing
+        # the fingerprint, since Tracr assigns default labels lazily and the fingerprint visits the program in a
+        # different order than the compiler.
         RASPExpr._ids = itertools.count(1)
 
-        program = self.get_program()
-        max_seq_len_without_BOS = self.get_max_seq_len() - 1
-        vocab = self.get_vocab()
-
-        # Tracr assumes that max_seq_len in the following call means the maximum sequence length without BOS
-        tracr_output = compiling.compile_rasp_to_model(
-            program,
-            vocab=vocab,
-            max_seq_len=max_seq_len_without_BOS,
-            compiler_bos=TRACR_BOS,
-            compiler_pad=TRACR_PAD,
+        tracr_output = tracr_compiler.compile_program(
+            self.get_program(),
+            vocab=self.get_vocab(),
+            max_seq_len_without_BOS=self.get_max_seq_len() - 1,
             causal=self.supports_causal_masking(),
         )
         self.tracr_output = tracr_output
 
+        if use_cache:
+            cache_tracr_output(self.get_tracr_fingerprint(), tracr_output)
+
         return tracr_output
 
+    def get_tracr_fingerprint(self) -> str:
+        """Returns the fingerprint that identifies the Tracr compilation of this case (see tracr_compilation_cache)."""
+        if self.tracr_fingerprint is None:
+            RASPExpr._ids = itertools.count(1)
+            self.tracr_fingerprint = fingerprint_tracr_compilation(self.get_program(),
+                                                                   self.get_vocab(),
+                                                                   self.get_max_seq_len() - 1,
+                                                                   self.supports_causal_masking(),
+                                                                   TRACR_BOS,
+                                                                   TRACR_PAD)
+
+        return self.tracr_fingerprint
+
     def get_ll_gt_circuit(self, granularity: CircuitGranularity = "acdc_hooks", *args, **kwargs) -> Circuit:
         """Returns the ground truth circuit for the LL model."""
         # This is the identity for now
         return self.get_hl_gt_circuit(granularity=granularity, *args, **kwargs)
 
     def get_hl_gt_circuit(self, granularity: CircuitGranularity = "acdc_hooks", *args, **kwargs) -> Circuit:
-        """Returns the ground truth circuit for the HL model. I.e., the Tracr-generated model."""
+        """Returns the ground truth circuit for the HL model. I.e., the Tracr-generated model.
+        The circuit is served from the benchmark bundle, if it contains it (see benchmark_bundle)."""
+        if not args and not kwargs:
+            circuit = load_bundled_gt_circuit(self, granularity)
+            if circuit is not None:
+                return circuit
+
         tacr_output = self.get_tracr_output()
         tracr_circuits = build_tracr_circuits(tacr_output.graph, tacr_output.craft_model, granularity=granularity)
         return tracr_circuits.tracr_transformer_circuit
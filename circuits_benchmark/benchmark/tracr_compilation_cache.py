@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import enum
+import hashlib
+import os
+import types
+from collections.abc import Mapping
+from typing import Any, Dict, List, Set, TYPE_CHECKING
+
+from tracr.rasp.rasp import RASPExpr
+
+from circuits_benchmark.utils.cloudpickle import load_from_pickle, dump_to_pickle
+from circuits_benchmark.utils.project_paths import get_default_cache_dir
+
+if TYPE_CHECKING:
+    # Only needed for type hints, importing the Tracr compiler pulls in JAX and Haiku.
+    from tracr.compiler.compiling import TracrOutput
+
+# Bump this version whenever the format of the cached artifacts or the fingerprint changes.
+TRACR_COMPILATION_CACHE_VERSION = 2
+
+
+def get_tracr_compilation_cache_dir() -> str:
+    return os.path.join(get_default_cache_dir(), "tracr")
+
+
+def get_precompiled_hl_model_path(fingerprint: str) -> str:
+    """Returns the path of the precompiled HL model (see HookedTracrTransformer.save_precompiled) for the given
+    fingerprint."""
+    return os.path.join(get_default_cache_dir(), "hl_models", f"{fingerprint}.pt")
+
+
+def fingerprint_tracr_compilation(program: RASPExpr,
+                                  vocab: Set,
+                                  max_seq_len: int,
+                                  causal: bool,
+                                  compiler_bos: str,
+                                  compiler_pad: str) -> str:
+    """Returns a hash that identifies the result of compiling a RASP program with Tracr. It covers the structure of the
+    program (including the code of the functions used by Map, SequenceMap and Select, and the values they close over),
+    the vocab, the max_seq_len, the causal flag and the BOS/PAD tokens."""
+    lines = [
+        f"version: {TRACR_COMPILATION_CACHE_VERSION}",
+        f"vocab: {sorted([repr(v) for v in vocab])}",
+        f"max_seq_len: {max_seq_len}",
+        f"causal: {causal}",
+        f"compiler_bos: {compiler_bos!r}",
+        f"compiler_pad: {compiler_pad!r}",
+    ]
+    lines.extend(ProgramFingerprinter().fingerprint(program))
+
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+class ProgramFingerprinter:
+    """Builds a canonical description of a RASP program, one line per expression. Expressions are referred to by their
+    position in a depth-first traversal, so the description does not depend on object ids."""
+
+    def __init__(self):
+        self.expr_refs: Dict[int, str] = {}
+        self.lines: List[str] = []
+        self.visited_code: Set[int] = set()
+
+    def fingerprint(self, program: RASPExpr) -> List[str]:
+        self.visit_expr(program)
+        return self.lines
+
+    def visit_expr(self, expr: RASPExpr) -> str:
+        if id(expr) in self.expr_refs:
+            return self.expr_refs[id(expr)]
+
+        children_refs = [self.visit_expr(child) for child in expr.children]
+        attributes = [f"{name}={self.describe(value)}" for name, value in sorted(vars(expr).items())
+                      if not isinstance(value, RASPExpr) and name not in ["_id", "_unique_id"]]
+
+        ref = f"#{len(self.lines)}"
+        self.expr_refs[id(expr)] = ref
+        self.lines.append(f"{ref} {type(expr).__qualname__} {expr.label!r} children={children_refs} "
+                          f"{' '.join(attributes)}")
+
+        return ref
+
+    def describe(self, value: Any) -> str:
+        if isinstance(value, RASPExpr):
+            return self.visit_expr(value)
+        if isinstance(value, enum.Enum):
+            return repr(value)
+        if isinstance(value, (types.FunctionType, types.MethodType)):
+            return self.describe_function(value)
+        if isinstance(value, types.CodeType):
+            return self.describe_code(value)
+        if isinstance(value, (types.ModuleType, type)):
+            return f"<{value.__qualname__ if isinstance(value, type) else value.__name__}>"
+        if isinstance(value, Mapping):
+            return "{" + ", ".join(sorted(f"{self.describe(k)}: {self.describe(v)}" for k, v in value.items())) + "}"
+        if isinstance(value, (set, frozenset)):
+            return "{" + ", ".join(sorted(self.describe(v) for v in value)) + "}"
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}(" + ", ".join(self.describe(v) for v in value) + ")"
+
+        # Anything else is described by its repr. If the repr is not deterministic (e.g., includes a memory address),
+        # the fingerprint will just not match across processes.
+        return repr(value)
+
+    def describe_function(self, f: types.FunctionType | types.MethodType) -> str:
+        if isinstance(f, types.MethodType):
+            return f"method({self.describe(f.__self__)}, {self.describe_function(f.__func__)})"
+
+        code = f.__code__
+        if id(code) in self.visited_code:
+            # recursive references
+            return f"<function {f.__qualname__}>"
+        self.visited_code.add(id(code))
+
+        closure = [cell.cell_contents for cell in f.__closure__ or []]
+
+        # We only follow the globals referenced by functions in this project (e.g., helpers used by a Map), since
+        # following them in other libraries would end up describing large parts of those libraries.
+        referenced_globals = {}
+        if (f.__module__ or "").startswith("circuits_benchmark"):
+            referenced_globals = {name: f.__globals__[name] for name in code.co_names if name in f.__globals__}
+
+        return (f"function({f.__module__}.{f.__qualname__}, {self.describe_code(code)}, "
+                f"defaults={self.describe(f.__defaults__)}, "
+                f"closure={self.describe(closure)}, "
+                f"globals={self.describe(referenced_globals)})")
+
+    def describe_code(self, code: types.CodeType) -> str:
+        consts = [self.describe(c) for c in code.co_consts]
+        return f"code({code.co_code.hex()}, consts={consts}, names={code.co_names})"
+
+
+def load_cached_tracr_output(fingerprint: str) -> TracrOutput | None:
+    """Loads the Tracr output cached for the given fingerprint, if any."""
+    path = os.path.join(get_tracr_compilation_cache_dir(), f"{fingerprint}.pkl")
+    try:
+        return load_from_pickle(path)
+    except Exception as e:
+        # A corrupted or incompatible artifact is treated as a cache miss, and will be overwritten.
+        print(f"Unable to load cached Tracr output from {path}: {e}")
+        return None
+
+
+def cache_tracr_output(fingerprint: str, tracr_output: TracrOutput) -> None:
+    """Stores the Tracr output (assembled model with its params, config, residual labels and encoders, plus the craft
+    graph and model) for the given fingerprint. Writes are atomic, so concurrent jobs can share the cache directory."""
+    cache_dir = get_tracr_compilation_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        dump_to_pickle(os.path.join(cache_dir, f"{fingerprint}.pkl"), tracr_output)
+    except Exception as e:
+        print(f"Unable to cache Tracr output in {cache_dir}: {e}")
@@ -0,0 +1,28 @@
+from typing import Set
+
+import jax
+from tracr.compiler import compiling
+from tracr.compiler.compiling import TracrOutput
+from tracr.rasp import rasp
+
+from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
+
+# This module is only imported when a RASP program needs to be compiled (or a compiled Tracr model loaded), since
+# importing JAX and Haiku is slow. Precompiled HL models are loaded without it.
+
+# The default of float16 can lead to discrepancies between outputs of
+# the compiled model and the RASP program.
+jax.config.update('jax_default_matmul_precision', 'float32')
+
+
+def compile_program(program: rasp.SOp, vocab: Set, max_seq_len_without_BOS: int, causal: bool) -> TracrOutput:
+    """Compiles a RASP program to a Tracr model, using the benchmark's BOS and PAD tokens."""
+    # Tracr assumes that max_seq_len in the following call means the maximum sequence length without BOS
+    return compiling.compile_rasp_to_model(
+        program,
+        vocab=vocab,
+        max_seq_len=max_seq_len_without_BOS,
+        compiler_bos=TRACR_BOS,
+        compiler_pad=TRACR_PAD,
+        causal=causal,
+    )
@@ -0,0 +1,37 @@
+import numpy as np
+
+# Strategies to build corrupted data for a benchmark case (see TracrBenchmarkCase.get_corrupted_data):
+# - resample: generate new data with a different seed (the original behaviour).
+# - permutation: pair each clean sample with a random sample of the clean pool.
+# - same_length: pair each clean sample with a random sample of the clean pool that has the same length.
+# - position_resample: replace the token at each position with the token at the same position of a random sample of the
+#   clean pool that has the same length, independently for each position. This produces new inputs, which are labeled
+#   and encoded the same way as clean data.
+CORRUPTION_STRATEGIES = ["resample", "permutation", "same_length", "position_resample"]
+
+
+def get_permutation_indices(rng: np.random.Generator, n_samples: int) -> np.ndarray:
+    """Returns the indices of the samples of the pool that make up the corrupted data for the permutation strategy."""
+    return rng.permutation(n_samples)
+
+
+def get_same_length_indices(rng: np.random.Generator, seq_lens: np.ndarray) -> np.ndarray:
+    """Returns the indices of the samples of the pool that make up the corrupted data for the same_length strategy:
+    a random permutation within each group of samples with the same length."""
+    indices = np.arange(len(seq_lens))
+    for seq_len in np.unique(seq_lens).tolist():
+        rows = np.flatnonzero(seq_lens == seq_len)
+        indices[rows] = rows[rng.permutation(len(rows))]
+    return indices
+
+
+def resample_positions(rng: np.random.Generator, inputs: np.ndarray, seq_lens: np.ndarray) -> np.ndarray:
+    """Returns the corrupted inputs for the position_resample strategy. BOS and padding stay in place, since tokens are
+    only exchanged between samples with the same length."""
+    corrupted_inputs = inputs.copy()
+    for seq_len in np.unique(seq_lens).tolist():
+        rows = np.flatnonzero(seq_lens == seq_len)
+        # an independent permutation of the rows for each position
+        permutations = rng.random((len(rows), seq_len - 1)).argsort(axis=0)
+        corrupted_inputs[rows, 1:seq_len] = np.take_along_axis(inputs[rows, 1:seq_len], permutations, axis=0)
+    return corrupted_inputs
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 from typing import List, Any, Optional
 
+import numpy as np
 import torch as t
 from torch.utils.data import DataLoader
 
 from circuits_benchmark.benchmark.case_dataset import CaseDataset
 from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset
+from circuits_benchmark.benchmark.tracr_token_ids import token_ids_to_values, encode_token_ids
+from circuits_benchmark.benchmark.vocabs import TRACR_PAD
 
 TracrBatchInput = List[List[Any]]
 
@@ -15,12 +18,29 @@ class TracrDataset(CaseDataset):
     def __init__(self,
                  inputs: TracrBatchInput,
                  targets: TracrBatchInput,
-                 hl_model: Optional["HookedTracrTransformer"] = None):
+                 hl_model: Optional["HookedTracrTransformer"] = None,
+                 input_ids: Optional[np.ndarray] = None,
+                 framed_vocab: Optional[np.ndarray] = None):
         self.inputs = inputs
         self.targets = targets
         assert len(inputs) == len(targets)
         self.hl_model = hl_model
 
+        # Optional token id representation of the inputs, used to encode them without going through Python lists.
+        assert (input_ids is None) == (framed_vocab is None), "input_ids and framed_vocab must be provided together"
+        self.input_ids = input_ids
+        self.framed_vocab = framed_vocab
+
+    @classmethod
+    def from_token_ids(cls,
+                       input_ids: np.ndarray,
+                       targets: TracrBatchInput | np.ndarray,
+                       framed_vocab: np.ndarray,
+                       hl_model: Optional["HookedTracrTransformer"] = None) -> TracrDataset:
+        """Builds a dataset from inputs expressed as token ids over a framed vocab (see tracr_token_ids)."""
+        inputs = token_ids_to_values(input_ids, framed_vocab)
+        return cls(inputs, targets, hl_model, input_ids=input_ids, framed_vocab=framed_vocab)
+
     def __len__(self):
         return len(self.inputs)
 
@@ -52,16 +72,33 @@ class TracrDataset(CaseDataset):
         )
 
     def get_encoded_dataset(self):
-        encoded_inputs = self.hl_model.map_tracr_input_to_tl_input(self.inputs)
-        with t.no_grad():
-            encoded_outputs = self.hl_model(encoded_inputs)
-            if self.hl_model.is_categorical():
-                # take argmax
-                argmax_encoded_outputs = t.argmax(encoded_outputs, dim=-1)
-                argmax_encoded_outputs[:, 0] = 0  # to make sure that the bos token return redundant information
-                # make one-hot
-                encoded_outputs = t.nn.functional.one_hot(
-                    argmax_encoded_outputs, num_classes=encoded_outputs.shape[-1]
-                ).float()
-
-        return TracrEncodedDataset(encoded_inputs, encoded_outputs)
+        if self.input_ids is not None:
+            encoded_inputs = encode_token_ids(self.input_ids, self.framed_vocab, self.hl_model.tracr_input_encoder)
+        else:
+            encoded_inputs = self.hl_model.map_tracr_input_to_tl_input(self.inputs)
+
+        return encode_outputs(encoded_inputs, self.hl_model)
+
+
+def encode_outputs(encoded_inputs: t.Tensor, hl_model: "HookedTracrTransformer") -> TracrEncodedDataset:
+    """Builds an encoded dataset for the given encoded inputs, using the outputs of the HL model as targets."""
+    with t.no_grad():
+        encoded_outputs = hl_model(encoded_inputs)
+        if hl_model.is_categorical():
+            # take argmax
+            argmax_encoded_outputs = t.argmax(encoded_outputs, dim=-1)
+            argmax_encoded_outputs[:, 0] = 0  # to make sure that the bos token return redundant information
+            # make one-hot
+            encoded_outputs = t.nn.functional.one_hot(
+                argmax_encoded_outputs, num_classes=encoded_outputs.shape[-1]
+            ).float()
+
+    return TracrEncodedDataset(encoded_inputs, encoded_outputs, get_encoded_pad_token_id(hl_model),
+                               causal=hl_model.cfg.attention_dir == "causal")
+
+
+def get_encoded_pad_token_id(hl_model: "HookedTracrTransformer") -> int | None:
+    """Returns the id of the PAD token in the encoded inputs of the HL model, if it has one."""
+    if hl_model.input_id_by_value is None:
+        return None
+    return hl_model.input_id_by_value.get(TRACR_PAD)
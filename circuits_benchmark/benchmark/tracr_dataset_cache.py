@@ -0,0 +1,109 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+import torch as t
+
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset
+from circuits_benchmark.utils.cloudpickle import load_from_pickle, dump_to_pickle
+from circuits_benchmark.utils.project_paths import get_default_cache_dir
+
+# Bump this version whenever the way datasets are generated or encoded changes in a way that is not covered by the
+# source files passed to fingerprint_dataset.
+TRACR_DATASET_CACHE_VERSION = 3
+
+
+def get_tracr_dataset_cache_dir() -> str:
+    return os.path.join(get_default_cache_dir(), "datasets")
+
+
+def fingerprint_dataset(tracr_fingerprint: str, source_files: List[str], params: Dict[str, Any]) -> str:
+    """Returns a hash that identifies an encoded dataset. It covers the Tracr compilation of the case (which determines
+    the HL model used to encode the dataset), the source files involved in generating it (e.g., the case module, which
+    may override how inputs and outputs are produced) and the parameters of the call that generated it."""
+    lines = [
+        f"version: {TRACR_DATASET_CACHE_VERSION}",
+        f"tracr: {tracr_fingerprint}",
+    ]
+    for path in source_files:
+        with open(path, "rb") as f:
+            lines.append(f"{os.path.basename(path)}: {hashlib.sha256(f.read()).hexdigest()}")
+    lines.extend(f"{name}: {value!r}" for name, value in sorted(params.items()))
+
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def load_cached_encoded_dataset(fingerprint: str) -> TracrEncodedDataset | None:
+    """Loads the encoded dataset cached for the given fingerprint, if any (see load_encoded_dataset)."""
+    dataset_dir = os.path.join(get_tracr_dataset_cache_dir(), fingerprint)
+    if not os.path.exists(dataset_dir):
+        return None
+
+    try:
+        return load_encoded_dataset(dataset_dir)
+    except Exception as e:
+        # A corrupted or incompatible artifact is treated as a cache miss, and will be overwritten.
+        print(f"Unable to load cached dataset from {dataset_dir}: {e}")
+        return None
+
+
+def load_encoded_dataset(dataset_dir: str) -> TracrEncodedDataset:
+    """Loads an encoded dataset stored by save_encoded_dataset. Inputs and targets are memory-mapped (copy-on-write), so
+    they are only read from disk as they are accessed.
+    The state of the random number generators after the dataset was originally generated is restored, so that code
+    running afterwards behaves the same regardless of whether the dataset was loaded or generated."""
+    inputs = np.load(os.path.join(dataset_dir, "inputs.npy"), mmap_mode="c")
+    targets = np.load(os.path.join(dataset_dir, "targets.npy"), mmap_mode="c")
+    metadata = load_from_pickle(os.path.join(dataset_dir, "metadata.pkl"))
+
+    rng_states = metadata["rng_states"]
+    t.random.set_rng_state(t.from_numpy(rng_states["torch"]))
+    np.random.set_state(rng_states["numpy"])
+    random.setstate(rng_states["random"])
+
+    return TracrEncodedDataset(t.from_numpy(inputs), t.from_numpy(targets), metadata["pad_token_id"],
+                               metadata.get("causal", False))
+
+
+def save_encoded_dataset(dataset_dir: str, dataset: TracrEncodedDataset) -> None:
+    """Stores an encoded dataset in the given (existing) directory, together with the current state of the random
+    number generators."""
+    np.save(os.path.join(dataset_dir, "inputs.npy"), dataset.get_inputs().cpu().numpy())
+    np.save(os.path.join(dataset_dir, "targets.npy"), dataset.get_targets().cpu().numpy())
+    dump_to_pickle(os.path.join(dataset_dir, "metadata.pkl"), {
+        "pad_token_id": dataset.pad_token_id,
+        "causal": dataset.causal,
+        "rng_states": {
+            "torch": t.random.get_rng_state().numpy(),
+            "numpy": np.random.get_state(),
+            "random": random.getstate(),
+        },
+    })
+
+
+def cache_encoded_dataset(fingerprint: str, dataset: TracrEncodedDataset) -> None:
+    """Stores an encoded dataset for the given fingerprint (see save_encoded_dataset). The dataset is written to a
+    temporary directory that is then renamed, so concurrent jobs can share the cache directory."""
+    cache_dir = get_tracr_dataset_cache_dir()
+    dataset_dir = os.path.join(cache_dir, fingerprint)
+    tmp_dir = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir, suffix=".tmp")
+
+        save_encoded_dataset(tmp_dir, dataset)
+
+        os.chmod(tmp_dir, 0o755)  # mkdtemp creates directories accessible only by the owner
+        os.rename(tmp_dir, dataset_dir)
+        tmp_dir = None
+    except Exception as e:
+        if not os.path.exists(dataset_dir):
+            print(f"Unable to cache dataset in {dataset_dir}: {e}")
+        # Otherwise, another job cached the same dataset first
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -1,6 +1,8 @@
+from typing import Iterator, NamedTuple, Tuple
+
 import torch as t
 from torch import Tensor
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Sampler
 
 from circuits_benchmark.benchmark.case_dataset import CaseDataset
 
@@ -8,14 +10,28 @@ from circuits_benchmark.benchmark.case_dataset import CaseDataset
 class TracrEncodedDataset(CaseDataset):
     """Same as TracrDataset, but with encoded inputs and outputs (i.e., tensors instead of numpy arrays)."""
 
-    def __init__(self, inputs: Tensor, targets: Tensor):
+    def __init__(self, inputs: Tensor, targets: Tensor, pad_token_id: int | None = None, causal: bool = False):
         self.inputs = inputs
         self.targets = targets
 
+        # Encoded PAD token, used to find the true length of each sequence (see get_seq_lens).
+        self.pad_token_id = pad_token_id
+
+        # Whether the HL model that encoded the dataset uses causal attention. Only then the outputs at the real
+        # positions do not depend on the trailing PAD positions, so batches can be trimmed (see make_loader).
+        self.causal = causal
+
     def __len__(self):
         return len(self.inputs)
 
     def __getitem__(self, idx):
+        """Returns a single sample, or a whole batch if idx is a slice or a tensor of indices (see BatchIndexSampler).
+        Batches of a LengthBucket are trimmed to its sequence length."""
+        if isinstance(idx, LengthBucket):
+            inputs, targets = self[idx.indices]
+            return inputs[:, :idx.seq_len], targets[:, :idx.seq_len]
+        if isinstance(idx, Tensor):
+            return gather_rows(self.inputs, idx), gather_rows(self.targets, idx)
         return self.inputs[idx], self.targets[idx]
 
     def get_inputs(self):
@@ -24,6 +40,12 @@ class TracrEncodedDataset(CaseDataset):
     def get_targets(self):
         return self.targets
 
+    def get_seq_lens(self) -> Tensor:
+        """Returns the length (including BOS) of each sequence, without padding."""
+        if self.pad_token_id is None:
+            return t.full((len(self.inputs),), self.inputs.shape[1], dtype=t.long)
+        return (self.inputs != self.pad_token_id).sum(dim=1).cpu()
+
     @staticmethod
     def collate_fn(batch, device: t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu")):
         inputs = t.stack([x[0] for x in batch])
@@ -36,11 +58,204 @@ class TracrEncodedDataset(CaseDataset):
         shuffle: bool | None = False,
         device: str | t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu"),
         num_workers: int = 0,
+        resident_on_device: bool = False,
+        pin_memory: bool = False,
+        bucket_by_length: bool = False,
+        sampler: Sampler | None = None,
     ) -> DataLoader:
+        """Returns a loader that fetches each batch by slicing (or indexing, when shuffling) the inputs and targets
+        tensors at once, instead of fetching and stacking samples one by one.
+        If resident_on_device is True, the whole dataset is moved to the device once, so batches don't need to be
+        transferred. Otherwise, if pin_memory is True and the device is a GPU, the dataset is kept in pinned memory and
+        batches are copied asynchronously, so the copy of a batch overlaps with the computation on the previous one.
+        If bucket_by_length is True, samples of similar length are batched together (see LengthBucketSampler), and each
+        batch is trimmed to its longest sequence, so PAD positions are not computed. This is only allowed for datasets
+        of causal models, whose outputs at the real positions do not depend on later positions. Position 0 is still
+        BOS, so slicing outputs with [:, 1:] works the same way. A custom sampler can be given instead, e.g. to pair the
+        batches of two loaders (see make_paired_loaders)."""
+        if (bucket_by_length or isinstance(sampler, LengthBucketSampler)) and not self.causal:
+            raise ValueError("Batches can only be trimmed to their longest sequence for datasets of causal models")
+
+        if batch_size is None:
+            assert not bucket_by_length and sampler is None, "Batches can only be sampled for a given batch size"
+            return DataLoader(
+                self,
+                batch_size=batch_size,
+                shuffle=shuffle,
+                num_workers=num_workers,
+                collate_fn=lambda x: self.collate_fn(x, device=device),
+            )
+
+        device = t.device(device)
+        dataset = self
+        non_blocking = False
+        if resident_on_device:
+            dataset = TracrEncodedDataset(self.inputs.to(device), self.targets.to(device), self.pad_token_id,
+                                          self.causal)
+        elif pin_memory and device.type == "cuda":
+            dataset = TracrEncodedDataset(self.inputs.pin_memory(), self.targets.pin_memory(), self.pad_token_id,
+                                          self.causal)
+            non_blocking = True
+
+        if sampler is None:
+            if bucket_by_length:
+                sampler = LengthBucketSampler(self.get_seq_lens(), batch_size, shuffle=bool(shuffle))
+            else:
+                sampler = BatchIndexSampler(len(self), batch_size, shuffle=bool(shuffle))
+
         return DataLoader(
-            self,
-            batch_size=batch_size,
-            shuffle=shuffle,
+            dataset,
+            sampler=sampler,
+            batch_size=None,
             num_workers=num_workers,
-            collate_fn=lambda x: self.collate_fn(x, device=device),
+            collate_fn=lambda batch: (batch[0].to(device=device, non_blocking=non_blocking),
+                                      batch[1].to(device=device, non_blocking=non_blocking)),
         )
+
+
+class TracrEncodedDatasetView(TracrEncodedDataset):
+    """Encoded dataset made of rows of another encoded dataset (e.g., a corrupted dataset derived from a pool of clean
+    data). Samples and batches are gathered from the base dataset on access, so the view only holds the indices of its
+    rows. get_inputs and get_targets gather all the rows at once."""
+
+    def __init__(self, base: TracrEncodedDataset, indices: Tensor):
+        self.base = base
+        self.indices = indices
+        self.pad_token_id = base.pad_token_id
+        self.causal = base.causal
+
+    @property
+    def inputs(self) -> Tensor:
+        return self.base.inputs[self.indices]
+
+    @property
+    def targets(self) -> Tensor:
+        return self.base.targets[self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, int):
+            return self.base[int(self.indices[idx])]
+        if isinstance(idx, LengthBucket):
+            return self.base[LengthBucket(self.indices[idx.indices], idx.seq_len)]
+        return self.base[self.indices[idx]]
+
+    def get_seq_lens(self) -> Tensor:
+        return self.base.get_seq_lens()[self.indices]
+
+
+class BatchIndexSampler(Sampler):
+    """Yields the indices of each batch at once: a slice for contiguous batches, or a tensor of indices when shuffling.
+    Shuffling draws the permutation the same way as RandomSampler, so batches contain the same samples as those of a
+    DataLoader with shuffle=True, unless a seed is given (see get_shuffle_generator)."""
+
+    def __init__(self, n_samples: int, batch_size: int, shuffle: bool = False, seed: int | None = None):
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return (self.n_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[slice | Tensor]:
+        if not self.shuffle:
+            for start in range(0, self.n_samples, self.batch_size):
+                yield slice(start, min(start + self.batch_size, self.n_samples))
+            return
+
+        generator = get_shuffle_generator(self.seed, self.epoch)
+        self.epoch += 1
+        yield from t.randperm(self.n_samples, generator=generator).split(self.batch_size)
+
+
+class LengthBucket(NamedTuple):
+    """The indices of a batch, and the length its sequences are trimmed to."""
+    indices: Tensor
+    seq_len: int
+
+
+class LengthBucketSampler(Sampler):
+    """Yields the batches of samples of the same (or similar) length, so that they can be trimmed to their longest
+    sequence. Samples are sorted by length and split into batches. When shuffling, the order of the samples within each
+    length and the order of the batches are random."""
+
+    def __init__(self, seq_lens: Tensor, batch_size: int, shuffle: bool = False, seed: int | None = None):
+        self.seq_lens = seq_lens
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return (len(self.seq_lens) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[LengthBucket]:
+        if not self.shuffle:
+            indices = t.sort(self.seq_lens, stable=True).indices
+            for batch in indices.split(self.batch_size):
+                yield LengthBucket(batch, int(self.seq_lens[batch].max()))
+            return
+
+        generator = get_shuffle_generator(self.seed, self.epoch)
+        self.epoch += 1
+
+        # shuffle the samples, and then sort them by length keeping the random order within each length
+        permutation = t.randperm(len(self.seq_lens), generator=generator)
+        indices = permutation[t.sort(self.seq_lens[permutation], stable=True).indices]
+
+        batches = indices.split(self.batch_size)
+        for batch_index in t.randperm(len(batches), generator=generator).tolist():
+            batch = batches[batch_index]
+            yield LengthBucket(batch, int(self.seq_lens[batch].max()))
+
+
+def get_shuffle_generator(seed: int | None, epoch: int) -> t.Generator:
+    """Returns the generator a sampler shuffles an epoch with. Without a seed, it is seeded from the torch RNG, the same
+    way as RandomSampler. With a seed, it only depends on the seed and the epoch, so that samplers with the same seed
+    yield the same batches."""
+    if seed is None:
+        seed = int(t.empty((), dtype=t.int64).random_().item())
+    else:
+        seed = seed + epoch
+
+    generator = t.Generator()
+    generator.manual_seed(seed)
+    return generator
+
+
+def make_paired_loaders(
+    clean_data: TracrEncodedDataset,
+    corrupted_data: TracrEncodedDataset,
+    batch_size: int,
+    shuffle: bool = False,
+    device: str | t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu"),
+    bucket_by_length: bool = False,
+) -> Tuple[DataLoader, DataLoader]:
+    """Returns loaders of clean and corrupted data whose batches are paired when zipped: batch i of both loaders has
+    the same rows of each dataset, and, when bucketing by length, the same length. Samples are bucketed by the longest
+    sequence of each clean and corrupted pair, and both loaders shuffle with the same permutation on each epoch."""
+    assert len(clean_data) == len(corrupted_data), "Clean and corrupted data must have the same number of samples"
+
+    seed = int(t.empty((), dtype=t.int64).random_().item()) if shuffle else None
+    if bucket_by_length:
+        seq_lens = t.maximum(clean_data.get_seq_lens(), corrupted_data.get_seq_lens())
+        samplers = [LengthBucketSampler(seq_lens, batch_size, shuffle=shuffle, seed=seed) for _ in range(2)]
+    else:
+        samplers = [BatchIndexSampler(len(clean_data), batch_size, shuffle=shuffle, seed=seed) for _ in range(2)]
+
+    return (clean_data.make_loader(batch_size, device=device, sampler=samplers[0]),
+            corrupted_data.make_loader(batch_size, device=device, sampler=samplers[1]))
+
+
+def gather_rows(tensor: Tensor, indices: Tensor) -> Tensor:
+    """Gathers rows of a tensor. If the tensor is in pinned memory, so is the result, so it can be copied to the GPU
+    asynchronously."""
+    if not tensor.is_pinned():
+        return tensor[indices]
+
+    rows = t.empty((len(indices), *tensor.shape[1:]), dtype=tensor.dtype, pin_memory=True)
+    return t.index_select(tensor, 0, indices, out=rows)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple, Type, TYPE_CHECKING
+
+import numpy as np
+import torch as t
+
+from circuits_benchmark.benchmark.tracr_token_ids import enumerate_token_ids
+
+if TYPE_CHECKING:
+    from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+
+# Number of samples generated or labeled by each task. Shards only depend on the number of samples and the seed, so the
+# generated data does not depend on the number of workers.
+SHARD_SIZE = 10_000
+
+# Case instances of each worker process, reused across tasks so that programs and validations are only built once.
+worker_cases: Dict[Type, TracrBenchmarkCase] = {}
+
+
+def sample_data_in_shards(case: TracrBenchmarkCase,
+                          rng: np.random.Generator,
+                          n_samples: int,
+                          min_seq_len: int,
+                          max_seq_len: int,
+                          n_workers: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Samples and labels random data for a case in a pool of worker processes (see
+    TracrBenchmarkCase.sample_data_as_token_ids). Each shard of SHARD_SIZE samples is generated with its own seed, drawn
+    from rng."""
+    starts = range(0, n_samples, SHARD_SIZE)
+    shard_seeds = rng.integers(0, 2 ** 32, size=len(starts)).tolist()
+    tasks = [(start, min(start + SHARD_SIZE, n_samples), shard_seed) for start, shard_seed in zip(starts, shard_seeds)]
+    return run_in_shards(case, sample_shard, tasks, n_samples, min_seq_len, max_seq_len, n_workers)
+
+
+def gen_all_data_in_shards(case: TracrBenchmarkCase,
+                           min_seq_len: int,
+                           max_seq_len: int,
+                           n_workers: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as TracrBenchmarkCase.gen_all_data, but labels the sequences in a pool of worker processes."""
+    input_ids = enumerate_token_ids(len(case.get_vocab()), min_seq_len, max_seq_len)
+    tasks = [(start, min(start + SHARD_SIZE, len(input_ids)), None) for start in range(0, len(input_ids), SHARD_SIZE)]
+    return run_in_shards(case, label_shard, tasks, len(input_ids), min_seq_len, max_seq_len, n_workers, input_ids)
+
+
+def run_in_shards(case: TracrBenchmarkCase,
+                  shard_fn,
+                  tasks: List[Tuple[int, int, int | None]],
+                  n_samples: int,
+                  min_seq_len: int,
+                  max_seq_len: int,
+                  n_workers: int,
+                  input_ids: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Runs the tasks of a sharded generation and gathers their results. Workers exchange the token ids of the inputs
+    and the outputs through shared memory, writing the rows of their shard in place. Outputs are written as ids into a
+    table of the distinct output values of each shard, which is the only data sent back to the main process."""
+    shape = (n_samples, max_seq_len)
+    input_ids_memory = SharedMemory(create=True, size=max(1, n_samples * max_seq_len * 8))
+    output_codes_memory = SharedMemory(create=True, size=max(1, n_samples * max_seq_len * 4))
+    shared_input_ids = output_codes = None
+    try:
+        shared_input_ids = np.ndarray(shape, dtype=np.int64, buffer=input_ids_memory.buf)
+        output_codes = np.ndarray(shape, dtype=np.int32, buffer=output_codes_memory.buf)
+        if input_ids is not None:
+            shared_input_ids[:] = input_ids
+
+        # Workers are spawned instead of forked, since forking a process that already uses torch (or CUDA) is unsafe.
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn")) as executor:
+            futures = [executor.submit(shard_fn, type(case), case.sampling_rng_version, input_ids_memory.name,
+                                       output_codes_memory.name, shape, min_seq_len, start, end, shard_seed)
+                       for start, end, shard_seed in tasks]
+            output_values = [future.result() for future in futures]
+
+        input_ids = shared_input_ids.copy()
+        output_data = np.empty(shape, dtype=object)
+        for (start, end, _), values in zip(tasks, output_values):
+            output_data[start:end] = values[output_codes[start:end]]
+
+        return input_ids, output_data
+    finally:
+        shared_input_ids = output_codes = None  # release the buffers before closing the shared memory
+        for memory in [input_ids_memory, output_codes_memory]:
+            memory.close()
+            memory.unlink()
+
+
+def sample_shard(case_type: Type[TracrBenchmarkCase],
+                 sampling_rng_version: int,
+                 input_ids_memory_name: str,
+                 output_codes_memory_name: str,
+                 shape: Tuple[int, int],
+                 min_seq_len: int,
+                 start: int,
+                 end: int,
+                 shard_seed: int) -> np.ndarray:
+    """Worker task: samples and labels the rows between start and end."""
+    case = get_worker_case(case_type, sampling_rng_version)
+
+    # the legacy sampling scheme uses the global random number generators
+    t.random.manual_seed(shard_seed)
+    np.random.seed(shard_seed)
+    random.seed(shard_seed)
+
+    input_ids, output_data = case.sample_data_as_token_ids(np.random.default_rng(shard_seed), end - start,
+                                                           min_seq_len, shape[1])
+    return write_shard(input_ids_memory_name, output_codes_memory_name, shape, start, end, input_ids, output_data)
+
+
+def label_shard(case_type: Type[TracrBenchmarkCase],
+                sampling_rng_version: int,
+                input_ids_memory_name: str,
+                output_codes_memory_name: str,
+                shape: Tuple[int, int],
+                min_seq_len: int,
+                start: int,
+                end: int,
+                shard_seed: int | None) -> np.ndarray:
+    """Worker task: labels the rows between start and end, whose inputs were written by the main process."""
+    case = get_worker_case(case_type, sampling_rng_version)
+
+    memory = SharedMemory(name=input_ids_memory_name)
+    try:
+        input_ids = np.ndarray(shape, dtype=np.int64, buffer=memory.buf)[start:end].copy()
+    finally:
+        memory.close()
+
+    output_data = case.get_correct_outputs(input_ids)
+    return write_shard(None, output_codes_memory_name, shape, start, end, None, output_data)
+
+
+def get_worker_case(case_type: Type[TracrBenchmarkCase], sampling_rng_version: int) -> TracrBenchmarkCase:
+    if case_type not in worker_cases:
+        worker_cases[case_type] = case_type()
+
+    case = worker_cases[case_type]
+    case.sampling_rng_version = sampling_rng_version
+    return case
+
+
+def write_shard(input_ids_memory_name: str | None,
+                output_codes_memory_name: str,
+                shape: Tuple[int, int],
+                start: int,
+                end: int,
+                input_ids: np.ndarray | None,
+                output_data: np.ndarray) -> np.ndarray:
+    """Writes the rows of a shard into shared memory, and returns the table of distinct output values indexed by the
+    output codes."""
+    if input_ids is not None:
+        memory = SharedMemory(name=input_ids_memory_name)
+        try:
+            np.ndarray(shape, dtype=np.int64, buffer=memory.buf)[start:end] = input_ids
+        finally:
+            memory.close()
+
+    # Values are keyed by their type too, since e.g. True, 1 and 1.0 are equal dict keys.
+    value_ids = {}
+    values = []
+    codes = np.empty(output_data.size, dtype=np.int32)
+    for i, value in enumerate(output_data.ravel().tolist()):
+        key = (type(value), value)
+        if key not in value_ids:
+            value_ids[key] = len(values)
+            values.append(value)
+        codes[i] = value_ids[key]
+
+    memory = SharedMemory(name=output_codes_memory_name)
+    try:
+        np.ndarray(shape, dtype=np.int32, buffer=memory.buf)[start:end] = codes.reshape(output_data.shape)
+    finally:
+        memory.close()
+
+    # We fill the table element by element, since numpy would otherwise unpack tuple values into extra dimensions.
+    values_table = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        values_table[i] = value
+    return values_table
@@ -0,0 +1,129 @@
+from typing import Set, Sequence
+
+import numpy as np
+import torch as t
+
+from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
+
+# Token ids are positions in the framed vocab: BOS is always 0, the sorted vocab values come next and PAD is last.
+BOS_TOKEN_ID = 0
+
+# Version of the scheme used to draw random data for a seed. Datasets are only reproducible for the same seed and
+# version, so bump this whenever the draws change.
+# 1: one sequence at a time from the global `random` and `np.random` generators (see TracrBenchmarkCase.sample_data).
+# 2: whole batches at once from a np.random.Generator seeded with the dataset seed (see
+#    TracrBenchmarkCase.gen_random_input_ids).
+SAMPLING_RNG_VERSION = 2
+
+
+def get_framed_vocab(vocab: Set) -> np.ndarray:
+    """Returns the vocab sorted and framed by BOS and PAD, as an object array indexable by token ids."""
+    values = [TRACR_BOS] + sorted(list(vocab)) + [TRACR_PAD]
+
+    # We fill the array element by element, since numpy would otherwise unpack tuple values into extra dimensions.
+    framed_vocab = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        framed_vocab[i] = value
+
+    return framed_vocab
+
+
+def get_pad_token_id(framed_vocab: np.ndarray) -> int:
+    return len(framed_vocab) - 1
+
+
+def enumerate_token_ids(n_vals: int, min_seq_len: int, max_seq_len: int) -> np.ndarray:
+    """Returns all possible sequences of token ids for a vocab of size n_vals, for every length between min_seq_len and
+    max_seq_len (both including BOS). Sequences are framed with BOS and padded with PAD up to max_seq_len, and are
+    sorted by length and then in lexicographic order, the same order in which they were produced one by one before.
+    """
+    assert min_seq_len >= 2, "min_seq_len must be at least 2 to account for BOS"
+    pad_token_id = n_vals + 1
+
+    token_ids_by_len = []
+    for seq_len in range(min_seq_len, max_seq_len + 1):
+        n_positions = seq_len - 1
+        count = n_vals ** n_positions
+
+        # Convert every index to base n_vals at once, with the most significant digit in the first position.
+        powers = n_vals ** np.arange(n_positions - 1, -1, -1, dtype=np.int64)
+        indices = np.arange(count, dtype=np.int64)
+        digits = (indices[:, None] // powers[None, :]) % n_vals
+
+        token_ids = np.full((count, max_seq_len), pad_token_id, dtype=np.int64)
+        token_ids[:, 0] = BOS_TOKEN_ID
+        token_ids[:, 1:seq_len] = digits + 1
+        token_ids_by_len.append(token_ids)
+
+    return np.concatenate(token_ids_by_len, axis=0)
+
+
+def get_seq_lens(token_ids: np.ndarray, framed_vocab: np.ndarray) -> np.ndarray:
+    """Returns the length (including BOS) of each sequence of token ids."""
+    return (token_ids != get_pad_token_id(framed_vocab)).sum(axis=1)
+
+
+def token_ids_to_values(token_ids: np.ndarray, framed_vocab: np.ndarray) -> np.ndarray:
+    """Maps token ids to their values in the vocab, returning an object array of the same shape."""
+    return framed_vocab[token_ids]
+
+
+def values_to_token_ids(batch_input: Sequence[Sequence], framed_vocab: np.ndarray) -> np.ndarray:
+    """Maps a batch of framed sequences of values (e.g., as produced by sample_data) to token ids."""
+    token_id_by_value = {value: i for i, value in enumerate(framed_vocab)}
+    return np.array([[token_id_by_value[value] for value in seq] for seq in batch_input], dtype=np.int64)
+
+
+def encode_token_ids(token_ids: np.ndarray, framed_vocab: np.ndarray, input_encoder) -> t.Tensor:
+    """Encodes token ids with the given Tracr input encoder, using a lookup table instead of encoding value by value."""
+    lookup_table = np.array([input_encoder.encoding_map[value] for value in framed_vocab], dtype=np.int64)
+    return t.from_numpy(lookup_table[token_ids])
+
+
+def decode_token_ids(encoded_inputs: t.Tensor, framed_vocab: np.ndarray, input_encoder) -> np.ndarray:
+    """Maps inputs encoded by encode_token_ids back to token ids."""
+    lookup_table = np.array([input_encoder.encoding_map[value] for value in framed_vocab], dtype=np.int64)
+    token_id_by_code = np.full(lookup_table.max() + 1, -1, dtype=np.int64)
+    token_id_by_code[lookup_table] = np.arange(len(framed_vocab))
+    return token_id_by_code[encoded_inputs.cpu().numpy()]
+
+
+def make_object_array(batch: Sequence[Sequence]) -> np.ndarray:
+    """Builds a 2D object array from a batch of sequences of the same length, keeping tuple values as single elements."""
+    seq_len = len(batch[0]) if len(batch) > 0 else 0
+    array = np.empty((len(batch), seq_len), dtype=object)
+    for i, seq in enumerate(batch):
+        for j, value in enumerate(seq):
+            array[i, j] = value
+    return array
+
+
+def sample_token_ids(rng: np.random.Generator,
+                     n_vals: int,
+                     n_samples: int,
+                     min_seq_len: int,
+                     max_seq_len: int) -> np.ndarray:
+    """Samples random sequences of token ids (with replacement), with lengths between min_seq_len and max_seq_len (both
+    including BOS). Sequences are framed with BOS and padded with PAD up to max_seq_len."""
+    seq_lens = sample_seq_lens(rng, n_samples, min_seq_len, max_seq_len)
+    token_ids = rng.integers(1, n_vals + 1, size=(n_samples, max_seq_len), dtype=np.int64)
+    token_ids[:, 0] = BOS_TOKEN_ID
+    token_ids[np.arange(max_seq_len)[None, :] >= seq_lens[:, None]] = n_vals + 1
+    return token_ids
+
+
+def sample_seq_lens(rng: np.random.Generator, n_samples: int, min_seq_len: int, max_seq_len: int) -> np.ndarray:
+    """Samples sequence lengths (including BOS) uniformly between min_seq_len and max_seq_len."""
+    return rng.integers(min_seq_len, max_seq_len + 1, size=n_samples)
+
+
+def frame_token_codes(token_codes: np.ndarray, seq_lens: np.ndarray, n_vals: int) -> np.ndarray:
+    """Turns a batch of sequences of vocab codes (positions in the sorted vocab, i.e., token ids without the frame) into
+    token ids, prepending BOS and replacing every position at or after the length of each sequence (including BOS) with
+    PAD. Useful for case-specific generators, which only need to fill the content of the sequences."""
+    n_samples, n_positions = token_codes.shape
+    token_ids = np.empty((n_samples, n_positions + 1), dtype=np.int64)
+    token_ids[:, 0] = BOS_TOKEN_ID
+    token_ids[:, 1:] = token_codes + 1
+    token_ids[np.arange(n_positions + 1)[None, :] >= seq_lens[:, None]] = n_vals + 1
+    return token_ids
@@ -17,7 +17,7 @@ from auto_circuit.utils.graph_utils import patchable_model
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.commands.algorithms.legacy_acdc import ACDCConfig, LegacyACDCRunner
 from circuits_benchmark.commands.common_args import add_common_args, add_evaluation_common_ags
-from circuits_benchmark.utils.auto_circuit_utils import build_circuit
+from circuits_benchmark.utils.auto_circuit_utils import build_edge_scores
 from circuits_benchmark.utils.circuit.circuit import Circuit
 from circuits_benchmark.utils.circuit.circuit_eval import evaluate_hypothesis_circuit, CircuitEvalResult
 from circuits_benchmark.utils.ll_model_loader.ll_model_loader import LLModelLoader
@@ -171,7 +171,11 @@ class ACDCRunner:
             faithfulness_target=faithfulness_metric,
         )
 
-        acdc_circuit = build_circuit(auto_circuit_model, attribution_scores, self.config.threshold)
+        # ACDC scores depend on the threshold they were computed for, so they are only kept for reference
+        edge_scores = build_edge_scores(auto_circuit_model, attribution_scores)
+        edge_scores.save(f"{self.config.output_dir}/edge_scores.pkl")
+
+        acdc_circuit = edge_scores.build_circuit(self.config.threshold)
         acdc_circuit.save(f"{self.config.output_dir}/final_circuit.pkl")
 
         return acdc_circuit
@@ -15,9 +15,12 @@ from auto_circuit.utils.tensor_ops import prune_scores_threshold
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.commands.common_args import add_common_args, add_evaluation_common_ags
-from circuits_benchmark.utils.auto_circuit_utils import build_circuit, build_normalized_scores
+from circuits_benchmark.utils.auto_circuit_utils import build_edge_scores, build_normalized_scores
 from circuits_benchmark.utils.circuit.circuit import Circuit
-from circuits_benchmark.utils.circuit.circuit_eval import evaluate_hypothesis_circuit, CircuitEvalResult
+from circuits_benchmark.utils.circuit.circuit_eval import evaluate_hypothesis_circuit, CircuitEvalResult, \
+    evaluate_edge_scores
+from circuits_benchmark.utils.circuit.circuit_roc import EdgeScores
+from circuits_benchmark.utils.cloudpickle import dump_to_pickle
 from circuits_benchmark.utils.ll_model_loader.ll_model_loader import LLModelLoader
 from circuits_benchmark.utils.project_paths import get_default_output_dir
 
@@ -81,6 +84,7 @@ class EAPRunner:
         self.regression_loss_fn = self.config.regression_loss_fn
         self.classification_loss_fn = self.config.classification_loss_fn
         self.normalize_scores = self.config.normalize_scores
+        self.edge_scores: EdgeScores | None = None
 
         assert (self.edge_count is not None) ^ (self.threshold is not None), \
             "Either edge_count or threshold must be provided, but not both"
@@ -140,6 +144,20 @@ class EAPRunner:
 
         pickle.dump(result, open(f"{clean_dirname}/result.pkl", "wb"))
         print(f"Saved result to {clean_dirname}/result.txt and {clean_dirname}/result.pkl")
+
+        print("Calculating ROC curves for all thresholds")
+        roc = evaluate_edge_scores(
+            self.edge_scores,
+            ll_model,
+            hl_ll_corr,
+            self.case,
+            use_embeddings=False,
+            abs_value_threshold=self.config.abs_value_threshold,
+        )
+        print(f" - Nodes AUC: {roc.nodes.auc}")
+        print(f" - Edges AUC: {roc.edges.auc}")
+        dump_to_pickle(f"{clean_dirname}/roc.pkl", roc)
+        print(f"Saved ROC curves to {clean_dirname}/roc.pkl")
         if self.config.using_wandb:
             import wandb
             algo_str = "eap" if self.integrated_grad_steps is None else f"integrated_grad_{self.integrated_grad_steps}"
@@ -218,7 +236,11 @@ class EAPRunner:
         else:
             threshold = self.threshold
 
-        eap_circuit = build_circuit(auto_circuit_model, attribution_scores, threshold, self.config.abs_value_threshold)
+        # keep the scores of all edges, so that circuits for other thresholds can be evaluated without running EAP again
+        self.edge_scores = build_edge_scores(auto_circuit_model, attribution_scores)
+        self.edge_scores.save(f"{self.config.output_dir}/edge_scores.pkl")
+
+        eap_circuit = self.edge_scores.build_circuit(threshold, self.config.abs_value_threshold)
         eap_circuit.save(f"{self.config.output_dir}/final_circuit.pkl")
 
         return eap_circuit
@@ -1,6 +1,7 @@
 import argparse
 
 from circuits_benchmark.commands.algorithms import run_algorithm
+from circuits_benchmark.commands.bundle import bundle
 from circuits_benchmark.commands.evaluation import evaluation
 from circuits_benchmark.commands.train import train
 
@@ -15,6 +16,7 @@ def build_main_parser():
     run_algorithm.setup_args_parser(subparsers)
     train.setup_args_parser(subparsers)
     evaluation.setup_args_parser(subparsers)
+    bundle.setup_args_parser(subparsers)
 
     return parser
 
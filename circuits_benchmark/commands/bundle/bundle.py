@@ -0,0 +1,69 @@
+import os
+import shutil
+import traceback
+
+from circuits_benchmark.benchmark.benchmark_bundle import build_case_bundle, install_bundle, get_bundle_dir, \
+    BENCHMARK_BUNDLE_VERSION
+from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+from circuits_benchmark.commands.common_args import add_common_args
+from circuits_benchmark.utils.get_cases import get_cases
+from circuits_benchmark.utils.project_paths import get_default_bundle_dir
+
+
+def setup_args_parser(subparsers):
+    bundle_parser = subparsers.add_parser("bundle")
+    bundle_subparsers = bundle_parser.add_subparsers(dest="type")
+    bundle_subparsers.required = True
+
+    build_parser = bundle_subparsers.add_parser("build")
+    add_common_args(build_parser)
+    build_parser.add_argument("--data-sizes", type=str, default="1000",
+                              help="A list of comma separated dataset sizes. For each size, the clean and corrupted "
+                                   "datasets generated by default with that number of samples are bundled.")
+    build_parser.add_argument("--archive", type=str, default=None,
+                              help="If specified, also write the bundle to this .tar.gz file.")
+
+    load_parser = bundle_subparsers.add_parser("load")
+    load_parser.add_argument("path", type=str,
+                             help="The bundle to load: a directory or a .tar.gz file written by bundle build.")
+
+
+def run(args):
+    if args.type == "build":
+        build_bundle(args)
+    elif args.type == "load":
+        installed_cases = install_bundle(args.path)
+        print(f"Installed the bundles of {len(installed_cases)} cases in {get_bundle_dir()}: "
+              f"{', '.join(installed_cases)}")
+    else:
+        raise ValueError(f"Unknown bundle command: {args.type}")
+
+
+def build_bundle(args):
+    data_sizes = [int(size) for size in args.data_sizes.split(",")]
+
+    # The same arguments that get_clean_data and get_corrupted_data use by default, for each dataset size
+    dataset_args = []
+    for data_size in data_sizes:
+        dataset_args.append(dict(max_samples=data_size, seed=42))
+        dataset_args.append(dict(max_samples=data_size, seed=43))
+
+    for case in get_cases(args):
+        if not isinstance(case, TracrBenchmarkCase):
+            print(f"Skipping case {case.get_name()}, only Tracr cases can be bundled")
+            continue
+
+        print(f"\nBuilding bundle for case {case.get_name()}")
+        try:
+            case_dir = build_case_bundle(case, dataset_args)
+            print(f"Bundle written to {case_dir}")
+        except Exception as e:
+            print(f" >>> Failed to build bundle for case {case.get_name()}:")
+            traceback.print_exc()
+            continue
+
+    if args.archive is not None:
+        base_name = args.archive[:-len(".tar.gz")] if args.archive.endswith(".tar.gz") else args.archive
+        archive_path = shutil.make_archive(os.path.abspath(base_name), "gztar", root_dir=get_default_bundle_dir(),
+                                           base_dir=f"v{BENCHMARK_BUNDLE_VERSION}")
+        print(f"Bundle archive written to {archive_path}")
@@ -13,6 +13,9 @@ def add_common_args(parser):
                         help="The device to use for experiments.")
     parser.add_argument('--seed', type=int, default=1234,
                         help='The seed to use for experiments.')
+    parser.add_argument("--data-workers", type=int, default=0,
+                        help="Number of worker processes used to generate and label the data of Tracr cases. "
+                             "0 generates the data in the main process.")
 
 
 def add_evaluation_common_ags(parser):
@@ -6,6 +6,7 @@ import torch as t
 
 from circuits_benchmark.commands.evaluation.iit import iit_eval
 from circuits_benchmark.commands.evaluation.realism import node_wise_ablation, gt_circuit_node_wise_ablation
+from circuits_benchmark.commands.evaluation.sparse_hl import sparse_hl_eval
 from circuits_benchmark.utils.get_cases import get_cases
 
 
@@ -18,6 +19,7 @@ def setup_args_parser(subparsers):
     iit_eval.setup_args_parser(run_subparsers)
     node_wise_ablation.setup_args_parser(run_subparsers)
     gt_circuit_node_wise_ablation.setup_args_parser(run_subparsers)
+    sparse_hl_eval.setup_args_parser(run_subparsers)
 
 
 def run(args):
@@ -39,6 +41,8 @@ def run(args):
                 node_wise_ablation.run_nodewise_ablation(case, args)
             elif evaluation_type == "gt_node_realism":
                 gt_circuit_node_wise_ablation.run_nodewise_ablation(case, args)
+            elif evaluation_type == "sparse_hl":
+                sparse_hl_eval.run_sparse_hl_eval(case, args)
             else:
                 raise ValueError(f"Unknown evaluation: {evaluation_type}")
         except Exception as e:
@@ -122,7 +122,7 @@ def run_iit_eval(case: BenchmarkCase, args: Namespace):
     output_dir = args.output_dir
     use_mean_cache = args.mean
 
-    hl_model = case.get_hl_model()
+    hl_model = case.get_hl_model(copy=True)
     if isinstance(hl_model, HookedTracrTransformer):
         hl_model = IITHLModel(hl_model, eval_mode=True)
 
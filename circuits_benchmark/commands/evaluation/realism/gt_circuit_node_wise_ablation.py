@@ -54,7 +54,7 @@ def make_everything_for_task(case: BenchmarkCase, args: Namespace) -> tuple[
     HookedTransformer, Circuit, HookedTransformer, LLModelLoader]:
     output_dir = args.output_dir
 
-    hl_model = case.get_hl_model()
+    hl_model = case.get_hl_model(copy=True)
     if isinstance(hl_model, HookedTracrTransformer):
         hl_model = IITHLModel(hl_model, eval_mode=True)
 
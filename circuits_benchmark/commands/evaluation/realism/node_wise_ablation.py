@@ -108,7 +108,7 @@ def run_nodewise_ablation(case: BenchmarkCase, args: Namespace):
     use_mean_cache = args.mean
     use_wandb = args.use_wandb
 
-    hl_model = case.get_hl_model()
+    hl_model = case.get_hl_model(copy=True)
     if isinstance(hl_model, HookedTracrTransformer):
         hl_model = IITHLModel(hl_model, eval_mode=True)
 
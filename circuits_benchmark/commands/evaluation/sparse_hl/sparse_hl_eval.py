@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from argparse import Namespace
+from typing import Tuple
+
+import torch as t
+
+from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
+from circuits_benchmark.commands.common_args import add_common_args
+from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformer
+from circuits_benchmark.transformers.sparse_components import BlockSparseMatrix
+
+
+def setup_args_parser(subparsers):
+    parser = subparsers.add_parser("sparse_hl")
+    add_common_args(parser)
+
+    parser.add_argument(
+        "--batch-size", type=int, default=512, help="Batch size for the forward passes"
+    )
+    parser.add_argument(
+        "--max-len", type=int, default=10_000, help="Max number of samples to run the HL model on"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Number of timed passes over the data. The fastest one is reported"
+    )
+
+
+def run_sparse_hl_eval(case: BenchmarkCase, args: Namespace):
+    """Compares the forward passes of the HL model with dense and with sparse weights (see
+    HookedTracrTransformer.set_use_sparse_weights), reporting the speedup and whether the outputs are the same.
+    Weights are switched on a copy of the HL model, so the model cached for the case is not affected."""
+    hl_model = case.get_hl_model(device=args.device, copy=True)
+    if not isinstance(hl_model, HookedTracrTransformer):
+        print(f"Skipping case {case.get_name()}, sparse weights are only supported for Tracr HL models")
+        return
+
+    inputs = case.get_clean_data(max_samples=args.max_len).get_inputs()
+
+    hl_model.set_use_sparse_weights(False)
+    dense_logits, dense_time = time_forward_passes(hl_model, inputs, args.batch_size, args.repeats)
+
+    hl_model.set_use_sparse_weights(True)
+    sparse_matrices = [m for m in hl_model.modules() if isinstance(m, BlockSparseMatrix)]
+    sparse_logits, sparse_time = time_forward_passes(hl_model, inputs, args.batch_size, args.repeats)
+
+    if hl_model.is_categorical():
+        same_outputs = bool((dense_logits.argmax(dim=-1) == sparse_logits.argmax(dim=-1)).all())
+    else:
+        same_outputs = bool(t.allclose(dense_logits, sparse_logits, atol=1e-5))
+
+    results = {
+        "case": case.get_name(),
+        "n_samples": len(inputs),
+        "d_model": hl_model.cfg.d_model,
+        "weight_density": sum(m.block.numel() for m in sparse_matrices) /
+                          sum(m.n_rows * m.n_cols for m in sparse_matrices),
+        "dense_time": dense_time,
+        "sparse_time": sparse_time,
+        "speedup": dense_time / sparse_time,
+        "max_abs_logit_diff": (dense_logits - sparse_logits).abs().max().item(),
+        "same_outputs": same_outputs,
+    }
+    print(f"Case {case.get_name()}: {results['speedup']:.2f}x speedup ({dense_time:.4f}s dense, "
+          f"{sparse_time:.4f}s sparse), weight density {results['weight_density']:.4f}, "
+          f"max logit diff {results['max_abs_logit_diff']:.2e}, same outputs: {same_outputs}")
+
+    save_dir = os.path.join(args.output_dir, "sparse_hl_eval")
+    os.makedirs(save_dir, exist_ok=True)
+    with open(os.path.join(save_dir, f"case_{case.get_name()}.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def time_forward_passes(hl_model: HookedTracrTransformer,
+                        inputs: t.Tensor,
+                        batch_size: int,
+                        repeats: int) -> Tuple[t.Tensor, float]:
+    """Runs the HL model over the inputs in batches, repeats times. Returns the logits and the time of the fastest pass,
+    in seconds."""
+    batches = [inputs[i:i + batch_size].to(hl_model.device) for i in range(0, len(inputs), batch_size)]
+    best_time = float("inf")
+    with t.no_grad():
+        for repeat in range(repeats + 1):  # the first pass is a warmup
+            start = time.perf_counter()
+            logits = [hl_model(batch) for batch in batches]
+            if t.device(hl_model.device).type == "cuda":
+                t.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+            if repeat > 0:
+                best_time = min(best_time, elapsed)
+
+    return t.cat(logits).cpu(), best_time
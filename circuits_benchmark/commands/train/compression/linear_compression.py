@@ -31,7 +31,7 @@ def setup_args_parser(subparsers):
 def train_linear_compression(case: BenchmarkCase, args: Namespace):
     """Compresses the residual stream of a Tracr model using a linear compression."""
     assert isinstance(case, TracrBenchmarkCase), "Only TracrBenchmarkCase is supported for autoencoder training."
-    tl_model: HookedTracrTransformer = case.get_hl_model()
+    tl_model: HookedTracrTransformer = case.get_hl_model(copy=True)
     training_args, _ = ArgumentParser(TrainingArgs).parse_known_args(args.original_args)
 
     compressed_d_model_size = parse_d_model(args, tl_model)
@@ -8,6 +8,7 @@ from iit.model_pairs.ll_model import LLModel
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+from circuits_benchmark.benchmark.tracr_dataset import get_encoded_pad_token_id
 from circuits_benchmark.commands.common_args import add_common_args
 from circuits_benchmark.commands.train.compression.compression_training_utils import parse_d_model, parse_d_head
 from circuits_benchmark.metrics.iia import evaluate_iia_on_all_ablation_types
@@ -62,7 +63,7 @@ def setup_args_parser(subparsers):
 def train_non_linear_compression(case: BenchmarkCase, args: Namespace):
     """Compresses the residual stream of a Tracr model using a linear compression."""
     assert isinstance(case, TracrBenchmarkCase), "Only TracrBenchmarkCase is supported for autoencoder training."
-    hl_model: HookedTracrTransformer = case.get_hl_model()
+    hl_model: HookedTracrTransformer = case.get_hl_model(copy=True)
     original_d_model_size = hl_model.cfg.d_model
     original_d_head_size = hl_model.cfg.d_head
 
@@ -125,7 +126,8 @@ def train_non_linear_compression(case: BenchmarkCase, args: Namespace):
         f"compressed head size {compressed_d_head_size}:")
     print(final_metrics)
 
-    iia_eval_results = evaluate_iia_on_all_ablation_types(case, LLModel(model=hl_model), ll_model, trainer.test_dataset)
+    iia_eval_results = evaluate_iia_on_all_ablation_types(case, LLModel(model=hl_model), ll_model, trainer.test_dataset,
+                                                          pad_token_id=get_encoded_pad_token_id(hl_model))
     print(f" >>> IIA evaluation results:")
     for node_str, result in iia_eval_results.items():
         print(result)
@@ -16,6 +16,7 @@ from circuits_benchmark.commands.common_args import add_common_args
 from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformer
 from circuits_benchmark.utils.circuit.edges_list import circuit_to_edges_list
 from circuits_benchmark.utils.iit.iit_hl_model import IITHLModel
+from circuits_benchmark.utils.iit.streaming_iit_dataset import StreamingIITDataset
 
 
 def setup_args_parser(subparsers):
@@ -117,6 +118,25 @@ def setup_args_parser(subparsers):
         "--rand-architecture", action="store_true", help="Varies architecture when creating ll model"
     )
 
+    # HL model
+    parser.add_argument(
+        "--sparse-hl-model", action="store_true",
+        help="Run the forward passes of Tracr HL models with their weights in block-sparse form"
+    )
+    parser.add_argument(
+        "--pruned-hl-model", action="store_true",
+        help="Remove the dimensions of the residual stream of Tracr HL models that don't affect their output"
+    )
+
+    # data generation
+    parser.add_argument(
+        "--streaming-data", action="store_true",
+        help="Generate the training data in chunks while training instead of materializing it upfront"
+    )
+    parser.add_argument(
+        "--data-chunk-size", type=int, default=10_000, help="Number of samples per chunk when using --streaming-data"
+    )
+
 
 def config_is_bad(config):
     iit_weight = config.iit_weight
@@ -181,6 +201,10 @@ def run_iit_train(case: BenchmarkCase, args: Namespace):
                 "siit_sampling": {"values": [args.siit_sampling]},
                 "val_iia_sampling": {"values": [args.val_iia_sampling]},
                 "final_lr": {"values": [args.final_lr]},
+                "streaming_data": {"values": [args.streaming_data]},
+                "data_chunk_size": {"values": [args.data_chunk_size]},
+                "sparse_hl_model": {"values": [args.sparse_hl_model]},
+                "pruned_hl_model": {"values": [args.pruned_hl_model]},
             },
         }
         sweep_id = wandb.sweep(
@@ -218,7 +242,11 @@ def run_iit_train(case: BenchmarkCase, args: Namespace):
             "siit_sampling": args.siit_sampling,
             "val_iia_sampling": args.val_iia_sampling,
             "rand_correspondence": args.rand_correspondence,
-            "rand_architecture": args.rand_architecture
+            "rand_architecture": args.rand_architecture,
+            "streaming_data": args.streaming_data,
+            "data_chunk_size": args.data_chunk_size,
+            "sparse_hl_model": args.sparse_hl_model,
+            "pruned_hl_model": args.pruned_hl_model,
         }
 
         args = argparse.Namespace(**config)
@@ -311,8 +339,9 @@ def train_model(
     # GET LOW-LEVEL MODEL
     ll_model = case.get_ll_model(same_size=args.same_size, rand=args.rand_architecture, device=device)
 
-    hl_model = case.get_hl_model(device=device)
+    hl_model = case.get_hl_model(device=device, pruned=args.pruned_hl_model, copy=True)
     if isinstance(hl_model, HookedTracrTransformer):
+        hl_model.set_use_sparse_weights(args.sparse_hl_model)
         hl_model = IITHLModel(hl_model, eval_mode=False)
         hl_model.to(device)
 
@@ -332,12 +361,24 @@ def train_model(
     )
 
     # prepare iit datasets for training and testing
-    dataset = case.get_clean_data(min_samples=20000, max_samples=120_000, seed=args.seed)
-    train_dataset, test_dataset = train_test_split(
-        dataset, test_size=0.2, random_state=42
-    )
-    train_dataset = IITDataset(train_dataset, train_dataset, seed=args.seed, device=device)
-    test_dataset = IITDataset(test_dataset, test_dataset, seed=args.seed, device=device)
+    if args.streaming_data:
+        # Same amount of data and train/test split as the materialized datasets, with separate seeds for each split.
+        # Streamed data is always sampled with replacement, so cases with between 20k and 120k possible inputs get as
+        # many samples as inputs, but not every input exactly once as in the materialized datasets.
+        total_data_len = case.get_total_data_len()
+        n_samples = total_data_len if 20000 < total_data_len < 120_000 else 120_000
+        n_train_samples = int(n_samples * 0.8)
+        train_dataset = StreamingIITDataset(case, n_samples=n_train_samples, seed=args.seed,
+                                            chunk_size=args.data_chunk_size, device=device)
+        test_dataset = StreamingIITDataset(case, n_samples=n_samples - n_train_samples, seed=args.seed + 1,
+                                           chunk_size=args.data_chunk_size, device=device)
+    else:
+        dataset = case.get_clean_data(min_samples=20000, max_samples=120_000, seed=args.seed)
+        train_dataset, test_dataset = train_test_split(
+            dataset, test_size=0.2, random_state=42
+        )
+        train_dataset = IITDataset(train_dataset, train_dataset, seed=args.seed, device=device)
+        test_dataset = IITDataset(test_dataset, test_dataset, seed=args.seed, device=device)
 
     # train model
     print("Starting IIT training")
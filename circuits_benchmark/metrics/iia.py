@@ -12,6 +12,7 @@ from transformer_lens import ActivationCache
 from transformer_lens.hook_points import HookPoint
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
+from circuits_benchmark.metrics.pad_mask import get_non_pad_mask, masked_mean
 from circuits_benchmark.metrics.resampling_ablation_loss.intervention import regular_intervention_hook_fn
 from circuits_benchmark.utils.circuit.circuit_eval import get_full_circuit
 from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
@@ -44,7 +45,8 @@ def evaluate_iia_on_all_ablation_types(
     hypothesis_model: LLModel,
     data: IITDataset,
     iia_granularity: Optional[IIAGranularity] = "head",
-    accuracy_atol: Optional[float] = 1e-2):
+    accuracy_atol: Optional[float] = 1e-2,
+    pad_token_id: Optional[int] = None):
     iia_evaluation_results = {}
 
     data_loader = data.make_loader(batch_size=len(data), num_workers=0)
@@ -92,7 +94,8 @@ def evaluate_iia_on_all_ablation_types(
             hypothesis_model_clean_cache,
             iia_granularity=iia_granularity,
             ablation_type=ablation_type,
-            accuracy_atol=accuracy_atol
+            accuracy_atol=accuracy_atol,
+            pad_token_id=pad_token_id
         )
 
         for node_str, result_dict in results_by_node.items():
@@ -117,8 +120,10 @@ def evaluate_iia(case: BenchmarkCase,
                  hypothesis_model_clean_cache: ActivationCache,
                  iia_granularity: Optional[IIAGranularity] = "head",
                  ablation_type: Optional[AblationType] = "resample",
-                 accuracy_atol: Optional[float] = 1e-2) -> Dict[str, Dict[str, float]]:
-    """Run Interchange Intervention Accuracy to measure if a hypothesis model has the same circuit as a base model."""
+                 accuracy_atol: Optional[float] = 1e-2,
+                 pad_token_id: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+    """Run Interchange Intervention Accuracy to measure if a hypothesis model has the same circuit as a base model.
+    If the PAD token id is given, PAD positions of the clean inputs are left out of the metrics."""
     print(f"Running IIA evaluation for case {case.get_name()} using ablation type \"{ablation_type}\".")
     full_circuit = get_full_circuit(base_model.cfg.n_layers, base_model.cfg.n_heads)
 
@@ -162,6 +167,7 @@ def evaluate_iia(case: BenchmarkCase,
         hypothesis_model_original_logits = hypothesis_model_original_logits[:, 1:]
         base_model_intervened_logits = base_model_intervened_logits[:, 1:]
         hypothesis_model_intervened_logits = hypothesis_model_intervened_logits[:, 1:]
+        non_pad_mask = get_non_pad_mask(clean_inputs, pad_token_id)[:, 1:]
 
         # compare the outputs of the two models
         if base_model.is_categorical():
@@ -183,21 +189,23 @@ def evaluate_iia(case: BenchmarkCase,
                                                                               dim=-1)
 
             # calculate kl divergence between intervened logits
-            kl_div = t.nn.functional.kl_div(
+            kl_div = masked_mean(t.nn.functional.kl_div(
                 hypothesis_model_intervened_logits,  # the output of our model
                 base_model_intervened_logits,  # the target distribution
                 reduction="none",
                 log_target=True  # because we already applied log_softmax to the base_model_logits
-            ).sum(dim=-1).mean().item()
+            ).sum(dim=-1), non_pad_mask).item()
 
             # calculate accuracy, checking for each input in batch dimension if all labels are the same across positions
             same_outputs_between_both_models_after_intervention = (
-                    base_intervened_labels == hypothesis_intervened_labels).all(dim=-1).float()
+                    (base_intervened_labels == hypothesis_intervened_labels) | ~non_pad_mask).all(dim=-1).float()
             accuracy = same_outputs_between_both_models_after_intervention.mean().item()
 
             # calculate effect of node on the output: how many labels change between the intervened and non-intervened models
-            base_model_effect = (base_original_labels != base_intervened_labels).float().mean().item()
-            hypothesis_model_effect = (hypothesis_original_labels != hypothesis_intervened_labels).float().mean().item()
+            base_model_effect = masked_mean((base_original_labels != base_intervened_labels).float(),
+                                            non_pad_mask).item()
+            hypothesis_model_effect = masked_mean((hypothesis_original_labels != hypothesis_intervened_labels).float(),
+                                                  non_pad_mask).item()
 
             results_by_node[node_str] = {
                 "kl_div": kl_div,
@@ -211,12 +219,13 @@ def evaluate_iia(case: BenchmarkCase,
             same_outputs_between_both_models_after_intervention = t.isclose(base_model_intervened_logits,
                                                                             hypothesis_model_intervened_logits,
                                                                             atol=accuracy_atol).float()
-            accuracy = same_outputs_between_both_models_after_intervention.mean().item()
+            accuracy = masked_mean(same_outputs_between_both_models_after_intervention, non_pad_mask).item()
 
             # calculate effect of node on the output: how much change there is between the intervened and non-intervened models
-            base_model_effect = t.abs(base_model_original_logits - base_model_intervened_logits).mean().item()
-            hypothesis_model_effect = t.abs(
-                hypothesis_model_original_logits - hypothesis_model_intervened_logits).mean().item()
+            base_model_effect = masked_mean(t.abs(base_model_original_logits - base_model_intervened_logits),
+                                            non_pad_mask).item()
+            hypothesis_model_effect = masked_mean(t.abs(
+                hypothesis_model_original_logits - hypothesis_model_intervened_logits), non_pad_mask).item()
 
             results_by_node[node_str] = {
                 "accuracy": accuracy,
@@ -0,0 +1,16 @@
+import torch as t
+from torch import Tensor
+
+
+def get_non_pad_mask(inputs: Tensor, pad_token_id: int | None) -> Tensor:
+    """Returns which positions of the encoded inputs are not PAD (all of them, if there is no PAD token)."""
+    if pad_token_id is None:
+        return t.ones(inputs.shape[:2], dtype=t.bool, device=inputs.device)
+    return inputs != pad_token_id
+
+
+def masked_mean(values: Tensor, mask: Tensor) -> Tensor:
+    """Averages the values of the positions selected by the mask. The mask covers the first dimensions of the values
+    (e.g., batch and position), and the remaining ones are averaged as well."""
+    mask = mask.reshape(*mask.shape, *([1] * (values.ndim - mask.ndim))).expand_as(values)
+    return values[mask].mean()
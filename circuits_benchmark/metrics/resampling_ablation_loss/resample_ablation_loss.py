@@ -8,7 +8,8 @@ from jaxtyping import Float, Int
 from torch import Tensor
 from transformer_lens import HookedTransformer, ActivationCache
 
-from circuits_benchmark.benchmark.tracr_dataset import TracrDataset
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset, make_paired_loaders
+from circuits_benchmark.metrics.pad_mask import get_non_pad_mask, masked_mean
 from circuits_benchmark.metrics.resampling_ablation_loss.intervention import InterventionData
 from circuits_benchmark.metrics.resampling_ablation_loss.resample_ablation_interventions import get_interventions
 from circuits_benchmark.training.compression.activation_mapper.activation_mapper import ActivationMapper
@@ -38,7 +39,10 @@ def get_resample_ablation_loss(data: IITDatasetBatch,
                                use_node_effect_diff: bool = False,
                                effect_diffs_by_node: Optional[Dict[str, float]] = None,
                                verbose: bool = False,
+                               pad_token_id: int | None = None,
                                ) -> ResampleAblationLossOutput:
+    """Calculates the loss between the outputs of the base and hypothesis models when resampling their activations
+    with the corrupted data. If the PAD token id is given, PAD positions of the clean inputs are left out of the loss."""
     # This is a memory intensive operation, so we will garbage collect before starting.
     gc.collect()
     t.cuda.empty_cache()
@@ -81,7 +85,11 @@ def get_resample_ablation_loss(data: IITDatasetBatch,
     )
 
     # Calculate the variance of the base model logits.
-    base_model_logits_variance = base_model(clean_inputs).var().item()
+    non_pad_mask = get_non_pad_mask(clean_inputs, pad_token_id)
+    base_model_logits_variance = base_model(clean_inputs)[non_pad_mask].var().item()
+
+    # positions used in the loss, which discards BOS like the logits below
+    non_pad_mask = non_pad_mask[:, 1:]
 
     # for each intervention, run both models, calculate MSE and add it to the losses.
     losses = []
@@ -134,16 +142,18 @@ def get_resample_ablation_loss(data: IITDatasetBatch,
                 hypothesis_model_intervened_logits = t.nn.functional.log_softmax(hypothesis_model_intervened_logits,
                                                                                  dim=-1)
 
-                base_model_effect = t.nn.functional.mse_loss(base_model_clean_logits, base_model_intervened_logits)
-                hypothesis_model_effect = t.nn.functional.mse_loss(hypothesis_model_clean_logits,
-                                                                   hypothesis_model_intervened_logits)
+                base_model_effect = masked_mean((base_model_clean_logits - base_model_intervened_logits) ** 2,
+                                                non_pad_mask)
+                hypothesis_model_effect = masked_mean(
+                    (hypothesis_model_clean_logits - hypothesis_model_intervened_logits) ** 2, non_pad_mask)
 
                 intervention_loss = t.abs(base_model_effect - hypothesis_model_effect)
 
             else:
-                base_model_effect = t.nn.functional.mse_loss(base_model_clean_logits, base_model_intervened_logits)
-                hypothesis_model_effect = t.nn.functional.mse_loss(hypothesis_model_clean_logits,
-                                                                   hypothesis_model_intervened_logits)
+                base_model_effect = masked_mean((base_model_clean_logits - base_model_intervened_logits) ** 2,
+                                                non_pad_mask)
+                hypothesis_model_effect = masked_mean(
+                    (hypothesis_model_clean_logits - hypothesis_model_intervened_logits) ** 2, non_pad_mask)
                 intervention_loss = t.abs(base_model_effect - hypothesis_model_effect)
 
         else:
@@ -151,15 +161,15 @@ def get_resample_ablation_loss(data: IITDatasetBatch,
             if is_categorical:
                 # Use Cross Entropy loss for categorical outputs.
                 flattened_intervened_logits: Float[
-                    Tensor, "batch*pos, vocab_out"] = hypothesis_model_intervened_logits.flatten(end_dim=-2)
-                flattened_intervened_expected_labels: Int[Tensor, "batch*pos"] = base_model_intervened_logits.argmax(
-                    dim=-1).flatten()
+                    Tensor, "batch*pos, vocab_out"] = hypothesis_model_intervened_logits[non_pad_mask]
+                flattened_intervened_expected_labels: Int[Tensor, "batch*pos"] = base_model_intervened_logits[
+                    non_pad_mask].argmax(dim=-1)
                 intervention_loss = t.nn.functional.cross_entropy(flattened_intervened_logits,
                                                                   flattened_intervened_expected_labels)
             else:
                 # Use MSE loss for numerical outputs.
-                intervention_loss = t.nn.functional.mse_loss(base_model_intervened_logits,
-                                                             hypothesis_model_intervened_logits)
+                intervention_loss = masked_mean((base_model_intervened_logits - hypothesis_model_intervened_logits) ** 2,
+                                                non_pad_mask)
 
         var_explained = 1 - intervention_loss / base_model_logits_variance
 
@@ -193,19 +203,23 @@ def get_resample_ablation_loss(data: IITDatasetBatch,
 
 
 def get_batched_intervention_data(
-    clean_data: TracrDataset,
-    corrupted_data: TracrDataset,
+    clean_data: TracrEncodedDataset,
+    corrupted_data: TracrEncodedDataset,
     base_model: HookedTransformer,
     hypothesis_model: HookedTransformer,
     activation_mapper: MultiHookActivationMapper | ActivationMapper | None = None,
     batch_size: int = 2048,
     hypothesis_model_corrupted_cache: ActivationCache | None = None,
 ) -> List[InterventionData]:
+    """Runs the clean and corrupted data on both models in batches. Datasets of causal models are bucketed by length,
+    so each batch is trimmed to its longest sequence (see make_paired_loaders)."""
     data = []
     batches_count = 0
 
-    for clean_data_batch, corrupted_data_batch in zip(clean_data.make_loader(batch_size),
-                                                      corrupted_data.make_loader(batch_size)):
+    clean_loader, corrupted_loader = make_paired_loaders(clean_data, corrupted_data, batch_size,
+                                                         device=base_model.cfg.device,
+                                                         bucket_by_length=clean_data.causal and corrupted_data.causal)
+    for clean_data_batch, corrupted_data_batch in zip(clean_loader, corrupted_loader):
         batches_count += 1
         clean_inputs_batch = clean_data_batch[0]
         corrupted_inputs_batch = corrupted_data_batch[0]
@@ -7,6 +7,7 @@ from torch import Tensor
 from torch.nn import Parameter
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
+from circuits_benchmark.benchmark.tracr_dataset import get_encoded_pad_token_id
 from circuits_benchmark.metrics.resampling_ablation_loss.resample_ablation_loss import \
     get_resample_ablation_loss
 from circuits_benchmark.training.compression.compressed_tracr_transformer_trainer import \
@@ -127,6 +128,7 @@ class CausallyCompressedTracrTransformerTrainer(CompressedTracrTransformerTraine
             "max_interventions": self.args.resample_ablation_max_interventions,
             "max_components": self.args.resample_ablation_max_components,
             "is_categorical": self.is_categorical,
+            "pad_token_id": get_encoded_pad_token_id(self.case.get_hl_model()),
         }
 
         activation_mapper = self.get_activation_mapper()
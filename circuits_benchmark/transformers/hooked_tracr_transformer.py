@@ -1,20 +1,28 @@
 from __future__ import annotations
 
-from typing import List, Literal, Any, Union, Callable, Optional, Dict
+import itertools
+from typing import List, Literal, Any, Union, Callable, Optional, Dict, Tuple, TYPE_CHECKING
 
 import einops
-import jax.numpy as jnp
 import numpy as np
 import torch as t
 from jaxtyping import Float
 from torch import Tensor
-from tracr.compiler.assemble import AssembledTransformerModel
 from tracr.craft import vectorspace_fns
 from tracr.craft.bases import BasisDirection, VectorSpaceWithBasis
 from tracr.transformer.encoder import CategoricalEncoder, Encoder
 from transformer_lens import HookedTransformerConfig, HookedTransformer
+from transformer_lens.components import Attention, MLP
 
 from circuits_benchmark.benchmark.tracr_dataset import TracrBatchInput
+from circuits_benchmark.transformers.sparse_components import SparseAttention, SparseMLP
+from circuits_benchmark.utils.atomic_write import atomic_write
+
+if TYPE_CHECKING:
+    # Only needed for type hints. Importing them at runtime would pull in JAX and Haiku, which we want to avoid when
+    # loading precompiled models.
+    import jax.numpy as jnp
+    from tracr.compiler.assemble import AssembledTransformerModel
 
 HookedTracrTransformerBatchInput = TracrBatchInput | np.ndarray
 HookedTracrTransformerReturnType = Literal["logits", "decoded"]
@@ -38,6 +46,12 @@ class HookedTracrTransformer(HookedTransformer):
         self.residual_stream_labels = residual_stream_labels
         self.normalize_output = False
 
+        # Lookup tables for encoding and decoding whole batches at once, equivalent to the tracr encoders. They are only
+        # available for categorical encoders, numerical ones don't change the values.
+        self.input_vocab = get_vocab_by_id(tracr_input_encoder)
+        self.input_id_by_value = get_id_by_value(tracr_input_encoder)
+        self.output_vocab = get_vocab_by_id(tracr_output_encoder)
+
         if "use_hook_mlp_in" in self.cfg.to_dict():  # Tracr models always include MLPs
             self.set_use_hook_mlp_in(True)
 
@@ -94,6 +108,132 @@ class HookedTracrTransformer(HookedTransformer):
 
         return instance
 
+    @classmethod
+    def from_precompiled(cls,
+                         path: str,
+                         device: t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu"),
+                         *args, **kwargs) -> HookedTracrTransformer:
+        """
+        Initialize a HookedTracrTransformer from a file written by save_precompiled. Unlike from_tracr_model, this does
+        not need the Tracr compiler, so neither JAX nor Haiku are imported.
+        """
+        artifact = t.load(path, map_location=device, weights_only=False)
+        return cls.from_precompiled_artifact(artifact, device, *args, **kwargs)
+
+    @classmethod
+    def from_precompiled_artifact(cls,
+                                  artifact: Dict[str, Any],
+                                  device: t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu"),
+                                  *args, **kwargs) -> HookedTracrTransformer:
+        """Initialize a HookedTracrTransformer from the contents of a precompiled model (see get_precompiled_artifact).
+        """
+        cfg = HookedTransformerConfig.from_dict(artifact["cfg"])
+        cfg.device = device
+
+        instance = cls(cfg,
+                       artifact["tracr_input_encoder"],
+                       artifact["tracr_output_encoder"],
+                       artifact["residual_stream_labels"],
+                       *args, **kwargs)
+        instance.load_state_dict(artifact["state_dict"])
+
+        return instance
+
+    def save_precompiled(self, path: str) -> None:
+        """Saves the weights, config, encoders and residual stream labels, so that the model can be loaded back with
+        from_precompiled. The file is written atomically."""
+        with atomic_write(path) as f:
+            t.save(self.get_precompiled_artifact(), f)
+
+    def get_precompiled_artifact(self) -> Dict[str, Any]:
+        """Returns the weights (on CPU), config, encoders and residual stream labels of the model."""
+        cfg_dict = self.cfg.to_dict().copy()
+        cfg_dict["device"] = None
+
+        return {
+            "cfg": cfg_dict,
+            "state_dict": {k: v.cpu() for k, v in self.state_dict().items()},
+            "tracr_input_encoder": self.tracr_input_encoder,
+            "tracr_output_encoder": self.tracr_output_encoder,
+            "residual_stream_labels": self.residual_stream_labels,
+        }
+
+    def set_use_sparse_weights(self, use_sparse_weights: bool) -> None:
+        """Toggles whether attention and MLP layers multiply by their weights in block-sparse form (see SparseAttention
+        and SparseMLP). Tracr-compiled weights are mostly zeros, so this makes forward passes cheaper for models with
+        a wide residual stream (see the sparse_hl evaluation for the speedup of each case), while computing the same
+        activations through the same hook points.
+        This is only meant for inference: the sparse weights are copies of the current weights, so they don't receive
+        gradients, and this needs to be called again (with True) after the weights change."""
+        # The class of the existing layers is swapped instead of replacing them, so that their parameters and hook
+        # points (and any hooks already added to them) are kept.
+        for block in self.blocks:
+            if use_sparse_weights:
+                block.attn.__class__ = SparseAttention
+                block.attn.build_sparse_weights()
+                block.mlp.__class__ = SparseMLP
+                block.mlp.build_sparse_weights()
+            elif isinstance(block.attn, SparseAttention):
+                block.attn.clear_sparse_weights()
+                block.attn.__class__ = Attention
+                block.mlp.clear_sparse_weights()
+                block.mlp.__class__ = MLP
+
+    def uses_sparse_weights(self) -> bool:
+        return len(self.blocks) > 0 and isinstance(self.blocks[0].attn, SparseAttention)
+
+    def get_live_residual_dims(self) -> List[int]:
+        """Returns the indices of the dimensions of the residual stream that are read (by a component or by the unembed)
+        after being written (by the embeddings or by a component). Tracr allocates a dimension for each value of each
+        SOp, but many of them are written and never read downstream, so the rest of the dimensions have no effect on the
+        output of the model."""
+        assert self.cfg.normalization_type is None, "Models with layer norm read all the dimensions of the residual stream"
+
+        def nonzero_rows(w: Tensor) -> Tensor:
+            return (w != 0).reshape(w.shape[0], -1).any(dim=1)
+
+        with t.no_grad():
+            written = nonzero_rows(self.embed.W_E.T) | nonzero_rows(self.pos_embed.W_pos.T)
+            live = t.zeros_like(written)
+            for block in self.blocks:
+                attn_reads = nonzero_rows(t.cat([block.attn.W_Q, block.attn.W_K, block.attn.W_V]).transpose(0, 1))
+                live |= attn_reads & written
+                written |= nonzero_rows(block.attn.W_O.permute(2, 0, 1)) | (block.attn.b_O != 0)
+
+                live |= nonzero_rows(block.mlp.W_in) & written
+                written |= nonzero_rows(block.mlp.W_out.T) | (block.mlp.b_out != 0)
+
+            live |= nonzero_rows(self.unembed.W_U) & written
+
+        return live.nonzero()[:, 0].tolist()
+
+    def prune_residual_stream(self) -> Tuple[HookedTracrTransformer, Dict[str, int]]:
+        """Returns an equivalent model whose residual stream only has the live dimensions of this one (see
+        get_live_residual_dims), so that forward passes and activation caches are smaller. Hook names, attention heads
+        and MLP neurons are the same. Also returns the index in this model of each residual stream label that was
+        retained (the labels of the returned model are the retained ones, in the same order)."""
+        live_dims = self.get_live_residual_dims()
+        index = t.tensor(live_dims, dtype=t.long, device=self.embed.W_E.device)
+
+        cfg_dict = self.cfg.to_dict().copy()
+        cfg_dict["d_model"] = len(live_dims)
+        cfg = HookedTransformerConfig.from_dict(cfg_dict)
+
+        residual_stream_labels = [self.residual_stream_labels[i] for i in live_dims]
+        pruned_model = HookedTracrTransformer(cfg, self.tracr_input_encoder, self.tracr_output_encoder,
+                                              residual_stream_labels)
+
+        # Dimension of each weight that indexes the residual stream
+        residual_dims = {"embed.W_E": 1, "pos_embed.W_pos": 1, "attn.W_Q": 1, "attn.W_K": 1, "attn.W_V": 1,
+                         "attn.W_O": 2, "attn.b_O": 0, "mlp.W_in": 0, "mlp.W_out": 1, "mlp.b_out": 0, "unembed.W_U": 0}
+        state_dict = {}
+        for name, value in self.state_dict().items():
+            suffix = ".".join(name.split(".")[-2:])
+            state_dict[name] = value.index_select(residual_dims[suffix], index) if suffix in residual_dims else value
+        pruned_model.load_state_dict(state_dict)
+
+        return pruned_model, {label: i for label, i in zip(residual_stream_labels, live_dims)}
+
     def load_weights_from_file(self, path: str):
         """Loads the transformer weights from file."""
         self.load_state_dict(t.load(path, map_location=self.device))
@@ -141,8 +281,32 @@ class HookedTracrTransformer(HookedTransformer):
 
     def map_tracr_input_to_tl_input(self, batch_input: HookedTracrTransformerBatchInput) -> t.Tensor:
         """Maps a tracr input to a transformer_lens input."""
-        encoding = [self.tracr_input_encoder.encode(input) for input in batch_input]
-        return t.tensor(encoding)
+        if self.input_id_by_value is None or len(batch_input) == 0:
+            encoding = [self.tracr_input_encoder.encode(input) for input in batch_input]
+            return t.tensor(encoding)
+
+        # Look up all the values at once instead of calling the tracr encoder for each sequence. The lookup goes through
+        # a dict, as the encoder does, so values that compare equal (e.g., 1 and 1.0) get the same id.
+        if isinstance(batch_input, np.ndarray):
+            values = batch_input.ravel()
+            seq_len = batch_input.shape[-1]
+        else:
+            values = list(itertools.chain.from_iterable(batch_input))
+            seq_len = len(batch_input[0])
+            assert len(values) == seq_len * len(batch_input), "All sequences in the batch must have the same length"
+
+        try:
+            encoding = np.fromiter(map(self.input_id_by_value.__getitem__, values), dtype=np.int64, count=len(values))
+        except KeyError as e:
+            raise ValueError(f"Inputs {e} not found in encoding {self.tracr_input_encoder.encoding_map.keys()}")
+        encoding = encoding.reshape(-1, seq_len)
+
+        bos_id = self.input_id_by_value[self.tracr_input_encoder.bos_token]
+        if getattr(self.tracr_input_encoder, "enforce_bos", False) and not (encoding[:, 0] == bos_id).all():
+            raise ValueError("First input token must be BOS token. Got " +
+                             f"{self.input_vocab[encoding[encoding[:, 0] != bos_id][0, 0]]}.")
+
+        return t.from_numpy(encoding)
 
     def map_tl_output_to_tracr_output(self, logits: t.Tensor) -> HookedTracrTransformerBatchInput:
         """Maps a transformer_lens output to a tracr output."""
@@ -154,23 +318,28 @@ class HookedTracrTransformer(HookedTransformer):
         # The output has unspecified behavior for the BOS token, so we remove it and add it back in after decoding.
         bos_token = self.tracr_input_encoder.bos_token
         logits = logits[:, 1:]
-        decoded_output_with_bos = [[bos_token] + self.tracr_output_encoder.decode(output)
-                                   for output in logits.tolist()]
 
-        return decoded_output_with_bos
+        if self.output_vocab is None:
+            # numerical outputs are decoded as they are
+            return [[bos_token] + output for output in logits.tolist()]
+
+        decoded_output_with_bos = np.empty((logits.shape[0], logits.shape[1] + 1), dtype=object)
+        decoded_output_with_bos[:, 0] = bos_token
+        decoded_output_with_bos[:, 1:] = self.output_vocab[logits.cpu().numpy()]
+
+        return decoded_output_with_bos.tolist()
 
     def load_weights_from_tracr_model(self, tracr_model: AssembledTransformerModel) -> None:
         """Loads the weights from a tracr model into the transformer_lens model."""
         self.load_tracr_state_dict(self.extract_tracr_state_dict(tracr_model))
 
-    def load_tracr_state_dict(self, sd: dict[str, np.ndarray | jnp.ndarray]) -> None:
+    def load_tracr_state_dict(self, sd: dict[str, np.ndarray | jnp.ndarray | Tensor]) -> None:
         """Creates a transformer_lens model from a config and state dict."""
 
-        # Convert weights to tensors and load into the tl_model
-        for k, v in sd.items():
-            # Map Jax array to numpy array
-            sd[k] = t.tensor(np.array(v)).to(self.device)
-
+        # Weights are converted to tensors that share memory with the original arrays. load_state_dict then copies each
+        # of them straight into the corresponding parameter (casting and moving it to the model's device on the way), so
+        # no intermediate copies are materialized on the host or on the device.
+        sd = {k: array_to_tensor(v) for k, v in sd.items()}
         self.load_state_dict(sd, strict=False)
 
     @classmethod
@@ -213,66 +382,71 @@ class HookedTracrTransformer(HookedTransformer):
             # device=device,
         )
 
-    def extract_tracr_state_dict(self, model: AssembledTransformerModel) -> dict[str, np.ndarray | jnp.ndarray]:
-        """Extracts the state dict of a tracr model into a dict."""
+    def extract_tracr_state_dict(self, model: AssembledTransformerModel) -> dict[str, Tensor]:
+        """Extracts the state dict of a tracr model into a dict.
+        The returned tensors are views of the tracr params whenever possible (the rearrangements below only reshape and
+        permute dimensions), so the weights are not copied until they are loaded into the model."""
+        params = {module: {name: array_to_tensor(value) for name, value in module_params.items()}
+                  for module, module_params in model.params.items()}
+
         sd = {}
-        sd["pos_embed.W_pos"] = model.params["pos_embed"]['embeddings']
-        sd["embed.W_E"] = model.params["token_embed"]['embeddings']
+        sd["pos_embed.W_pos"] = params["pos_embed"]['embeddings']
+        sd["embed.W_E"] = params["token_embed"]['embeddings']
 
         # fetch output space and project residual space onto it to get the unembed matrix
         residual_space = self.get_tracr_model_residual_space(model)
         output_space = self.get_tracr_model_output_space(model)
-        sd["unembed.W_U"] = vectorspace_fns.project(residual_space, output_space).matrix
+        sd["unembed.W_U"] = array_to_tensor(vectorspace_fns.project(residual_space, output_space).matrix)
 
         for l in range(self.cfg.n_layers):
             sd[f"blocks.{l}.attn.W_K"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/key"]["w"],
+                params[f"transformer/layer_{l}/attn/key"]["w"],
                 "d_model (n_heads d_head) -> n_heads d_model d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.b_K"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/key"]["b"],
+                params[f"transformer/layer_{l}/attn/key"]["b"],
                 "(n_heads d_head) -> n_heads d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.W_Q"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/query"]["w"],
+                params[f"transformer/layer_{l}/attn/query"]["w"],
                 "d_model (n_heads d_head) -> n_heads d_model d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.b_Q"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/query"]["b"],
+                params[f"transformer/layer_{l}/attn/query"]["b"],
                 "(n_heads d_head) -> n_heads d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.W_V"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/value"]["w"],
+                params[f"transformer/layer_{l}/attn/value"]["w"],
                 "d_model (n_heads d_head) -> n_heads d_model d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.b_V"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/value"]["b"],
+                params[f"transformer/layer_{l}/attn/value"]["b"],
                 "(n_heads d_head) -> n_heads d_head",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
             sd[f"blocks.{l}.attn.W_O"] = einops.rearrange(
-                model.params[f"transformer/layer_{l}/attn/linear"]["w"],
+                params[f"transformer/layer_{l}/attn/linear"]["w"],
                 "(n_heads d_head) d_model -> n_heads d_head d_model",
                 d_head=self.cfg.d_head,
                 n_heads=self.cfg.n_heads
             )
-            sd[f"blocks.{l}.attn.b_O"] = model.params[f"transformer/layer_{l}/attn/linear"]["b"]
+            sd[f"blocks.{l}.attn.b_O"] = params[f"transformer/layer_{l}/attn/linear"]["b"]
 
-            sd[f"blocks.{l}.mlp.W_in"] = model.params[f"transformer/layer_{l}/mlp/linear_1"]["w"]
-            sd[f"blocks.{l}.mlp.b_in"] = model.params[f"transformer/layer_{l}/mlp/linear_1"]["b"]
-            sd[f"blocks.{l}.mlp.W_out"] = model.params[f"transformer/layer_{l}/mlp/linear_2"]["w"]
-            sd[f"blocks.{l}.mlp.b_out"] = model.params[f"transformer/layer_{l}/mlp/linear_2"]["b"]
+            sd[f"blocks.{l}.mlp.W_in"] = params[f"transformer/layer_{l}/mlp/linear_1"]["w"]
+            sd[f"blocks.{l}.mlp.b_in"] = params[f"transformer/layer_{l}/mlp/linear_1"]["b"]
+            sd[f"blocks.{l}.mlp.W_out"] = params[f"transformer/layer_{l}/mlp/linear_2"]["w"]
+            sd[f"blocks.{l}.mlp.b_out"] = params[f"transformer/layer_{l}/mlp/linear_2"]["b"]
 
         return sd
 
@@ -329,3 +503,42 @@ class HookedTracrTransformer(HookedTransformer):
            print_details: bool = True):
         """Moves the model to a device and updates the device in the config."""
         return super().to(device_or_dtype, print_details=print_details)
+
+
+def array_to_tensor(array: np.ndarray | jnp.ndarray | Tensor) -> Tensor:
+    """Converts a numpy or JAX array to a tensor that shares its memory whenever dtype and layout allow it (via
+    torch.from_numpy or DLPack), falling back to a copy otherwise."""
+    if isinstance(array, Tensor):
+        return array
+
+    if isinstance(array, np.ndarray):
+        if array.flags.writeable and array.dtype != object and all(stride >= 0 for stride in array.strides):
+            return t.from_numpy(array)
+        return t.tensor(np.array(array))
+
+    try:
+        # JAX arrays implement the DLPack protocol
+        return t.from_dlpack(array)
+    except (TypeError, RuntimeError, BufferError, AttributeError):
+        return t.tensor(np.array(array))
+
+
+def get_vocab_by_id(encoder: Encoder) -> np.ndarray | None:
+    """Returns an object array with the value encoded by each id of a categorical encoder, or None for other encoders.
+    """
+    if not isinstance(encoder, CategoricalEncoder):
+        return None
+
+    vocab = np.empty(max(encoder.encoding_map.values()) + 1, dtype=object)
+    for value, token_id in encoder.encoding_map.items():
+        vocab[token_id] = value
+
+    return vocab
+
+
+def get_id_by_value(encoder: Encoder) -> Dict[Any, int] | None:
+    """Returns the id of each value of a categorical encoder, or None for other encoders."""
+    if not isinstance(encoder, CategoricalEncoder):
+        return None
+
+    return dict(encoder.encoding_map)
@@ -0,0 +1,148 @@
+from typing import Optional
+
+import torch as t
+import torch.nn.functional as F
+from jaxtyping import Float, Int
+from torch import nn, Tensor
+from transformer_lens.components import Attention, MLP
+from transformer_lens.past_key_value_caching import HookedTransformerKeyValueCacheEntry
+
+
+class BlockSparseMatrix(nn.Module):
+    """A matrix stored as the dense block formed by its nonzero rows and columns. Multiplying by it only reads the
+    nonzero rows of the input and only computes the nonzero columns of the output, which is much cheaper than a dense
+    matmul for Tracr-compiled weights: each component reads and writes just a few directions of the residual stream, so
+    its weights are zero outside of a small block. Unlike unstructured sparse formats (e.g., CSR), the block is
+    multiplied with a regular dense kernel.
+    The block is a copy of the matrix, stored as a non-persistent buffer: it moves along with the model, but it is not
+    part of the state dict and it does not receive gradients."""
+
+    def __init__(self, matrix: Float[Tensor, "n_rows n_cols"]):
+        super().__init__()
+        matrix = matrix.detach()
+        nonzero = matrix != 0
+        rows = nonzero.any(dim=1).nonzero()[:, 0]
+        cols = nonzero.any(dim=0).nonzero()[:, 0]
+
+        self.n_rows, self.n_cols = matrix.shape
+        self.register_buffer("rows", rows, persistent=False)
+        self.register_buffer("cols", cols, persistent=False)
+        self.register_buffer("block", matrix[rows][:, cols].contiguous(), persistent=False)
+
+    def forward(self, x: Float[Tensor, "... n_rows"], bias: Optional[Float[Tensor, "n_cols"]] = None
+                ) -> Float[Tensor, "... n_cols"]:
+        """Returns x @ matrix (+ bias)."""
+        if bias is None:
+            output = x.new_zeros(*x.shape[:-1], self.n_cols)
+        else:
+            output = bias.expand(*x.shape[:-1], self.n_cols).contiguous()
+        return self.accumulate(x, output)
+
+    def accumulate(self, x: Float[Tensor, "... n_rows"], output: Float[Tensor, "... n_cols"]
+                   ) -> Float[Tensor, "... n_cols"]:
+        """Adds x @ matrix to output, in place. Output can be a view, e.g. the slice of a head in a larger tensor."""
+        return output.index_add_(-1, self.cols, x.index_select(-1, self.rows) @ self.block)
+
+    def density(self) -> float:
+        """Fraction of the entries of the matrix that are in the block."""
+        return self.block.numel() / (self.n_rows * self.n_cols)
+
+
+class SparseAttention(Attention):
+    """Attention layer that multiplies by the weights of each head in block-sparse form (see BlockSparseMatrix). It
+    computes the same activations as Attention, through the same hook points, so hooks keep working.
+    This is meant for inference on models whose weights are fixed: the sparse weights are copies built by
+    build_sparse_weights, which needs to be called again whenever the weights change."""
+
+    def build_sparse_weights(self) -> None:
+        assert self.cfg.positional_embedding_type in ["standard", "shortformer"] and not self.cfg.load_in_4bit, \
+            "Sparse weights are not supported for rotary or alibi positional embeddings, nor 4-bit weights"
+
+        self.W_Q_sparse = nn.ModuleList([BlockSparseMatrix(w) for w in self.W_Q])
+        self.W_K_sparse = nn.ModuleList([BlockSparseMatrix(w) for w in self.W_K])
+        self.W_V_sparse = nn.ModuleList([BlockSparseMatrix(w) for w in self.W_V])
+        self.W_O_sparse = nn.ModuleList([BlockSparseMatrix(w) for w in self.W_O])
+
+    def clear_sparse_weights(self) -> None:
+        del self.W_Q_sparse, self.W_K_sparse, self.W_V_sparse, self.W_O_sparse
+
+    def forward(
+        self,
+        query_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        key_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        value_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        past_kv_cache_entry: Optional[HookedTransformerKeyValueCacheEntry] = None,
+        additive_attention_mask: Optional[Float[Tensor, "batch 1 1 pos"]] = None,
+        attention_mask: Optional[Int[Tensor, "batch offset_pos"]] = None,
+    ) -> Float[Tensor, "batch pos d_model"]:
+        """Same as Attention.forward, for the configurations supported by build_sparse_weights."""
+        q, k, v = self.calculate_qkv_matrices(query_input, key_input, value_input)
+
+        if past_kv_cache_entry is not None:
+            kv_cache_pos_offset = past_kv_cache_entry.past_keys.size(1)
+            k, v = past_kv_cache_entry.append(k, v)
+        else:
+            kv_cache_pos_offset = 0
+
+        attn_scores = self.calculate_attention_scores(q, k)  # [batch, head_index, query_pos, key_pos]
+        if self.cfg.attention_dir == "causal":
+            attn_scores = self.apply_causal_mask(attn_scores, kv_cache_pos_offset, attention_mask)
+        if additive_attention_mask is not None:
+            attn_scores += additive_attention_mask
+
+        attn_scores = self.hook_attn_scores(attn_scores)
+        pattern = F.softmax(attn_scores, dim=-1)
+        pattern = t.where(t.isnan(pattern), t.zeros_like(pattern), pattern)
+        pattern = self.hook_pattern(pattern)  # [batch, head_index, query_pos, key_pos]
+        pattern = pattern.to(self.cfg.dtype).to(v.device)
+        z = self.calculate_z_scores(v, pattern)  # [batch, pos, head_index, d_head]
+
+        result = z.new_zeros(*z.shape[:3], self.cfg.d_model)
+        for head, w_o in enumerate(self.W_O_sparse):
+            w_o.accumulate(z[:, :, head], result[:, :, head])
+        if self.cfg.use_attn_result:
+            result = self.hook_result(result)  # [batch, pos, head_index, d_model]
+
+        return result.sum(dim=2) + self.b_O  # [batch, pos, d_model]
+
+    def calculate_qkv_matrices(
+        self,
+        query_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        key_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        value_input: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+    ):
+        q = self.hook_q(self.apply_head_weights(self.W_Q_sparse, query_input, self.b_Q))
+        k = self.hook_k(self.apply_head_weights(self.W_K_sparse, key_input, self.b_K))
+        v = self.hook_v(self.apply_head_weights(self.W_V_sparse, value_input, self.b_V))
+        return q, k, v  # [batch, pos, head_index, d_head]
+
+    @staticmethod
+    def apply_head_weights(
+        weights: nn.ModuleList,
+        x: Float[Tensor, "batch pos d_model"] | Float[Tensor, "batch pos head_index d_model"],
+        bias: Float[Tensor, "head_index d_head"]
+    ) -> Float[Tensor, "batch pos head_index d_head"]:
+        """Multiplies the input of each head by its weights and adds the bias. The input is either shared by all heads,
+        or split (when using use_split_qkv_input or use_attn_in)."""
+        output = bias.expand(*x.shape[:2], *bias.shape).contiguous()
+        for head, w in enumerate(weights):
+            w.accumulate(x[:, :, head] if x.ndim == 4 else x, output[:, :, head])
+        return output
+
+
+class SparseMLP(MLP):
+    """MLP layer that multiplies by its weights in block-sparse form. See SparseAttention."""
+
+    def build_sparse_weights(self) -> None:
+        assert not self.cfg.act_fn.endswith("_ln"), "Sparse weights are not supported for MLPs with layer norm"
+
+        self.W_in_sparse = BlockSparseMatrix(self.W_in)
+        self.W_out_sparse = BlockSparseMatrix(self.W_out)
+
+    def clear_sparse_weights(self) -> None:
+        del self.W_in_sparse, self.W_out_sparse
+
+    def forward(self, x: Float[Tensor, "batch pos d_model"]) -> Float[Tensor, "batch pos d_model"]:
+        pre_act = self.hook_pre(self.W_in_sparse(x, self.b_in))  # [batch, pos, d_mlp]
+        post_act = self.hook_post(self.act_fn(pre_act))  # [batch, pos, d_mlp]
+        return self.W_out_sparse(post_act, self.b_out)
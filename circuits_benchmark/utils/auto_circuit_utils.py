@@ -1,8 +1,10 @@
+import numpy as np
 from auto_circuit.types import PruneScores
 from auto_circuit.utils.patchable_model import PatchableModel
 
 from circuits_benchmark.utils.circuit.circuit import Circuit
 from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
+from circuits_benchmark.utils.circuit.circuit_roc import EdgeScores
 
 
 def build_circuit(model: PatchableModel,
@@ -10,20 +12,22 @@ def build_circuit(model: PatchableModel,
                   threshold: float,
                   abs_val_threshold: bool = False) -> Circuit:
     """Build a circuit out of the auto_circuit output."""
-    circuit = Circuit()
+    return build_edge_scores(model, attribution_scores).build_circuit(threshold, abs_val_threshold)
 
+
+def build_edge_scores(model: PatchableModel, attribution_scores: PruneScores) -> EdgeScores:
+    """Build the scores of all the edges of the model out of the auto_circuit output. Circuits for any threshold can be
+    built and evaluated from them, without running auto_circuit again."""
+    edges = []
+    scores = []
     for edge in model.edges:
         src_node = edge.src
         dst_node = edge.dest
-        score = attribution_scores[dst_node.module_name][edge.patch_idx]
-        if abs_val_threshold:
-            score = abs(score)
-        if score > threshold:
-            from_node = CircuitNode(src_node.module_name, src_node.head_idx)
-            to_node = CircuitNode(dst_node.module_name, dst_node.head_idx)
-            circuit.add_edge(from_node, to_node)
-
-    return circuit
+        edges.append((CircuitNode(src_node.module_name, src_node.head_idx),
+                      CircuitNode(dst_node.module_name, dst_node.head_idx)))
+        scores.append(attribution_scores[dst_node.module_name][edge.patch_idx].item())
+
+    return EdgeScores(edges, np.array(scores, dtype=np.float64))
 
 
 def build_normalized_scores(attribution_scores: PruneScores) -> PruneScores:
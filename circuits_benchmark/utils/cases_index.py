@@ -0,0 +1,162 @@
+import ast
+import dataclasses
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+from dataclasses import dataclass
+from typing import List, Dict
+
+from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
+from circuits_benchmark.utils.atomic_write import atomic_write
+from circuits_benchmark.utils.project_paths import get_default_cache_dir
+
+CASES_PACKAGE = "circuits_benchmark.benchmark.cases"
+
+# Bump this version whenever the metadata stored in the index changes.
+CASES_INDEX_VERSION = 1
+
+# Modules outside the cases package that the metadata of the cases depends on. If any of them changes, the whole index
+# is rebuilt.
+CASES_INDEX_DEPENDENCIES = [
+    "circuits_benchmark.benchmark.benchmark_case",
+    "circuits_benchmark.benchmark.tracr_benchmark_case",
+    "circuits_benchmark.benchmark.common_programs",
+    "circuits_benchmark.benchmark.vocabs",
+]
+
+
+@dataclass
+class CaseIndexEntry:
+    """Location of a benchmark case, plus cheap metadata that can be used to filter cases without importing them.
+    Metadata fields are None if they have not been computed or do not apply to the case (e.g., the vocab size of
+    non-Tracr cases)."""
+    case_id: str
+    module_name: str
+    class_name: str
+    module_hash: str
+    vocab_size: int | None = None
+    max_seq_len: int | None = None
+    is_categorical: bool | None = None
+    supports_causal_masking: bool | None = None
+
+
+def get_module_path(module_name: str) -> str:
+    """Returns the path of a module's source file, without importing it (parent packages are imported)."""
+    return importlib.util.find_spec(module_name).origin
+
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def discover_cases() -> List[CaseIndexEntry]:
+    """Finds all benchmark cases by parsing the modules in the cases package, without importing them. Cases are the
+    classes whose name starts with "Case", and are returned sorted by id."""
+    cases_dir = os.path.dirname(get_module_path(CASES_PACKAGE))
+
+    entries = []
+    for file_name in os.listdir(cases_dir):
+        if not file_name.startswith("case_") or not file_name.endswith(".py"):
+            continue
+
+        path = os.path.join(cases_dir, file_name)
+        with open(path, "rb") as f:
+            source = f.read()
+
+        module_name = f"{CASES_PACKAGE}.{file_name[:-3]}"
+        module_hash = hashlib.sha256(source).hexdigest()
+        for node in ast.parse(source, filename=path).body:
+            if isinstance(node, ast.ClassDef) and node.name.startswith("Case"):
+                # Same as BenchmarkCase.get_name
+                case_id = node.name[4:].lower()
+                entries.append(CaseIndexEntry(case_id, module_name, node.name, module_hash))
+
+    entries.sort(key=lambda entry: entry.class_name[4:])
+    return entries
+
+
+def instantiate_case(entry: CaseIndexEntry) -> BenchmarkCase:
+    """Imports the module of a case and instantiates it."""
+    module = importlib.import_module(entry.module_name)
+    return getattr(module, entry.class_name)()
+
+
+def get_cases_index() -> List[CaseIndexEntry]:
+    """Returns the entries of all benchmark cases, including their metadata.
+    The index is built on first use and stored in the cache dir. Afterwards, only the cases whose modules changed are
+    imported again to refresh their metadata."""
+    path = get_cases_index_path()
+    dependencies_hash = hash_cases_index_dependencies()
+
+    cached_entries: Dict[str, CaseIndexEntry] = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+            if index["version"] == CASES_INDEX_VERSION and index["dependencies_hash"] == dependencies_hash:
+                cached_entries = {entry["case_id"]: CaseIndexEntry(**entry) for entry in index["cases"]}
+        except Exception as e:
+            print(f"Unable to load cases index from {path}: {e}")
+
+    entries = []
+    for entry in discover_cases():
+        cached_entry = cached_entries.get(entry.case_id)
+        if cached_entry is not None and cached_entry.module_hash == entry.module_hash and \
+                cached_entry.module_name == entry.module_name and cached_entry.class_name == entry.class_name:
+            entries.append(cached_entry)
+        else:
+            entries.append(build_case_index_entry(entry))
+
+    if [dataclasses.asdict(entry) for entry in entries] != \
+            [dataclasses.asdict(entry) for entry in cached_entries.values()]:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            index = {
+                "version": CASES_INDEX_VERSION,
+                "dependencies_hash": dependencies_hash,
+                "cases": [dataclasses.asdict(entry) for entry in entries],
+            }
+            with atomic_write(path) as f:
+                f.write(json.dumps(index, indent=2).encode("utf-8"))
+        except Exception as e:
+            print(f"Unable to store cases index in {path}: {e}")
+
+    return entries
+
+
+def get_cases_index_path() -> str:
+    return os.path.join(get_default_cache_dir(), "cases_index.json")
+
+
+def hash_cases_index_dependencies() -> str:
+    hashes = [f"version: {CASES_INDEX_VERSION}"]
+    hashes.extend(f"{module}: {hash_file(get_module_path(module))}" for module in CASES_INDEX_DEPENDENCIES)
+    return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()
+
+
+def build_case_index_entry(entry: CaseIndexEntry) -> CaseIndexEntry:
+    """Imports and instantiates a case to compute its metadata. Metadata that the case does not provide is left as
+    None."""
+    case = instantiate_case(entry)
+    vocab = call_if_available(case, "get_vocab")
+
+    return dataclasses.replace(entry,
+                               vocab_size=len(vocab) if vocab is not None else None,
+                               max_seq_len=call_if_available(case, "get_max_seq_len"),
+                               is_categorical=call_if_available(case, "is_categorical"),
+                               supports_causal_masking=call_if_available(case, "supports_causal_masking"))
+
+
+def call_if_available(case: BenchmarkCase, method_name: str):
+    """Calls a metadata method of a case, returning None if the case does not implement it or it fails."""
+    if not hasattr(case, method_name):
+        return None
+
+    try:
+        return getattr(case, method_name)()
+    except Exception as e:
+        print(f"Unable to get {method_name} for case {case.get_name()}: {e}")
+        return None
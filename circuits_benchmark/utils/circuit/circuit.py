@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from functools import cached_property
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Set
 
 import cmapy
 import networkx as nx
@@ -19,6 +19,9 @@ from circuits_benchmark.utils.cloudpickle import dump_to_pickle, load_from_pickl
 
 class Circuit(DiGraph):
     def __init__(self, granularity: CircuitGranularity | None = None, *args, **kwargs):
+        # Nodes of the circuit by name, kept up to date as nodes are added and removed. Created before initializing the
+        # graph, since the graph may be initialized with nodes.
+        self.nodes_by_name: Dict[str, Set[CircuitNode]] = {}
         super().__init__(*args, **kwargs)
         self.granularity = granularity
 
@@ -28,6 +31,14 @@ class Circuit(DiGraph):
             raise ValueError(f"Expected a CircuitNode, got {type(node_for_adding)}")
 
         super().add_node(node_for_adding, **attr)
+        self.index_node(node_for_adding)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        nodes_for_adding = list(nodes_for_adding)
+        super().add_nodes_from(nodes_for_adding, **attr)
+        for node in nodes_for_adding:
+            # nodes can be given as (node, attrs) tuples
+            self.index_node(node[0] if isinstance(node, tuple) else node)
 
     def add_edge(self, u_of_edge: CircuitNode, v_of_edge: CircuitNode, **attr):
         # Make sure that u_of_edge and v_of_edge are CircuitNodes
@@ -35,11 +46,59 @@ class Circuit(DiGraph):
             raise ValueError(f"Expected a CircuitNode, got {type(u_of_edge)} and {type(v_of_edge)}")
 
         super().add_edge(u_of_edge, v_of_edge, **attr)
+        self.index_node(u_of_edge)
+        self.index_node(v_of_edge)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        ebunch_to_add = list(ebunch_to_add)
+        super().add_edges_from(ebunch_to_add, **attr)
+        for edge in ebunch_to_add:
+            self.index_node(edge[0])
+            self.index_node(edge[1])
+
+    def remove_node(self, n: CircuitNode):
+        super().remove_node(n)
+        self.unindex_node(n)
+
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        super().remove_nodes_from(nodes)
+        for node in nodes:
+            self.unindex_node(node)
+
+    def clear(self):
+        super().clear()
+        self.nodes_by_name.clear()
+
+    def index_node(self, node: CircuitNode):
+        if isinstance(node, CircuitNode):
+            self.nodes_by_name.setdefault(node.name, set()).add(node)
+
+    def unindex_node(self, node: CircuitNode):
+        if isinstance(node, CircuitNode) and node not in self._node and node.name in self.nodes_by_name:
+            nodes = self.nodes_by_name[node.name]
+            nodes.discard(node)
+            if not nodes:
+                del self.nodes_by_name[node.name]
 
     @cached_property
     def nodes(self):
         return CircuitNodeView(self)
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("nodes", None)  # the cached node view is rebuilt on demand
+        return state
+
+    def __setstate__(self, state):
+        # Circuits pickled before nodes were indexed by name carry a cached node view and no index
+        state = {key: value for key, value in state.items() if key != "nodes"}
+        self.__dict__.update(state)
+        if "nodes_by_name" not in state:
+            self.nodes_by_name = {}
+            for node in self._node:
+                self.index_node(node)
+
     def save(self, file_path: str):
         if not file_path.endswith(".pkl"):
             file_path += ".pkl"
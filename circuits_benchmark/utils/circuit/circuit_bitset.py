@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
+
+# Number of bits set in each byte value, for counting the bits of packed arrays.
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """Counts the bits set in packed bit arrays of shape [..., n_bytes]. Returns an array of shape [...]."""
+    return POPCOUNT_TABLE[bits].sum(axis=-1)
+
+
+@dataclass
+class CircuitBitset:
+    """One or more circuits as packed bit arrays over the nodes and edges of a CircuitIndex: bit i of nodes (edges) is
+    set if the circuit contains the i-th node (edge) of the index. Arrays have shape [n_bytes] for a single circuit, and
+    [n_circuits, n_bytes] for a batch of circuits."""
+    nodes: np.ndarray
+    edges: np.ndarray
+
+    def __len__(self):
+        assert self.edges.ndim == 2, "Only batches of circuits have a length"
+        return self.edges.shape[0]
+
+    def __getitem__(self, item) -> CircuitBitset:
+        return CircuitBitset(self.nodes[item], self.edges[item])
+
+    @staticmethod
+    def stack(bitsets: List[CircuitBitset]) -> CircuitBitset:
+        """Returns a batch with the given circuits."""
+        return CircuitBitset(np.stack([b.nodes for b in bitsets]), np.stack([b.edges for b in bitsets]))
+
+    def count_nodes(self) -> np.ndarray:
+        return popcount(self.nodes)
+
+    def count_edges(self) -> np.ndarray:
+        return popcount(self.edges)
+
+
+@dataclass
+class CircuitBitsetRates:
+    """Confusion counts and rates of one or more hypothesis circuits. Each field is an array with one entry per
+    hypothesis. Rates are NaN when undefined (i.e., when their denominator is zero)."""
+    true_positive: np.ndarray
+    false_positive: np.ndarray
+    false_negative: np.ndarray
+    true_negative: np.ndarray
+    tpr: np.ndarray
+    fpr: np.ndarray
+
+
+@dataclass
+class CircuitBitsetEvalResult:
+    nodes: CircuitBitsetRates
+    edges: CircuitBitsetRates
+
+
+class CircuitIndex(object):
+    """Canonical numbering of the nodes and edges of a full circuit, in sorted order. Circuits whose nodes and edges are
+    part of the full circuit can be stored as bitsets over the index (see CircuitBitset), which take a few bytes, and
+    whose intersections and sizes can be computed for many circuits at once."""
+
+    def __init__(self, full_circuit: Circuit):
+        self.granularity = full_circuit.granularity
+        self.nodes: List[CircuitNode] = sorted(full_circuit.nodes)
+        self.edges: List[Tuple[CircuitNode, CircuitNode]] = sorted(full_circuit.edges)
+        self.node_ids: Dict[CircuitNode, int] = {node: i for i, node in enumerate(self.nodes)}
+        self.edge_ids: Dict[Tuple[CircuitNode, CircuitNode], int] = {edge: i for i, edge in enumerate(self.edges)}
+
+        # Ids of the source and target nodes of each edge
+        self.edge_sources = np.array([self.node_ids[u] for u, _ in self.edges], dtype=np.int64)
+        self.edge_targets = np.array([self.node_ids[v] for _, v in self.edges], dtype=np.int64)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edges)
+
+    def get_node_mask(self, nodes: Iterable[CircuitNode]) -> np.ndarray:
+        """Returns a boolean array with the given nodes set. All nodes must be in the index."""
+        nodes = list(nodes)
+        mask = np.zeros(self.n_nodes, dtype=bool)
+        ids = [self.node_ids.get(node) for node in nodes]
+        if None in ids:
+            missing = [node for node, i in zip(nodes, ids) if i is None]
+            raise ValueError(f"The following nodes are not in the full circuit: {missing}")
+        mask[ids] = True
+        return mask
+
+    def get_edge_mask(self, edges: Iterable[Tuple[CircuitNode, CircuitNode]]) -> np.ndarray:
+        """Returns a boolean array with the given edges set. All edges must be in the index."""
+        edges = list(edges)
+        mask = np.zeros(self.n_edges, dtype=bool)
+        ids = [self.edge_ids.get(edge) for edge in edges]
+        if None in ids:
+            missing = [edge for edge, i in zip(edges, ids) if i is None]
+            raise ValueError(f"The following edges are not in the full circuit: {missing}")
+        mask[ids] = True
+        return mask
+
+    def get_edge_endpoints_mask(self, edge_mask: np.ndarray) -> np.ndarray:
+        """Returns the nodes that are the source or the target of the edges in a boolean edge mask of shape
+        [..., n_edges], as a boolean node mask of shape [..., n_nodes]."""
+        node_mask = np.zeros((*edge_mask.shape[:-1], self.n_nodes), dtype=bool)
+        *batch_ids, edge_ids = np.nonzero(edge_mask)
+        node_mask[(*batch_ids, self.edge_sources[edge_ids])] = True
+        node_mask[(*batch_ids, self.edge_targets[edge_ids])] = True
+        return node_mask
+
+    def from_masks(self, node_mask: np.ndarray | None, edge_mask: np.ndarray) -> CircuitBitset:
+        """Packs boolean node and edge masks of shape [..., n_nodes] and [..., n_edges] into a bitset. If node_mask is
+        None, the circuits contain the endpoints of their edges."""
+        if node_mask is None:
+            node_mask = self.get_edge_endpoints_mask(edge_mask)
+        return CircuitBitset(np.packbits(node_mask, axis=-1), np.packbits(edge_mask, axis=-1))
+
+    def to_masks(self, bitset: CircuitBitset) -> Tuple[np.ndarray, np.ndarray]:
+        """Unpacks a bitset into boolean node and edge masks."""
+        node_mask = np.unpackbits(bitset.nodes, axis=-1, count=self.n_nodes).astype(bool)
+        edge_mask = np.unpackbits(bitset.edges, axis=-1, count=self.n_edges).astype(bool)
+        return node_mask, edge_mask
+
+    def from_circuit(self, circuit: Circuit) -> CircuitBitset:
+        """Returns the bitset of a circuit. All nodes and edges of the circuit must be in the index."""
+        return self.from_masks(self.get_node_mask(circuit.nodes), self.get_edge_mask(circuit.edges))
+
+    def from_circuits(self, circuits: List[Circuit]) -> CircuitBitset:
+        """Returns a batch with the bitsets of the given circuits."""
+        return CircuitBitset.stack([self.from_circuit(circuit) for circuit in circuits])
+
+    def to_circuit(self, bitset: CircuitBitset) -> Circuit:
+        """Returns the circuit stored in the bitset of a single circuit."""
+        assert bitset.edges.ndim == 1, "Expected the bitset of a single circuit"
+        node_mask, edge_mask = self.to_masks(bitset)
+
+        circuit = Circuit(self.granularity)
+        circuit.add_nodes_from([self.nodes[i] for i in np.flatnonzero(node_mask)])
+        circuit.add_edges_from([self.edges[i] for i in np.flatnonzero(edge_mask)])
+        return circuit
+
+    def calculate_rates(self, hypothesis: CircuitBitset, true: CircuitBitset) -> CircuitBitsetEvalResult:
+        """Calculates the true/false positives/negatives and the TP and FP rates of the nodes and edges of one or more
+        hypothesis circuits with respect to a true circuit, by counting the bits of their intersections."""
+        return CircuitBitsetEvalResult(
+            nodes=calculate_bitset_rates(hypothesis.nodes, true.nodes, self.n_nodes),
+            edges=calculate_bitset_rates(hypothesis.edges, true.edges, self.n_edges),
+        )
+
+
+def calculate_bitset_rates(hypothesis_bits: np.ndarray, true_bits: np.ndarray, n_total: int) -> CircuitBitsetRates:
+    """Calculates the confusion counts and rates of packed hypothesis bit arrays of shape [..., n_bytes] with respect to
+    packed true bits of shape [n_bytes], out of n_total elements."""
+    true_positive = popcount(hypothesis_bits & true_bits)
+    false_positive = popcount(hypothesis_bits) - true_positive
+    false_negative = popcount(true_bits) - true_positive
+    true_negative = n_total - popcount(hypothesis_bits | true_bits)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tpr = np.where(true_positive + false_negative > 0,
+                       true_positive / (true_positive + false_negative), np.nan)
+        fpr = np.where(false_positive + true_negative > 0,
+                       false_positive / (false_positive + true_negative), np.nan)
+
+    return CircuitBitsetRates(
+        true_positive=true_positive,
+        false_positive=false_positive,
+        false_negative=false_negative,
+        true_negative=true_negative,
+        tpr=tpr,
+        fpr=fpr,
+    )
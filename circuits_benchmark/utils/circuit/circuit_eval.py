@@ -1,6 +1,8 @@
 from dataclasses import dataclass
-from typing import Optional, Set
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple
 
+import networkx as nx
 from acdc.TLACDCCorrespondence import TLACDCCorrespondence
 from acdc.TLACDCEdge import EdgeType
 from iit.utils.correspondence import Correspondence
@@ -8,7 +10,10 @@ from transformer_lens import HookedTransformer
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_bitset import CircuitBitsetEvalResult, CircuitIndex
+from circuits_benchmark.utils.circuit.circuit_granularity import CircuitGranularity
 from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
+from circuits_benchmark.utils.circuit.circuit_roc import CircuitROCResult, EdgeScores, calculate_roc
 from circuits_benchmark.utils.circuit.prepare_circuit import prepare_circuit_for_evaluation
 from circuits_benchmark.utils.iit._acdc_utils import get_gt_circuit
 
@@ -153,6 +158,21 @@ def calculate_fpr_and_tpr(
     )
 
 
+def calculate_fpr_and_tpr_for_circuits(
+    hypothesis_circuits: List[Circuit],
+    true_circuit: Circuit,
+    circuit_index: CircuitIndex,
+    promote_to_heads: bool = True,
+) -> CircuitBitsetEvalResult:
+    """Same as calculate_fpr_and_tpr, for many hypothesis circuits at once. Circuits are compared as bitsets over the
+    index of the (prepared) full circuit, see get_full_circuit_index. Only counts and rates are returned, with one entry
+    per hypothesis circuit, and undefined rates are NaN instead of "N/A"."""
+    true_bitset = circuit_index.from_circuit(prepare_circuit_for_evaluation(true_circuit, promote_to_heads))
+    hypothesis_bitsets = circuit_index.from_circuits([prepare_circuit_for_evaluation(circuit, promote_to_heads)
+                                                      for circuit in hypothesis_circuits])
+    return circuit_index.calculate_rates(hypothesis_bitsets, true_bitset)
+
+
 def evaluate_hypothesis_circuit(
     hypothesis_circuit: Circuit,
     ll_model: HookedTransformer,
@@ -162,6 +182,37 @@ def evaluate_hypothesis_circuit(
     use_embeddings: bool = True,
     print_summary: bool = True,
 ) -> CircuitEvalResult:
+    full_circuit, gt_circuit = build_full_and_gt_circuits(ll_model, hl_ll_corr, case, gt_circuit, use_embeddings)
+
+    return calculate_fpr_and_tpr(
+        hypothesis_circuit, gt_circuit, full_circuit, print_summary=print_summary
+    )
+
+
+def evaluate_edge_scores(
+    edge_scores: EdgeScores,
+    ll_model: HookedTransformer,
+    hl_ll_corr: Correspondence,
+    case: BenchmarkCase,
+    gt_circuit: Optional[Circuit] = None,
+    use_embeddings: bool = True,
+    abs_value_threshold: bool = False,
+) -> CircuitROCResult:
+    """Same as evaluate_hypothesis_circuit, for the circuits built from the edge scores for all thresholds at once (see
+    calculate_roc)."""
+    full_circuit, gt_circuit = build_full_and_gt_circuits(ll_model, hl_ll_corr, case, gt_circuit, use_embeddings)
+
+    return calculate_roc(edge_scores, gt_circuit, full_circuit, abs_value_threshold=abs_value_threshold)
+
+
+def build_full_and_gt_circuits(
+    ll_model: HookedTransformer,
+    hl_ll_corr: Correspondence,
+    case: BenchmarkCase,
+    gt_circuit: Optional[Circuit] = None,
+    use_embeddings: bool = True,
+) -> Tuple[Circuit, Circuit]:
+    """Return the full circuit of the LL model and the ground truth circuit (unless given) to evaluate hypotheses."""
     full_corr = TLACDCCorrespondence.setup_from_model(
         ll_model, use_pos_embed=use_embeddings
     )
@@ -173,9 +224,7 @@ def evaluate_hypothesis_circuit(
         else:
             gt_circuit = get_gt_circuit(hl_ll_corr, full_circuit, ll_model.cfg.n_heads, case)
 
-    return calculate_fpr_and_tpr(
-        hypothesis_circuit, gt_circuit, full_circuit, print_summary=print_summary
-    )
+    return full_circuit, gt_circuit
 
 
 def build_from_acdc_correspondence(corr: TLACDCCorrespondence) -> Circuit:
@@ -207,65 +256,60 @@ def build_from_acdc_correspondence(corr: TLACDCCorrespondence) -> Circuit:
     return circuit
 
 
+@lru_cache(maxsize=32)
 def get_full_circuit(n_layers: int, n_heads: int) -> Circuit:
-    """Return a full circuit (ACDC level granularity) with n_layers and n_heads."""
-    circuit = Circuit()
+    """Return a full circuit (ACDC level granularity) with n_layers and n_heads.
+    Full circuits are cached and frozen, so they can not be modified: use circuit.copy() to get a modifiable copy."""
+    circuit = Circuit("acdc_hooks")
 
-    circuit.add_node(CircuitNode("hook_embed"))
-    circuit.add_node(CircuitNode("hook_pos_embed"))
+    embed_nodes = [CircuitNode("hook_embed"), CircuitNode("hook_pos_embed")]
+    circuit.add_nodes_from(embed_nodes)
 
-    # nodes that write to residual stream match at least one of the following
-    resid_writers_filter = ["hook_embed", "hook_pos_embed", "attn.hook_result", "hook_mlp_out"]
+    # nodes that write to the residual stream (embeddings, attention heads' results and mlp outputs) before the
+    # component being added
+    resid_writers = list(embed_nodes)
 
     for layer in range(n_layers):
-        upstream_nodes = list(circuit.nodes)
-
-        # attention heads
+        # attention heads read the residual stream as written by previous layers
+        attn_result_nodes = []
         for head in range(n_heads):
+            attn_result_node = CircuitNode(f"blocks.{layer}.attn.hook_result", head)
+            matrix_nodes = []
             for letter in "qkv":
                 input_node = CircuitNode(f"blocks.{layer}.hook_{letter}_input", head)
                 matrix_node = CircuitNode(f"blocks.{layer}.attn.hook_{letter}", head)
-                circuit.add_node(input_node)
-                circuit.add_node(matrix_node)
                 circuit.add_edge(input_node, matrix_node)
+                matrix_nodes.append(matrix_node)
 
-            attn_result_node = CircuitNode(f"blocks.{layer}.attn.hook_result", head)
-            circuit.add_node(attn_result_node)
-            for letter in "qkv":
-                matrix_node = CircuitNode(f"blocks.{layer}.attn.hook_{letter}", head)
-                circuit.add_edge(matrix_node, attn_result_node)
-
-            nodes_that_receive_resid_directly = [
-                f"blocks.{layer}.hook_q_input",
-                f"blocks.{layer}.hook_k_input",
-                f"blocks.{layer}.hook_v_input",
-            ]
-            for from_node in upstream_nodes:
-                if any([from_node.name.endswith(resid_writer) for resid_writer in resid_writers_filter]):
-                    if f"blocks.{layer}" not in from_node.name:  # discard nodes from current layer
-                        for to_node_name in nodes_that_receive_resid_directly:
-                            circuit.add_edge(from_node, CircuitNode(to_node_name, head))
-
-        upstream_nodes = list(circuit.nodes)
-
-        # mlp
+            circuit.add_edges_from([(matrix_node, attn_result_node) for matrix_node in matrix_nodes])
+            circuit.add_edges_from([(from_node, CircuitNode(f"blocks.{layer}.hook_{letter}_input", head))
+                                    for from_node in resid_writers
+                                    for letter in "qkv"])
+            attn_result_nodes.append(attn_result_node)
+        resid_writers.extend(attn_result_nodes)
+
+        # mlp reads the residual stream as written by previous layers and the attention heads of the current layer
         mlp_in_node = CircuitNode(f"blocks.{layer}.hook_mlp_in")
         mlp_out_node = CircuitNode(f"blocks.{layer}.hook_mlp_out")
-        circuit.add_node(mlp_in_node)
-        circuit.add_node(mlp_out_node)
         circuit.add_edge(mlp_in_node, mlp_out_node)
-
-        nodes_that_receive_resid_directly = [mlp_in_node]
-        for from_node in upstream_nodes:
-            if any([from_node.name.endswith(resid_writer) for resid_writer in resid_writers_filter]):
-                if (f"blocks.{layer}" not in from_node.name) or ("attn.hook_result" in from_node.name):
-                    for to_node in nodes_that_receive_resid_directly:
-                        circuit.add_edge(from_node, to_node)
+        circuit.add_edges_from([(from_node, mlp_in_node) for from_node in resid_writers])
+        resid_writers.append(mlp_out_node)
 
     last_resid_post_node = CircuitNode(f"blocks.{n_layers - 1}.hook_resid_post")
     circuit.add_node(last_resid_post_node)
-    for from_node in list(circuit.nodes):
-        if any([from_node.name.endswith(resid_writer) for resid_writer in resid_writers_filter]):
-            circuit.add_edge(from_node, last_resid_post_node)
+    circuit.add_edges_from([(from_node, last_resid_post_node) for from_node in resid_writers])
 
-    return circuit
+    return nx.freeze(circuit)
+
+
+@lru_cache(maxsize=None)
+def get_full_circuit_index(n_layers: int, n_heads: int, granularity: CircuitGranularity = "acdc_hooks") -> CircuitIndex:
+    """Return the canonical index of the nodes and edges of the full circuit with n_layers and n_heads, as prepared for
+    evaluation. Circuits of models with the same architecture can be compared as bitsets over it. Like full circuits,
+    indices are cached, so repeated calls are free."""
+    if granularity != "acdc_hooks":
+        raise ValueError(f"Full circuits are only available for acdc_hooks granularity, got {granularity}")
+
+    full_circuit = prepare_circuit_for_evaluation(get_full_circuit(n_layers, n_heads))
+    full_circuit.granularity = granularity
+    return CircuitIndex(full_circuit)
@@ -1,7 +1,51 @@
+from __future__ import annotations
+
+import pickle
+from typing import Any, Dict
+from weakref import WeakValueDictionary
+
+
 class CircuitNode(object):
-    def __init__(self, name: str, index: int | None = None):
-        self.name = name
-        self.index = index
+    """A node of a circuit: a hook name and, optionally, a head index.
+    Nodes are immutable and interned: creating a node that already exists returns the existing instance. Their hash and
+    sort key are computed once, since circuits are graphs keyed by nodes and hash and compare them constantly."""
+
+    __slots__ = ("name", "index", "_key", "_hash", "__weakref__")
+
+    # Existing nodes, by name and index. Nodes are removed once they are no longer used.
+    _instances: WeakValueDictionary = WeakValueDictionary()
+
+    def __new__(cls, name: str, index: int | None = None):
+        node = cls._instances.get((name, index))
+        if node is None:
+            node = super().__new__(cls)
+            node._set_state(name, index)
+            cls._instances[(name, index)] = node
+        return node
+
+    def _set_state(self, name: str, index: int | None):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "index", index)
+        # Nodes without index go after the ones with index for the same name
+        object.__setattr__(self, "_key", (name, 1, 0) if index is None else (name, 0, index))
+        object.__setattr__(self, "_hash", hash((name, index)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), (self.name, self.index)
+
+    def __setstate__(self, state):
+        # Only reached by pickles of nodes stored before nodes were interned, using the old protocols 0 and 1
+        raise TypeError(f"{type(self).__name__} pickled before nodes were interned, it has to be loaded with "
+                        f"LegacyCircuitNodeUnpickler")
+
+    @classmethod
+    def _from_legacy_state(cls, state: Dict[str, Any]) -> CircuitNode:
+        """Returns the interned node for the attributes of a node pickled before nodes were interned (see
+        LegacyCircuitNodeUnpickler)."""
+        return cls(state["name"], state["index"])
 
     def __str__(self):
         return f"{self.name}[{self.index}]" if self.index is not None else self.name
@@ -10,23 +54,57 @@ class CircuitNode(object):
         return str(self)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
+
         if not isinstance(other, CircuitNode):
             return False
 
-        return self.name == other.name and self.index == other.index
+        return self._hash == other._hash and self.name == other.name and self.index == other.index
 
     def __lt__(self, other):
         if not isinstance(other, CircuitNode):
             raise ValueError(f"Expected a CircuitNode, got {type(other)}")
 
-        if self.name != other.name:
-            return self.name < other.name
-        elif self.index is None:
-            return False
-        elif other.index is None:
-            return True
-        else:
-            return self.index < other.index
+        return self._key < other._key
+
+
+class _LegacyCircuitNode(object):
+    """Placeholder for a node pickled before nodes were interned, until its attributes are loaded. Nodes pickled since
+    then are created directly."""
+
+    def __new__(cls, *args):
+        if args:
+            return CircuitNode(*args)
+        return super().__new__(cls)
+
+
+class LegacyCircuitNodeUnpickler(pickle._Unpickler):
+    """Unpickler for data that contains nodes pickled before nodes were interned. Those were stored as an empty node
+    followed by its attributes, which can't be loaded by the default unpickler since nodes require a name. Each of them
+    is replaced by the interned node with the same attributes."""
+
+    dispatch = dict(pickle._Unpickler.dispatch)
+
+    def find_class(self, module, name):
+        cls = super().find_class(module, name)
+        return _LegacyCircuitNode if cls is CircuitNode else cls
+
+    def load_build(self):
+        if not isinstance(self.stack[-2], _LegacyCircuitNode):
+            return super().load_build()
+
+        state = self.stack.pop()
+        placeholder = self.stack[-1]
+        node = CircuitNode._from_legacy_state(state)
+        self.stack[-1] = node
+
+        # the placeholder is memoized before its attributes are loaded, so later references to it point to it
+        for key, value in self.memo.items():
+            if value is placeholder:
+                self.memo[key] = node
+
+    dispatch[pickle.BUILD[0]] = load_build
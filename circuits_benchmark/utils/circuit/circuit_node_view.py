@@ -1,13 +1,26 @@
+from typing import Dict, Set
+
 from networkx.classes.reportviews import NodeView
 
 from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
 
 
 class CircuitNodeView(NodeView):
+    """Node view of a circuit, where nodes can also be looked up by name: `name in circuit.nodes` is True if any node
+    has that name. Lookups use the index of node names maintained by the circuit (see Circuit.nodes_by_name)."""
+
+    def __init__(self, graph):
+        super().__init__(graph)
+        # Graph views (e.g., subgraphs) filter the nodes of another graph, so they don't have their own index
+        self._nodes_by_name: Dict[str, Set[CircuitNode]] | None = \
+            None if hasattr(graph, "_graph") else graph.nodes_by_name
+
     def __contains__(self, item: str | CircuitNode):
         if isinstance(item, str):
-            return any([item == node.name for node in self._nodes])
+            if self._nodes_by_name is None:
+                return any(item == node.name for node in self._nodes)
+            return item in self._nodes_by_name
         elif isinstance(item, CircuitNode):
-            return any([item == node for node in self._nodes])
+            return item in self._nodes
         else:
             return False
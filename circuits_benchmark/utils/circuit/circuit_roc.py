@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_bitset import CircuitIndex
+from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
+from circuits_benchmark.utils.circuit.prepare_circuit import prepare_circuit_for_evaluation, \
+    prepare_edge_for_evaluation
+from circuits_benchmark.utils.cloudpickle import dump_to_pickle, load_from_pickle
+
+
+@dataclass
+class EdgeScores:
+    """The score of each edge of a model, as assigned by a score-based circuit discovery algorithm (e.g., EAP). The
+    circuit for a threshold is made of the edges whose score is strictly above it, so that ACDC, which scores the edges it
+    prunes with its threshold, leaves them out. An edge may be scored more than once, in which case it is in the circuit
+    if any of its scores is above the threshold."""
+    edges: List[Tuple[CircuitNode, CircuitNode]]
+    scores: np.ndarray
+
+    def build_circuit(self, threshold: float, abs_value_threshold: bool = False) -> Circuit:
+        scores = np.abs(self.scores) if abs_value_threshold else self.scores
+
+        circuit = Circuit()
+        for (from_node, to_node), score in zip(self.edges, scores):
+            if score > threshold:
+                circuit.add_edge(from_node, to_node)
+
+        return circuit
+
+    def save(self, file_path: str):
+        if not file_path.endswith(".pkl"):
+            file_path += ".pkl"
+
+        dump_to_pickle(file_path, self)
+
+    @staticmethod
+    def load(file_path) -> EdgeScores | None:
+        return load_from_pickle(file_path)
+
+
+@dataclass
+class CircuitROCCurve:
+    tpr: np.ndarray
+    fpr: np.ndarray
+    auc: float
+
+
+@dataclass
+class CircuitROCResult:
+    """ROC curves of the circuits found by sweeping the threshold over the scores of the edges. Point k of the curves is
+    the circuit built by EdgeScores.build_circuit(thresholds[k]), i.e., with the edges whose score is above thresholds[k]:
+    the first point is the empty circuit (threshold equal to the highest score), and the last one has all the scored
+    edges (threshold -inf)."""
+    thresholds: np.ndarray
+    nodes: CircuitROCCurve
+    edges: CircuitROCCurve
+
+
+def calculate_roc(
+    edge_scores: EdgeScores,
+    true_circuit: Circuit,
+    full_circuit: Circuit,
+    promote_to_heads: bool = True,
+    abs_value_threshold: bool = False,
+) -> CircuitROCResult:
+    """Calculates the TP and FP rates of the nodes and edges of the circuits built from the edge scores for all
+    thresholds at once, with respect to a true circuit (see calculate_fpr_and_tpr). Circuits are compared after
+    preparing them for evaluation: the score of an edge of the prepared full circuit is the highest score of the edges
+    that are mapped to it, and the score of a node is the highest score of its edges. Edges of the full circuit that are
+    not scored are in none of the circuits, as in EdgeScores.build_circuit.
+    When preparing a circuit, edges from and to the residual stream are kept or removed depending on whether their nodes
+    are sources or sinks, which is decided here using the full circuit."""
+    processed_full_circuit = prepare_circuit_for_evaluation(full_circuit, promote_to_heads)
+    processed_true_circuit = prepare_circuit_for_evaluation(true_circuit, promote_to_heads)
+    circuit_index = CircuitIndex(processed_full_circuit)
+
+    sink_nodes = [node for node in full_circuit.nodes if not list(full_circuit.successors(node))]
+    source_nodes = [node for node in full_circuit.nodes if not list(full_circuit.predecessors(node))]
+
+    # map the scored edges to the edges of the prepared full circuit
+    scored_edge_ids = []
+    scored_edge_scores = []
+    scores = np.abs(edge_scores.scores) if abs_value_threshold else edge_scores.scores
+    for (from_node, to_node), score in zip(edge_scores.edges, scores):
+        edge = prepare_edge_for_evaluation(from_node, to_node, sink_nodes, source_nodes, promote_to_heads)
+        if edge is None:
+            continue
+
+        if edge not in circuit_index.edge_ids:
+            raise ValueError(f"Scored edge {(from_node, to_node)} is mapped to {edge}, which is not in the full circuit")
+
+        scored_edge_ids.append(circuit_index.edge_ids[edge])
+        scored_edge_scores.append(score)
+
+    prepared_edge_scores = np.full(circuit_index.n_edges, -np.inf)
+    np.maximum.at(prepared_edge_scores, np.array(scored_edge_ids, dtype=np.int64),
+                  np.array(scored_edge_scores, dtype=np.float64))
+
+    prepared_node_scores = np.full(circuit_index.n_nodes, -np.inf)
+    np.maximum.at(prepared_node_scores, circuit_index.edge_sources, prepared_edge_scores)
+    np.maximum.at(prepared_node_scores, circuit_index.edge_targets, prepared_edge_scores)
+
+    # the scores of the nodes are scores of edges too, so all the circuits are found by sweeping over the edge scores
+    thresholds = np.unique(prepared_edge_scores)[::-1]
+    if thresholds[-1] != -np.inf:
+        thresholds = np.concatenate([thresholds, [-np.inf]])
+
+    return CircuitROCResult(
+        thresholds=thresholds,
+        nodes=calculate_roc_curve(prepared_node_scores,
+                                  circuit_index.get_node_mask(processed_true_circuit.nodes),
+                                  thresholds),
+        edges=calculate_roc_curve(prepared_edge_scores,
+                                  circuit_index.get_edge_mask(processed_true_circuit.edges),
+                                  thresholds),
+    )
+
+
+def calculate_roc_curve(scores: np.ndarray, is_true: np.ndarray, thresholds: np.ndarray) -> CircuitROCCurve:
+    """Calculates the TP and FP rates of selecting the elements whose score is above each of the thresholds, given
+    which elements are true. Rates are NaN when undefined, and so is the area under the curve."""
+    order = np.argsort(-scores, kind="stable")
+    sorted_is_true = is_true[order]
+    true_positive = np.concatenate([[0], np.cumsum(sorted_is_true)])
+    false_positive = np.concatenate([[0], np.cumsum(~sorted_is_true)])
+
+    # number of elements whose score is above each threshold
+    n_selected = np.searchsorted(-scores[order], -thresholds, side="left")
+
+    n_true = int(is_true.sum())
+    n_false = len(is_true) - n_true
+    tpr = true_positive[n_selected] / n_true if n_true > 0 else np.full(len(thresholds), np.nan)
+    fpr = false_positive[n_selected] / n_false if n_false > 0 else np.full(len(thresholds), np.nan)
+
+    # trapezoidal rule
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    return CircuitROCCurve(tpr=tpr, fpr=fpr, auc=auc)
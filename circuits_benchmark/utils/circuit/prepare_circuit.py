@@ -1,3 +1,5 @@
+from typing import List, Tuple
+
 from circuits_benchmark.utils.circuit.circuit import Circuit
 from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
 
@@ -44,35 +46,71 @@ def prepare_circuit_for_evaluation(
 
     new_circuit = Circuit()
     for from_node, to_node in circuit.edges:
-        # Skip the edge based on the removal criteria
-        if remove_edges_from_qkv_inputs and is_qkv_input(from_node):
-            continue
+        edge = prepare_edge_for_evaluation(
+            from_node,
+            to_node,
+            sink_nodes,
+            source_nodes,
+            remove_edges_from_qkv_inputs=remove_edges_from_qkv_inputs,
+            reroute_edges_to_qkv_inputs=reroute_edges_to_qkv_inputs,
+            remove_edges_from_qkv_outputs=remove_edges_from_qkv_outputs,
+            remove_edges_from_mlp_in=remove_edges_from_mlp_in,
+            reroute_edges_to_mlp_in=reroute_edges_to_mlp_in,
+            rename_edges_from_embed_to_resid_pre=rename_edges_from_embed_to_resid_pre,
+            remove_embed_to_resid_edges=remove_embed_to_resid_edges,
+            remove_ignorable_resid_edges=remove_ignorable_resid_edges,
+        )
+        if edge is not None:
+            new_circuit.add_edge(*edge)
 
-        if remove_edges_from_qkv_outputs and is_qkv_out(from_node):
-            continue
+    return new_circuit
 
-        if remove_edges_from_mlp_in and is_mlp_in(from_node):
-            continue
 
-        if remove_embed_to_resid_edges and is_embed(from_node) and is_resid(to_node):
-            continue
+def prepare_edge_for_evaluation(
+    from_node: CircuitNode,
+    to_node: CircuitNode,
+    sink_nodes: List[CircuitNode],
+    source_nodes: List[CircuitNode],
+    remove_edges_from_qkv_inputs: bool = True,
+    reroute_edges_to_qkv_inputs: bool = True,
+    remove_edges_from_qkv_outputs: bool = True,
+    remove_edges_from_mlp_in: bool = True,
+    reroute_edges_to_mlp_in: bool = True,
+    rename_edges_from_embed_to_resid_pre: bool = True,
+    remove_embed_to_resid_edges: bool = True,
+    remove_ignorable_resid_edges: bool = True,
+) -> Tuple[CircuitNode, CircuitNode] | None:
+    """
+    Prepare a single edge of a circuit whose sink and source nodes are given, see prepare_circuit_for_evaluation.
+    Returns the edge that replaces it in the prepared circuit, or None if the edge is removed.
+    """
+    # Skip the edge based on the removal criteria
+    if remove_edges_from_qkv_inputs and is_qkv_input(from_node):
+        return None
 
-        if remove_ignorable_resid_edges and is_ignorable_resid_edge(from_node, to_node, sink_nodes, source_nodes):
-            continue
+    if remove_edges_from_qkv_outputs and is_qkv_out(from_node):
+        return None
 
-        if rename_edges_from_embed_to_resid_pre and is_embed(from_node):
-            from_node = CircuitNode("blocks.0.hook_resid_pre")
+    if remove_edges_from_mlp_in and is_mlp_in(from_node):
+        return None
 
-        if reroute_edges_to_qkv_inputs and is_qkv_input(to_node):
-            # directly route incoming edges to head's hook_result
-            to_node = CircuitNode(f"{prefix(to_node.name)}.attn.hook_result", to_node.index)
-        elif reroute_edges_to_mlp_in and is_mlp_in(to_node):
-            # directly route incoming edges to mlp_out
-            to_node = CircuitNode(f"{prefix(to_node.name)}.hook_mlp_out")
+    if remove_embed_to_resid_edges and is_embed(from_node) and is_resid(to_node):
+        return None
 
-        new_circuit.add_edge(from_node, to_node)
+    if remove_ignorable_resid_edges and is_ignorable_resid_edge(from_node, to_node, sink_nodes, source_nodes):
+        return None
 
-    return new_circuit
+    if rename_edges_from_embed_to_resid_pre and is_embed(from_node):
+        from_node = CircuitNode("blocks.0.hook_resid_pre")
+
+    if reroute_edges_to_qkv_inputs and is_qkv_input(to_node):
+        # directly route incoming edges to head's hook_result
+        to_node = CircuitNode(f"{prefix(to_node.name)}.attn.hook_result", to_node.index)
+    elif reroute_edges_to_mlp_in and is_mlp_in(to_node):
+        # directly route incoming edges to mlp_out
+        to_node = CircuitNode(f"{prefix(to_node.name)}.hook_mlp_out")
+
+    return from_node, to_node
 
 
 def is_qkv_out(node: CircuitNode) -> bool:
@@ -2,15 +2,25 @@ import os
 
 from cloudpickle import cloudpickle
 
+from circuits_benchmark.utils.atomic_write import atomic_write
+from circuits_benchmark.utils.circuit.circuit_node import LegacyCircuitNodeUnpickler
+
 
 def load_from_pickle(path) -> object | None:
     if os.path.exists(path):
         with open(path, "rb") as f:
-            return cloudpickle.load(f)
+            try:
+                return cloudpickle.load(f)
+            except TypeError as e:
+                if "CircuitNode" not in str(e):
+                    raise
+                # Circuit nodes pickled before nodes were interned can't be created without their attributes
+                f.seek(0)
+                return LegacyCircuitNodeUnpickler(f).load()
     else:
         return None
 
 
 def dump_to_pickle(path, obj) -> None:
-    with open(path, "wb") as f:
+    with atomic_write(path) as f:
         cloudpickle.dump(obj, f)
@@ -1,27 +1,40 @@
 from argparse import Namespace
-from typing import List
+from typing import List, Callable
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
-from circuits_benchmark.utils.find_all_subclasses import find_all_transitive_subclasses_in_package
-
-
-def get_cases(args: Namespace | None = None, indices: List[str] | None = None) -> List[BenchmarkCase]:
+from circuits_benchmark.utils.cases_index import CaseIndexEntry, discover_cases, get_cases_index, instantiate_case
+
+
+def get_cases(args: Namespace | None = None,
+              indices: List[str] | None = None,
+              filter_fn: Callable[[CaseIndexEntry], bool] | None = None) -> List[BenchmarkCase]:
+    """Returns the benchmark cases selected by indices (or args.indices), sorted by id. Only the modules of the selected
+    cases are imported.
+    If filter_fn is given, cases are also filtered by the metadata in the cases index (e.g., `lambda case:
+    case.is_categorical and case.max_seq_len <= 6`), which does not need to import the cases once the index is built.
+    If args sets data_workers, the cases that support it generate their data in that many worker processes.
+    """
     assert (args is None or args.indices is None) or indices is None, "Cannot specify both args.indices and indices"
 
-    classes = find_all_transitive_subclasses_in_package(BenchmarkCase, "circuits_benchmark.benchmark.cases")
-    classes = [cls for cls in classes if cls.__name__.startswith("Case")]
+    entries = discover_cases()
 
     if args is not None and args.indices is not None:
         indices = [idx.lower() for idx in args.indices.split(",")]
 
     if indices is not None:
-        # filter class names that are "CaseN" where N in indices
-        classes = [cls for cls in classes if cls.__name__[4:].lower() in indices]
+        # filter cases whose id is in indices
+        entries = [entry for entry in entries if entry.case_id in indices]
+
+    if filter_fn is not None:
+        entries_with_metadata = {entry.case_id: entry for entry in get_cases_index()}
+        entries = [entry for entry in entries if filter_fn(entries_with_metadata[entry.case_id])]
+
+    # instantiate the selected cases only
+    cases = [instantiate_case(entry) for entry in entries]
 
-    # sort classes. if id is a number, numerically, otherwise alphabetically
-    classes.sort(key=lambda cls:
-    cls.__name__[4:] if cls.__name__[4:].isnumeric() else cls.__name__[4:]
-                 )
+    data_workers = getattr(args, "data_workers", 0)
+    for case in cases:
+        if data_workers and hasattr(case, "data_workers"):
+            case.data_workers = data_workers
 
-    # instantiate all classes found
-    return [cls() for cls in classes]
+    return cases
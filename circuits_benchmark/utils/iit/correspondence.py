@@ -1,18 +1,23 @@
+from __future__ import annotations
+
 import pickle
 import random
-from typing import Dict, Set, Tuple, Optional, Literal
+from typing import Dict, Set, Tuple, Optional, Literal, TYPE_CHECKING
 
 from iit.utils import index
 from iit.utils.correspondence import Correspondence
 from iit.utils.index import TorchIndex
 from iit.utils.nodes import LLNode, HLNode
-from tracr.compiler.compiling import TracrOutput
 from tracr.craft.bases import BasisDirection, VectorSpaceWithBasis
 from tracr.craft.transformers import SeriesWithResiduals, MLP, MultiAttentionHead
 
 from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.utils.iit.tracr_hl_node import TracrHLNode
 
+if TYPE_CHECKING:
+    # Only needed for type hints, importing the Tracr compiler pulls in JAX and Haiku.
+    from tracr.compiler.compiling import TracrOutput
+
 TracrHLNodeMappingInfo = Tuple[
     int, Literal["attn", "mlp"], Optional[int | TorchIndex]]  # (layer, attn_or_mlp, head_index)
 
@@ -0,0 +1,143 @@
+import random
+from typing import Iterator, List, Tuple, Sequence
+
+import numpy as np
+import torch as t
+from torch.utils.data import IterableDataset, DataLoader, get_worker_info
+
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset
+from circuits_benchmark.utils.iit.iit_dataset_batch import IITDatasetBatch
+
+
+class StreamingIITDataset(IterableDataset):
+    """IIT dataset that generates, labels and encodes the data of a case in chunks while it is iterated, instead of
+    materializing all of it upfront. Only one chunk per worker is kept in memory at a time.
+    Each chunk is generated with its own seed, derived from the dataset seed and the chunk index, and written once to
+    the dataset cache (see tracr_dataset_cache), so later epochs map it from disk instead of generating it again.
+    Every epoch visits the chunks in a different order, shuffles the samples within each chunk and pairs each sample
+    with an ablation sample drawn from the same chunk, the same way IITDataset pairs base and ablation data. The order
+    only depends on the dataset seed and the epoch, so the stream is reproducible and can be resumed from any chunk of
+    any epoch (see start_epoch and start_chunk).
+    The data of each chunk is produced by get_clean_data, so it follows any custom input generation of the case. The
+    labels are encoded with the HL model, so when using a GPU the loader should not use worker processes."""
+
+    def __init__(self,
+                 case,
+                 n_samples: int,
+                 seed: int = 0,
+                 chunk_size: int = 10_000,
+                 start_epoch: int = 0,
+                 start_chunk: int = 0,
+                 device: t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu")):
+        self.case = case
+        self.n_samples = n_samples
+        self.seed = seed
+        self.n_chunks = max(1, -(-n_samples // chunk_size))  # ceil division
+        self.start_epoch = start_epoch
+        self.start_chunk = start_chunk
+        self.epoch = start_epoch
+        self.device = device
+
+    def __len__(self):
+        return sum(self.get_chunk_len(chunk_index) for chunk_index in self.get_chunk_order(self.epoch))
+
+    def __iter__(self) -> Iterator[Tuple[Tuple[t.Tensor, t.Tensor], Tuple[t.Tensor, t.Tensor]]]:
+        chunk_order = self.get_chunk_order(self.epoch)
+        chunk_seeds = self.get_chunk_shuffle_seeds(self.epoch)
+
+        worker_info = get_worker_info()
+        if worker_info is not None:
+            # each worker produces a disjoint subset of the chunks
+            chunk_order = chunk_order[worker_info.id::worker_info.num_workers]
+
+        for chunk_index in chunk_order:
+            chunk = self.get_chunk(chunk_index)
+
+            rng = np.random.default_rng(chunk_seeds[chunk_index])
+            base_indices = t.from_numpy(rng.permutation(len(chunk)))
+            ablation_indices = t.from_numpy(rng.integers(0, len(chunk), size=len(chunk)))
+
+            # gather the samples of the chunk at once, instead of reading them from disk one by one
+            base_inputs, base_targets = chunk[base_indices]
+            ablation_inputs, ablation_targets = chunk[ablation_indices]
+
+            for i in range(len(chunk)):
+                yield (base_inputs[i], base_targets[i]), (ablation_inputs[i], ablation_targets[i])
+
+    def set_epoch(self, epoch: int):
+        """Sets the epoch produced by the next iteration over the dataset. StreamingIITDataLoader calls this before each
+        epoch."""
+        self.epoch = epoch
+
+    def get_chunk_order(self, epoch: int) -> List[int]:
+        """Returns the indices of the chunks in the order in which they are visited in the given epoch. The first
+        start_chunk chunks of start_epoch are skipped, so that an interrupted epoch can be resumed."""
+        rng = np.random.default_rng(self.get_epoch_seed(epoch))
+        chunk_order = rng.permutation(self.n_chunks).tolist()
+        return chunk_order[self.start_chunk:] if epoch == self.start_epoch else chunk_order
+
+    def get_chunk_shuffle_seeds(self, epoch: int) -> List[int]:
+        """Returns the seed used to shuffle and pair the samples of each chunk in the given epoch."""
+        return np.random.SeedSequence(self.get_epoch_seed(epoch)).generate_state(self.n_chunks).tolist()
+
+    def get_epoch_seed(self, epoch: int) -> int:
+        # the epoch goes in the spawn key, so that epoch seeds never collide with the seeds of the chunks
+        return int(np.random.SeedSequence(self.seed, spawn_key=(epoch,)).generate_state(1)[0])
+
+    def get_chunk_len(self, chunk_index: int) -> int:
+        """Chunks are balanced, so that the last one is not much smaller than the others."""
+        chunk_len, remainder = divmod(self.n_samples, self.n_chunks)
+        return chunk_len + (1 if chunk_index < remainder else 0)
+
+    def get_chunk_seed(self, chunk_index: int) -> int:
+        return int(np.random.SeedSequence([self.seed, chunk_index]).generate_state(1)[0])
+
+    def get_chunk(self, chunk_index: int) -> TracrEncodedDataset:
+        """Returns the data of a chunk. It only depends on the seed and the chunk index, and is generated, labeled and
+        encoded the first time it is requested. Afterwards, it is memory-mapped from the dataset cache."""
+        # get_clean_data seeds the global random number generators, so we restore them afterwards to avoid interfering
+        # with the randomness of the training loop.
+        rng_states = t.random.get_rng_state(), np.random.get_state(), random.getstate()
+        try:
+            return self.case.get_clean_data(min_samples=None,
+                                            max_samples=self.get_chunk_len(chunk_index),
+                                            seed=self.get_chunk_seed(chunk_index))
+        finally:
+            t.random.set_rng_state(rng_states[0])
+            np.random.set_state(rng_states[1])
+            random.setstate(rng_states[2])
+
+    @staticmethod
+    def collate_fn(batch, device: t.device = t.device("cuda") if t.cuda.is_available() else t.device("cpu")
+                   ) -> IITDatasetBatch:
+        base_data, ablation_data = zip(*batch)
+        return StreamingIITDataset.stack_samples(base_data, device), \
+            StreamingIITDataset.stack_samples(ablation_data, device)
+
+    @staticmethod
+    def stack_samples(samples: Sequence[Tuple[t.Tensor, t.Tensor]], device: t.device) -> Tuple[t.Tensor, t.Tensor]:
+        inputs = t.stack([x[0] for x in samples])
+        targets = t.stack([x[1] for x in samples])
+        return inputs.to(device=device), targets.to(device=device)
+
+    def make_loader(self, batch_size: int, num_workers: int = 0) -> DataLoader:
+        return StreamingIITDataLoader(
+            self,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            collate_fn=lambda x: self.collate_fn(x, device=self.device),
+        )
+
+
+class StreamingIITDataLoader(DataLoader):
+    """Loader for a StreamingIITDataset that advances the epoch of the dataset each time it is iterated, starting from
+    its start_epoch. The epoch is set before the iterator is created, so that worker processes get it too."""
+
+    def __init__(self, dataset: StreamingIITDataset, *args, **kwargs):
+        super().__init__(dataset, *args, **kwargs)
+        self.next_epoch = dataset.start_epoch
+
+    def __iter__(self):
+        self.dataset.set_epoch(self.next_epoch)
+        self.next_epoch += 1
+        return super().__iter__()
@@ -31,3 +31,22 @@ def get_default_output_dir() -> str:
     :return: the default output directory for the project.
     """
     return str(os.path.join(detect_project_root(), "results"))
+
+
+def get_default_cache_dir() -> str:
+    """
+    Get the default directory for artifacts that are cached across runs (e.g., compiled Tracr models).
+    It can be overridden with the CIRCUITS_BENCHMARK_CACHE_DIR environment variable, e.g. to share it between jobs.
+    :return: the default cache directory for the project.
+    """
+    return os.environ.get("CIRCUITS_BENCHMARK_CACHE_DIR", str(os.path.join(detect_project_root(), ".cache")))
+
+
+def get_default_bundle_dir() -> str:
+    """
+    Get the default directory of the benchmark bundle (see benchmark_bundle), from which cases load their precompiled
+    models, datasets and ground truth circuits when available.
+    It can be overridden with the CIRCUITS_BENCHMARK_BUNDLE_DIR environment variable.
+    :return: the default bundle directory for the project.
+    """
+    return os.environ.get("CIRCUITS_BENCHMARK_BUNDLE_DIR", str(os.path.join(detect_project_root(), "bundle")))
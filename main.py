@@ -2,16 +2,12 @@
 import logging
 import sys
 
-import jax
-
 from circuits_benchmark.commands.build_main_parser import build_main_parser
 from circuits_benchmark.commands.algorithms import run_algorithm
+from circuits_benchmark.commands.bundle import bundle
 from circuits_benchmark.commands.train import train
 from circuits_benchmark.commands.evaluation import evaluation
 
-# The default of float16 can lead to discrepancies between outputs of
-# the compiled model and the RASP program.
-jax.config.update('jax_default_matmul_precision', 'float32')
 logging.basicConfig(level=logging.ERROR)
 
 if __name__ == "__main__":
@@ -24,3 +20,5 @@ if __name__ == "__main__":
     train.run(args)
   elif args.command == "eval":
     evaluation.run(args)
+  elif args.command == "bundle":
+    bundle.run(args)
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+import pytest
+from tracr.rasp import rasp
+
+from circuits_benchmark.benchmark.batched_rasp_evaluator import BatchedRASPEvaluator
+from circuits_benchmark.benchmark.common_programs import make_length, make_frac_prevs, make_shuffle_dyck, make_hist, \
+    make_sort, shift_by, detect_pattern, make_unique_token_extractor, make_reverse
+from circuits_benchmark.benchmark.tracr_benchmark_case import TracrBenchmarkCase
+from circuits_benchmark.utils.circleci import is_running_in_circleci, get_circleci_cases_percentage
+from circuits_benchmark.utils.get_cases import get_cases
+
+
+class TestBatchedRASPEvaluator:
+    @pytest.mark.parametrize("program, vocab", [
+        (make_length(), {"a", "b", "c"}),
+        (make_frac_prevs(rasp.tokens == "x"), {"a", "b", "x"}),
+        (make_shuffle_dyck(["()", "{}"]), {"(", ")", "{", "}"}),
+        (make_hist(), {"a", "b", "c", "d"}),
+        (make_sort(rasp.tokens, rasp.tokens, 10, 1), {0, 1, 2, 3, 4}),
+        (shift_by(2, rasp.tokens), {"a", "b", "c"}),
+        (detect_pattern(rasp.tokens, "abc"), {"a", "b", "c"}),
+        (make_unique_token_extractor(rasp.tokens), {"a", "b", "c", "d"}),
+        (make_reverse(rasp.tokens), {"a", "b", "c", "d"}),
+    ])
+    def test_batched_evaluation_matches_interpreter(self, program, vocab):
+        vals = sorted(vocab)
+        token_codes = np.random.default_rng(42).integers(0, len(vals), size=(500, 8))
+
+        outputs = BatchedRASPEvaluator().evaluate(program, token_codes, vals)
+
+        for codes, output in zip(token_codes, outputs):
+            assert output.tolist() == program([vals[c] for c in codes])
+
+    def test_batched_evaluation_matches_interpreter_on_all_cases(self):
+        cases = get_cases()
+
+        if is_running_in_circleci():
+            # randomly select a subset of the cases to run on CircleCI (no replacement)
+            cases = random.sample(cases, int(get_circleci_cases_percentage() * len(cases)))
+
+        for case in cases:
+            if not isinstance(case, TracrBenchmarkCase) or not case.batched_rasp_evaluation:
+                continue
+
+            data = case.get_clean_data(max_samples=100, variable_length_seqs=True, encoded_dataset=False)
+            outputs = case.get_correct_outputs_in_batch(data.input_ids)
+            expected_outputs = case.get_correct_outputs_per_sample(data.input_ids)
+
+            assert (outputs == expected_outputs).all(), f"Batched evaluation does not match for case {case}"
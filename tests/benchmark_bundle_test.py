@@ -0,0 +1,33 @@
+import torch as t
+
+from circuits_benchmark.benchmark.benchmark_bundle import build_case_bundle, install_bundle, load_bundled_hl_model, \
+    load_bundled_dataset, load_bundled_gt_circuit
+from circuits_benchmark.benchmark.cases.case_3 import Case3
+
+
+class TestBenchmarkBundle:
+    def test_case_is_served_from_bundle(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CIRCUITS_BENCHMARK_BUNDLE_DIR", str(tmp_path / "bundle"))
+        case = Case3()
+        build_case_bundle(case, [dict(max_samples=100, seed=42), dict(max_samples=100, seed=43)])
+
+        hl_model = load_bundled_hl_model(case, device="cpu")
+        for name, param in case.get_hl_model(device="cpu").state_dict().items():
+            assert t.equal(param, hl_model.state_dict()[name])
+
+        clean_data = case.get_clean_data(max_samples=100, use_dataset_cache=False)
+        bundled_clean_data = load_bundled_dataset(case, case.get_dataset_params(max_samples=100, seed=42))
+        assert t.equal(clean_data.get_inputs(), bundled_clean_data.get_inputs())
+        assert load_bundled_dataset(case, case.get_dataset_params(max_samples=200, seed=42)) is None
+
+        corrupted_data = Case3().get_corrupted_data(max_samples=100)
+        assert t.equal(corrupted_data.get_inputs(), case.get_clean_data(max_samples=100, seed=43).get_inputs())
+
+        gt_circuit = load_bundled_gt_circuit(case, "acdc_hooks")
+        assert set(gt_circuit.edges) == set(Case3().get_hl_gt_circuit(granularity="acdc_hooks").edges)
+
+    def test_install_bundle_copies_cases(self, tmp_path):
+        build_case_bundle(Case3(), [], bundle_dir=str(tmp_path / "source"))
+
+        assert install_bundle(str(tmp_path / "source"), bundle_dir=str(tmp_path / "target")) == ["3"]
+        assert (tmp_path / "target" / "v1" / "case_3" / "hl_model.safetensors").exists()
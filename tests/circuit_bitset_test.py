@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_bitset import CircuitIndex
+from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
+
+
+class CircuitBitsetTest(unittest.TestCase):
+    def build_circuit(self, edges):
+        circuit = Circuit()
+        for u, v in edges:
+            circuit.add_edge(CircuitNode(*u), CircuitNode(*v))
+        return circuit
+
+    def setUp(self):
+        self.resid_pre = ("blocks.0.hook_resid_pre",)
+        self.heads = [("blocks.0.attn.hook_result", head) for head in range(3)]
+        self.mlp_out = ("blocks.0.hook_mlp_out",)
+        self.resid_post = ("blocks.0.hook_resid_post",)
+
+        full_edges = [(self.resid_pre, head) for head in self.heads] + \
+                     [(self.resid_pre, self.mlp_out)] + \
+                     [(head, self.mlp_out) for head in self.heads] + \
+                     [(head, self.resid_post) for head in self.heads] + \
+                     [(self.mlp_out, self.resid_post)]
+        self.full_circuit = self.build_circuit(full_edges)
+        self.index = CircuitIndex(self.full_circuit)
+
+    def test_index_is_canonical(self):
+        reversed_circuit = Circuit()
+        reversed_circuit.add_edges_from(reversed(list(self.full_circuit.edges)))
+        other_index = CircuitIndex(reversed_circuit)
+
+        self.assertEqual(self.index.nodes, other_index.nodes)
+        self.assertEqual(self.index.edges, other_index.edges)
+        self.assertEqual(self.index.n_nodes, 6)
+        self.assertEqual(self.index.n_edges, 11)
+
+    def test_circuit_round_trip(self):
+        circuit = self.build_circuit([(self.resid_pre, self.heads[1]),
+                                      (self.heads[1], self.mlp_out),
+                                      (self.mlp_out, self.resid_post)])
+        restored = self.index.to_circuit(self.index.from_circuit(circuit))
+
+        self.assertEqual(set(restored.nodes), set(circuit.nodes))
+        self.assertEqual(set(restored.edges), set(circuit.edges))
+
+        with self.assertRaises(ValueError):
+            self.index.from_circuit(self.build_circuit([(self.resid_post, self.resid_pre)]))
+
+    def test_calculate_rates_for_many_circuits(self):
+        true_circuit = self.build_circuit([(self.resid_pre, self.heads[0]), (self.heads[0], self.resid_post)])
+        hypotheses = [
+            true_circuit,
+            self.build_circuit([(self.resid_pre, self.heads[0]), (self.heads[0], self.mlp_out),
+                                (self.mlp_out, self.resid_post)]),
+            Circuit(),
+            self.full_circuit,
+        ]
+
+        result = self.index.calculate_rates(self.index.from_circuits(hypotheses), self.index.from_circuit(true_circuit))
+
+        for i, hypothesis in enumerate(hypotheses):
+            for name, all_elements, true_elements, hypothesis_elements, rates in [
+                ("nodes", set(self.full_circuit.nodes), set(true_circuit.nodes), set(hypothesis.nodes), result.nodes),
+                ("edges", set(self.full_circuit.edges), set(true_circuit.edges), set(hypothesis.edges), result.edges),
+            ]:
+                tp = len(hypothesis_elements & true_elements)
+                fp = len(hypothesis_elements - true_elements)
+                fn = len(true_elements - hypothesis_elements)
+                tn = len(all_elements - (hypothesis_elements | true_elements))
+                self.assertEqual((rates.true_positive[i], rates.false_positive[i],
+                                  rates.false_negative[i], rates.true_negative[i]), (tp, fp, fn, tn), name)
+                self.assertAlmostEqual(rates.tpr[i], tp / (tp + fn))
+                self.assertAlmostEqual(rates.fpr[i], fp / (fp + tn))
+
+    def test_nodes_can_be_derived_from_edges(self):
+        edge_mask = np.zeros((2, self.index.n_edges), dtype=bool)
+        edge_mask[1, self.index.edge_ids[(CircuitNode(*self.heads[2]), CircuitNode(*self.resid_post))]] = True
+        bitset = self.index.from_masks(None, edge_mask)
+
+        self.assertEqual(bitset.count_nodes().tolist(), [0, 2])
+        self.assertEqual(set(self.index.to_circuit(bitset[1]).nodes),
+                         {CircuitNode(*self.heads[2]), CircuitNode(*self.resid_post)})
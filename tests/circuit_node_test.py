@@ -0,0 +1,56 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+from circuits_benchmark.utils.circuit.circuit_node import CircuitNode, LegacyCircuitNodeUnpickler
+from circuits_benchmark.utils.cloudpickle import load_from_pickle
+
+# [CircuitNode("blocks.0.attn.hook_result", 1), CircuitNode("embed")], pickled before nodes were interned
+LEGACY_NODES_PICKLE = (b'\x80\x04\x95\x91\x00\x00\x00\x00\x00\x00\x00]\x94(\x8c-circuits_benchmark.utils.circuit.circuit_node'
+                       b'\x94\x8c\x0bCircuitNode\x94\x93\x94)\x81\x94}\x94(\x8c\x04name\x94\x8c\x19blocks.0.attn.hook_result'
+                       b'\x94\x8c\x05index\x94K\x01ubh\x03)\x81\x94}\x94(h\x06\x8c\x05embed\x94h\x08Nube.')
+
+
+class CircuitNodeTest(unittest.TestCase):
+    def test_nodes_are_interned_and_immutable(self):
+        node = CircuitNode("blocks.0.attn.hook_result", 1)
+        self.assertIs(node, CircuitNode("blocks.0.attn.hook_result", 1))
+        self.assertIsNot(node, CircuitNode("blocks.0.attn.hook_result", 2))
+        self.assertIsNot(node, CircuitNode("blocks.0.attn.hook_result"))
+
+        with self.assertRaises(AttributeError):
+            node.index = 2
+
+    def test_ordering_puts_nodes_without_index_last(self):
+        nodes = [CircuitNode("b"), CircuitNode("a"), CircuitNode("b", 0), CircuitNode("a", 3), CircuitNode("a", 1)]
+        self.assertEqual([str(node) for node in sorted(nodes)], ["a[1]", "a[3]", "a", "b[0]", "b"])
+
+    def test_pickle_roundtrip_returns_interned_node(self):
+        node = CircuitNode("blocks.0.attn.hook_result", 1)
+        self.assertIs(pickle.loads(pickle.dumps(node)), node)
+
+    def test_nodes_require_a_name(self):
+        with self.assertRaises(TypeError):
+            CircuitNode()
+
+    def test_legacy_pickles_can_be_loaded(self):
+        nodes = LegacyCircuitNodeUnpickler(io.BytesIO(LEGACY_NODES_PICKLE)).load()
+
+        self.assertEqual(nodes, [CircuitNode("blocks.0.attn.hook_result", 1), CircuitNode("embed")])
+        self.assertIs(nodes[0], CircuitNode("blocks.0.attn.hook_result", 1))
+        self.assertIs(nodes[1], CircuitNode("embed"))
+        self.assertEqual(str(nodes[1]), "embed")
+
+        # nodes pickled since then are loaded by the legacy unpickler too
+        node = CircuitNode("blocks.1.hook_mlp_out")
+        self.assertIs(LegacyCircuitNodeUnpickler(io.BytesIO(pickle.dumps([node, node]))).load()[1], node)
+
+    def test_load_from_pickle_falls_back_to_legacy_unpickler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "nodes.pkl")
+            with open(path, "wb") as f:
+                f.write(LEGACY_NODES_PICKLE)
+
+            self.assertIs(load_from_pickle(path)[1], CircuitNode("embed"))
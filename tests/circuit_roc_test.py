@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_eval import calculate_fpr_and_tpr, get_full_circuit
+from circuits_benchmark.utils.circuit.circuit_roc import EdgeScores, calculate_roc
+
+
+class CircuitROCTest(unittest.TestCase):
+    def test_roc_matches_evaluating_each_threshold(self):
+        full_circuit = get_full_circuit(2, 2)
+        rng = np.random.default_rng(0)
+
+        edges = list(full_circuit.edges)
+        # the second head of each layer is not part of the true circuit
+        true_circuit = Circuit()
+        true_circuit.add_edges_from([(u, v) for u, v in edges if 1 not in [u.index, v.index] and rng.random() < 0.3])
+
+        # a few edges are left without score, and scores are rounded so that there are ties
+        scored_edges = [edge for edge in edges if rng.random() < 0.9]
+        edge_scores = EdgeScores(scored_edges, np.round(rng.normal(size=len(scored_edges)), 1))
+
+        for abs_value_threshold in [False, True]:
+            roc = calculate_roc(edge_scores, true_circuit, full_circuit, abs_value_threshold=abs_value_threshold)
+
+            self.assertEqual(roc.thresholds[-1], -np.inf)
+            self.assertTrue(np.all(np.diff(roc.thresholds) < 0))
+            for curve in [roc.nodes, roc.edges]:
+                self.assertEqual((curve.tpr[0], curve.fpr[0]), (0, 0))
+                self.assertTrue(0 <= curve.auc <= 1)
+
+            # point k is the circuit built for thresholds[k], including the empty circuit and the one with all the
+            # scored edges
+            for k, threshold in enumerate(roc.thresholds):
+                circuit = edge_scores.build_circuit(threshold, abs_value_threshold)
+                result = calculate_fpr_and_tpr(circuit, true_circuit, full_circuit, print_summary=False)
+
+                self.assertAlmostEqual(roc.nodes.tpr[k], result.nodes.tpr)
+                self.assertAlmostEqual(roc.nodes.fpr[k], result.nodes.fpr)
+                self.assertAlmostEqual(roc.edges.tpr[k], result.edges.tpr)
+                self.assertAlmostEqual(roc.edges.fpr[k], result.edges.fpr)
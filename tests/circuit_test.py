@@ -1,8 +1,14 @@
+import pickle
 import unittest
 
+import networkx as nx
+
 from circuits_benchmark.benchmark.cases.case_21 import Case21
 from circuits_benchmark.benchmark.cases.case_3 import Case3
 from circuits_benchmark.transformers.tracr_circuits_builder import build_tracr_circuits
+from circuits_benchmark.utils.circuit.circuit import Circuit
+from circuits_benchmark.utils.circuit.circuit_eval import get_full_circuit
+from circuits_benchmark.utils.circuit.circuit_node import CircuitNode
 
 
 class CircuitTest(unittest.TestCase):
@@ -127,3 +133,43 @@ class CircuitTest(unittest.TestCase):
         tracr_circuits = build_tracr_circuits(tacr_output.graph, tacr_output.craft_model, granularity="acdc_hooks")
         for k, v in tracr_circuits.alignment.hl_to_ll_mapping.items():
             self.assertIsInstance(k, str)
+
+    def test_node_membership_by_name_follows_added_and_removed_nodes(self):
+        circuit = Circuit()
+        circuit.add_edges_from([(CircuitNode("blocks.0.attn.hook_result", 0), CircuitNode("blocks.1.hook_mlp_in")),
+                                (CircuitNode("blocks.0.attn.hook_result", 1), CircuitNode("blocks.1.hook_mlp_in"))])
+        circuit.add_node(CircuitNode("hook_embed"))
+
+        self.assertIn("blocks.0.attn.hook_result", circuit.nodes)
+        self.assertIn("hook_embed", circuit.nodes)
+        self.assertIn(CircuitNode("blocks.0.attn.hook_result", 1), circuit.nodes)
+        self.assertNotIn("blocks.0.attn.hook_result[1]", circuit.nodes)
+
+        circuit.remove_node(CircuitNode("blocks.0.attn.hook_result", 0))
+        self.assertIn("blocks.0.attn.hook_result", circuit.nodes)
+        circuit.remove_nodes_from([CircuitNode("blocks.0.attn.hook_result", 1)])
+        self.assertNotIn("blocks.0.attn.hook_result", circuit.nodes)
+        self.assertNotIn(CircuitNode("blocks.0.attn.hook_result", 1), circuit.nodes)
+
+        loaded_circuit = pickle.loads(pickle.dumps(circuit))
+        self.assertIn("blocks.1.hook_mlp_in", loaded_circuit.nodes)
+        self.assertNotIn("blocks.0.attn.hook_result", loaded_circuit.nodes)
+
+    def test_full_circuit_is_cached_and_frozen(self):
+        full_circuit = get_full_circuit(2, 4)
+        self.assertIs(get_full_circuit(2, 4), full_circuit)
+        self.assertEqual(len(full_circuit.nodes), 2 + 2 * (4 * 7 + 2) + 1)
+        self.assertEqual(len(full_circuit.edges), 187)
+        self.assertIn((CircuitNode("blocks.0.attn.hook_result", 3), CircuitNode("blocks.1.hook_k_input", 0)),
+                      full_circuit.edges)
+        self.assertIn((CircuitNode("blocks.1.attn.hook_result", 2), CircuitNode("blocks.1.hook_mlp_in")),
+                      full_circuit.edges)
+        self.assertNotIn((CircuitNode("blocks.1.attn.hook_result", 2), CircuitNode("blocks.1.hook_q_input", 0)),
+                         full_circuit.edges)
+
+        with self.assertRaises(nx.NetworkXError):
+            full_circuit.add_node(CircuitNode("blocks.2.hook_mlp_in"))
+
+        circuit = full_circuit.copy()
+        circuit.remove_node(CircuitNode("hook_embed"))
+        self.assertIn(CircuitNode("hook_embed"), full_circuit.nodes)
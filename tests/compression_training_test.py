@@ -51,7 +51,7 @@ class TestCompressionTraining:
 
     @pytest.mark.parametrize("case", [Case1(), Case32(), Case19()])
     def test_siia_is_not_nan_for_models_that_have_all_nodes_in_circuit(self, case):
-        hl_model: HookedTracrTransformer = case.get_hl_model()
+        hl_model: HookedTracrTransformer = case.get_hl_model(copy=True)
 
         original_d_model_size = hl_model.cfg.d_model
         original_d_head_size = hl_model.cfg.d_head
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def use_temporary_cache_dir(tmp_path, monkeypatch):
+    """Keeps the compiled models and datasets generated by the tests out of the project cache."""
+    monkeypatch.setenv("CIRCUITS_BENCHMARK_CACHE_DIR", str(tmp_path / "cache"))
@@ -1,6 +1,9 @@
 import unittest
 
+from circuits_benchmark.benchmark.benchmark_case import BenchmarkCase
 from circuits_benchmark.utils.attr_dict import AttrDict
+from circuits_benchmark.utils.cases_index import discover_cases
+from circuits_benchmark.utils.find_all_subclasses import find_all_transitive_subclasses_in_package
 from circuits_benchmark.utils.get_cases import get_cases
 
 
@@ -25,3 +28,17 @@ class GetCasesTest(unittest.TestCase):
         args = AttrDict({"indices": "ioi,ioi_next_token"})
         cases = get_cases(args)
         self.assertEqual(len(cases), 2)
+
+    def test_discovered_cases_match_case_classes(self):
+        classes = find_all_transitive_subclasses_in_package(BenchmarkCase, "circuits_benchmark.benchmark.cases")
+        case_ids = sorted([cls.__name__[4:].lower() for cls in classes if cls.__name__.startswith("Case")])
+
+        self.assertEqual(sorted([entry.case_id for entry in discover_cases()]), case_ids)
+
+    def test_cases_filtered_by_metadata(self):
+        cases = get_cases(filter_fn=lambda case: case.is_categorical and case.max_seq_len <= 6)
+
+        assert len(cases) > 0
+        for case in cases:
+            assert case.is_categorical()
+            assert case.get_max_seq_len() <= 6
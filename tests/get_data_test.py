@@ -1,7 +1,14 @@
 from typing import List
 
+import numpy as np
+import torch as t
+
 from circuits_benchmark.benchmark.cases.case_1 import Case1
 from circuits_benchmark.benchmark.cases.case_3 import Case3
+from circuits_benchmark.benchmark.cases.case_5 import Case5
+from circuits_benchmark.benchmark.tracr_encoded_dataset import LengthBucketSampler
+from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
+from circuits_benchmark.metrics.pad_mask import get_non_pad_mask
 
 
 class TestGetCleanData:
@@ -18,6 +25,23 @@ class TestGetCleanData:
         data = case.get_clean_data(max_samples=10, variable_length_seqs=True)
         assert len(data.get_inputs()) == 10
 
+    def test_length_bucketed_batches_match_untrimmed_outputs(self):
+        case = Case3()
+        hl_model = case.get_hl_model()
+        data = case.get_clean_data(max_samples=500, variable_length_seqs=True)
+
+        assert hl_model.cfg.attention_dir == "causal" and data.causal
+        assert len(data.get_seq_lens().unique()) > 1
+
+        for bucket in LengthBucketSampler(data.get_seq_lens(), batch_size=64, shuffle=True):
+            trimmed_inputs, _ = data[bucket]
+            with t.no_grad():
+                trimmed_outputs = hl_model(trimmed_inputs)
+                untrimmed_outputs = hl_model(data.get_inputs()[bucket.indices])[:, :bucket.seq_len]
+
+            non_pad_mask = get_non_pad_mask(trimmed_inputs, data.pad_token_id)
+            assert t.allclose(trimmed_outputs[non_pad_mask], untrimmed_outputs[non_pad_mask], atol=1e-5)
+
     def test_case_1_should_have_balanced_inputs(self):
         case = Case1()
         data = case.get_clean_data(max_samples=100, encoded_dataset=False)
@@ -30,3 +54,82 @@ class TestGetCleanData:
         assert len([o for o in encoded_outputs if o.count(0) == len(o)]) == 15
         assert len([o for o in encoded_outputs if o.count(1) == len(o)]) == 15
         assert len([o for o in encoded_outputs if o.count(0) != len(o) and o.count(1) != len(o)]) == 70
+
+    def test_compiled_model_labels_match_rasp_labels(self):
+        case = Case3()
+        rasp_data = case.get_clean_data(max_samples=100, encoded_dataset=False)
+        compiled_data = case.get_clean_data(max_samples=100, encoded_dataset=False, compiled_model_labels=True)
+
+        assert case.compiled_model_labels_validated
+        assert (rasp_data.input_ids == compiled_data.input_ids).all()
+
+        rasp_outputs = rasp_data.get_targets()[:, 1:]
+        compiled_outputs = compiled_data.get_targets()[:, 1:]
+        assert (np.isclose(rasp_outputs.astype(float), compiled_outputs.astype(float), atol=1.e-2)).all()
+
+        # compiled labels are only used when requested, not by later calls
+        assert (case.get_correct_outputs(rasp_data.input_ids) == rasp_data.get_targets()).all()
+
+    def test_cached_dataset_matches_generated_dataset(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CIRCUITS_BENCHMARK_CACHE_DIR", str(tmp_path))
+        case = Case3()
+
+        generated_data = case.get_clean_data(max_samples=100, seed=7)
+        generated_next_random = np.random.rand()
+        cached_data = case.get_clean_data(max_samples=100, seed=7)
+        cached_next_random = np.random.rand()
+
+        assert t.equal(generated_data.get_inputs(), cached_data.get_inputs())
+        assert t.equal(generated_data.get_targets().cpu(), cached_data.get_targets())
+        assert generated_next_random == cached_next_random
+
+    def test_unique_data_has_no_repeated_inputs(self):
+        case = Case3()
+        data = case.get_clean_data(max_samples=1000, unique_data=True, encoded_dataset=False)
+        all_data = case.get_clean_data(max_samples=1000, encoded_dataset=False)
+
+        inputs = [tuple(input) for input in data.get_inputs()]
+        assert len(inputs) == len(set(inputs))
+        assert set(inputs) == set(tuple(input) for input in all_data.get_inputs())
+
+    def test_sampled_data_is_reproducible_for_each_sampling_rng_version(self):
+        for sampling_rng_version in [1, 2]:
+            case = Case3()
+            case.sampling_rng_version = sampling_rng_version
+            data = case.get_clean_data(max_samples=100, seed=7, encoded_dataset=False)
+            same_data = case.get_clean_data(max_samples=100, seed=7, encoded_dataset=False)
+
+            assert data.get_inputs().tolist() == same_data.get_inputs().tolist()
+            assert data.get_targets().tolist() == same_data.get_targets().tolist()
+
+    def test_batched_sampler_of_case_5_produces_balanced_inputs(self):
+        case = Case5()
+        input_ids = case.gen_balanced_input_ids(np.random.default_rng(0), 100, case.get_min_seq_len(),
+                                                case.get_max_seq_len())
+
+        for input_id in input_ids:
+            seq = [v for v in case.get_framed_vocab()[input_id] if v not in [TRACR_BOS, TRACR_PAD]]
+            assert seq.count("(") == seq.count(")")
+            assert seq.count("{") == seq.count("}")
+            assert case.get_correct_output_for_input(seq)[-1] == 1
+
+    def test_corrupted_data_derived_from_clean_data(self):
+        case = Case3()
+        clean_data = case.get_clean_data(max_samples=100, use_dataset_cache=False)
+
+        for corruption in ["permutation", "same_length", "position_resample"]:
+            corrupted_data = case.get_corrupted_data(max_samples=100, corruption=corruption, clean_data=clean_data)
+            assert len(corrupted_data) == len(clean_data)
+            assert t.equal(corrupted_data.get_seq_lens().sort().values, clean_data.get_seq_lens().sort().values)
+
+    def test_data_generated_by_worker_processes(self):
+        datasets = []
+        for data_workers in [1, 2]:
+            case = Case3()
+            case.data_workers = data_workers
+            datasets.append(case.get_clean_data(max_samples=25_000, encoded_dataset=False))
+
+        inputs, targets = datasets[0].get_inputs(), datasets[0].get_targets()
+        assert inputs.tolist() == datasets[1].get_inputs().tolist()
+        assert targets.tolist() == datasets[1].get_targets().tolist()
+        assert targets.tolist() == Case3().get_correct_outputs(datasets[0].input_ids).tolist()
@@ -0,0 +1,59 @@
+import torch as t
+
+from circuits_benchmark.benchmark.cases.case_3 import Case3
+from circuits_benchmark.transformers.hooked_tracr_transformer import HookedTracrTransformer
+
+
+class TestHLModelCache:
+    def test_hl_model_is_cached_per_case_and_device(self):
+        case = Case3()
+        hl_model = case.get_hl_model(device="cpu")
+
+        assert Case3().get_hl_model(device="cpu") is hl_model
+
+        case.invalidate_hl_model_cache()
+        assert case.get_hl_model(device="cpu") is not hl_model
+
+    def test_hl_model_copy_has_same_weights(self):
+        case = Case3()
+        hl_model = case.get_hl_model(device="cpu")
+        hl_model_copy = case.get_hl_model(device="cpu", copy=True)
+
+        assert hl_model_copy is not hl_model
+        for name, param in hl_model.state_dict().items():
+            assert t.equal(param, hl_model_copy.state_dict()[name])
+
+    def test_pruned_hl_model_falls_back_to_a_copy(self, monkeypatch):
+        def prune_with_wrong_logits(hl_model):
+            pruned_hl_model = HookedTracrTransformer.from_hooked_tracr_transformer(hl_model)
+            with t.no_grad():
+                pruned_hl_model.unembed.b_U.add_(1)
+            return pruned_hl_model, {}
+
+        # the pruned model does not pass the validation, so the original model is used instead
+        monkeypatch.setattr(HookedTracrTransformer, "prune_residual_stream", prune_with_wrong_logits)
+        case = Case3()
+        case.invalidate_hl_model_cache()
+        hl_model = case.get_hl_model(device="cpu")
+        pruned_hl_model = case.get_hl_model(device="cpu", pruned=True)
+        case.invalidate_hl_model_cache()
+
+        assert pruned_hl_model is not hl_model
+        for name, param in hl_model.state_dict().items():
+            assert t.equal(param, pruned_hl_model.state_dict()[name])
+
+    def test_precompiled_hl_model_matches_compiled_model(self, tmp_path):
+        case = Case3()
+        hl_model = HookedTracrTransformer.from_tracr_model(case.get_tracr_output().model, device="cpu")
+
+        path = str(tmp_path / "hl_model.pt")
+        hl_model.save_precompiled(path)
+        precompiled_hl_model = HookedTracrTransformer.from_precompiled(path, device="cpu")
+
+        assert precompiled_hl_model.residual_stream_labels == hl_model.residual_stream_labels
+        for name, param in hl_model.state_dict().items():
+            assert t.equal(param, precompiled_hl_model.state_dict()[name])
+
+        data = case.get_clean_data(max_samples=10, encoded_dataset=False)
+        assert precompiled_hl_model(data.get_inputs(), return_type="decoded") == \
+               hl_model(data.get_inputs(), return_type="decoded")
@@ -2,6 +2,7 @@ import logging
 import unittest
 
 import jax
+import torch as t
 from tracr.compiler import compiling
 from tracr.rasp import rasp
 
@@ -41,3 +42,73 @@ class HookedTracrTransformerTest(unittest.TestCase):
         print("TransformerLens Replicated Decoding:", tl_output_decoded)
 
         self.assertEqual(tracr_output_decoded, tl_output_decoded)
+
+    def test_batch_encoding_matches_tracr_encoders(self):
+        program = make_reverse(rasp.tokens)
+        tracr_output = compiling.compile_rasp_to_model(
+            program,
+            vocab={1, "a", 2.5},
+            max_seq_len=4,
+            compiler_bos=TRACR_BOS,
+            compiler_pad=TRACR_PAD,
+        )
+        tl_model = HookedTracrTransformer.from_tracr_model(tracr_output.model)
+
+        inputs = [[TRACR_BOS, 1, "a", 2.5, TRACR_PAD], [TRACR_BOS, 2.5, 2.5, 1, "a"]]
+        expected_encoding = [tracr_output.model.input_encoder.encode(input) for input in inputs]
+        self.assertEqual(tl_model.map_tracr_input_to_tl_input(inputs).tolist(), expected_encoding)
+
+        logits = tl_model(tl_model.map_tracr_input_to_tl_input(inputs))
+        expected_decoding = [[TRACR_BOS] + tracr_output.model.output_encoder.decode(output)
+                             for output in logits.argmax(dim=-1)[:, 1:].tolist()]
+        self.assertEqual(tl_model.map_tl_output_to_tracr_output(logits), expected_decoding)
+
+    def test_sparse_weights_match_dense_weights(self):
+        program = make_reverse(rasp.tokens)
+        tracr_output = compiling.compile_rasp_to_model(
+            program,
+            vocab={1, 2, 3},
+            max_seq_len=5,
+            compiler_bos=TRACR_BOS,
+            compiler_pad=TRACR_PAD,
+        )
+        tl_model = HookedTracrTransformer.from_tracr_model(tracr_output.model, device="cpu")
+        inputs = tl_model.map_tracr_input_to_tl_input([[TRACR_BOS, 1, 2, 3, TRACR_PAD], [TRACR_BOS, 3, 3, 1, 2]])
+
+        dense_logits, dense_cache = tl_model.run_with_cache(inputs)
+        state_dict_keys = set(tl_model.state_dict().keys())
+        tl_model.set_use_sparse_weights(True)
+        sparse_logits, sparse_cache = tl_model.run_with_cache(inputs)
+
+        self.assertTrue(t.allclose(dense_logits, sparse_logits, atol=1e-5))
+        self.assertEqual(set(dense_cache.keys()), set(sparse_cache.keys()))
+        for name in dense_cache.keys():
+            self.assertTrue(t.allclose(dense_cache[name], sparse_cache[name], atol=1e-5), name)
+
+        # the sparse weights are not part of the state dict, and switching back restores the dense layers
+        self.assertEqual(set(tl_model.state_dict().keys()), state_dict_keys)
+        tl_model.set_use_sparse_weights(False)
+        self.assertFalse(tl_model.uses_sparse_weights())
+        self.assertTrue(t.equal(tl_model(inputs), dense_logits))
+
+    def test_pruned_residual_stream_gives_same_outputs(self):
+        program = make_reverse(rasp.tokens)
+        tracr_output = compiling.compile_rasp_to_model(
+            program,
+            vocab={1, 2, 3},
+            max_seq_len=5,
+            compiler_bos=TRACR_BOS,
+            compiler_pad=TRACR_PAD,
+        )
+        tl_model = HookedTracrTransformer.from_tracr_model(tracr_output.model, device="cpu")
+        pruned_model, retained_labels = tl_model.prune_residual_stream()
+
+        self.assertLessEqual(pruned_model.cfg.d_model, tl_model.cfg.d_model)
+        self.assertEqual(list(retained_labels.keys()), pruned_model.residual_stream_labels)
+        for label, index in retained_labels.items():
+            self.assertEqual(tl_model.residual_stream_labels[index], label)
+
+        inputs = [[TRACR_BOS, 1, 2, 3, TRACR_PAD], [TRACR_BOS, 3, 3, 1, 2]]
+        encoded_inputs = tl_model.map_tracr_input_to_tl_input(inputs)
+        self.assertTrue(t.allclose(tl_model(encoded_inputs), pruned_model(encoded_inputs), atol=1e-5))
+        self.assertEqual(pruned_model(inputs, return_type="decoded"), tl_model(inputs, return_type="decoded"))
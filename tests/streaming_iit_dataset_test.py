@@ -0,0 +1,60 @@
+import torch as t
+
+from circuits_benchmark.benchmark.cases.case_3 import Case3
+from circuits_benchmark.utils.iit.streaming_iit_dataset import StreamingIITDataset
+
+
+def get_base_inputs(loader) -> t.Tensor:
+    """Iterates the loader once and returns the inputs of the base samples of all its batches."""
+    return t.cat([base_data[0].cpu() for base_data, ablation_data in loader])
+
+
+class TestStreamingIITDataset:
+    def test_chunks_are_deterministic_and_cached(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CIRCUITS_BENCHMARK_CACHE_DIR", str(tmp_path))
+        dataset = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, device="cpu")
+
+        assert dataset.n_chunks == 3
+        assert [dataset.get_chunk_len(i) for i in range(3)] == [84, 83, 83]
+
+        generated_chunk = dataset.get_chunk(1)
+        assert (tmp_path / "datasets").exists()
+
+        cached_chunk = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, device="cpu").get_chunk(1)
+        assert t.equal(generated_chunk.get_inputs(), cached_chunk.get_inputs())
+        assert t.equal(generated_chunk.get_targets().cpu(), cached_chunk.get_targets().cpu())
+
+    def test_loader_is_reproducible_and_shuffled_per_epoch(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CIRCUITS_BENCHMARK_CACHE_DIR", str(tmp_path))
+        loader = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, device="cpu").make_loader(10)
+        first_epoch = get_base_inputs(loader)
+        second_epoch = get_base_inputs(loader)
+
+        assert len(first_epoch) == len(second_epoch) == 250
+        assert not t.equal(first_epoch, second_epoch)
+        # both epochs contain the same samples, in a different order
+        assert sorted(first_epoch.tolist()) == sorted(second_epoch.tolist())
+
+        same_loader = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, device="cpu").make_loader(10)
+        assert t.equal(get_base_inputs(same_loader), first_epoch)
+        assert t.equal(get_base_inputs(same_loader), second_epoch)
+
+    def test_loader_resumes_from_start_chunk(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("CIRCUITS_BENCHMARK_CACHE_DIR", str(tmp_path))
+        dataset = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, device="cpu")
+        loader = dataset.make_loader(10)
+        first_epoch = get_base_inputs(loader)
+        second_epoch = get_base_inputs(loader)
+
+        # resume the second epoch after its first chunk
+        skipped_len = dataset.get_chunk_len(dataset.get_chunk_order(1)[0])
+        resumed_dataset = StreamingIITDataset(Case3(), n_samples=250, seed=3, chunk_size=100, start_epoch=1,
+                                              start_chunk=1, device="cpu")
+        resumed_loader = resumed_dataset.make_loader(10)
+
+        assert len(resumed_dataset) == 250 - skipped_len
+        assert t.equal(get_base_inputs(resumed_loader), second_epoch[skipped_len:])
+        # later epochs are not skipped
+        third_epoch = get_base_inputs(resumed_loader)
+        assert len(third_epoch) == 250
+        assert not t.equal(third_epoch, first_epoch)
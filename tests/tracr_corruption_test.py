@@ -0,0 +1,28 @@
+import numpy as np
+
+from circuits_benchmark.benchmark.tracr_corruption import get_same_length_indices, resample_positions
+
+
+class TestTracrCorruption:
+    def test_same_length_indices_pair_samples_of_the_same_length(self):
+        seq_lens = np.random.default_rng(0).integers(2, 6, size=500)
+        indices = get_same_length_indices(np.random.default_rng(1), seq_lens)
+
+        assert sorted(indices.tolist()) == list(range(500))
+        assert (seq_lens[indices] == seq_lens).all()
+
+    def test_resample_positions_keeps_tokens_of_each_position(self):
+        pad, bos = 9, 0
+        seq_lens = np.random.default_rng(0).integers(2, 6, size=500)
+        inputs = np.random.default_rng(1).integers(1, 5, size=(500, 5))
+        inputs[:, 0] = bos
+        inputs[np.arange(5)[None, :] >= seq_lens[:, None]] = pad
+
+        corrupted_inputs = resample_positions(np.random.default_rng(2), inputs, seq_lens)
+
+        assert ((corrupted_inputs == pad) == (inputs == pad)).all()
+        assert (corrupted_inputs[:, 0] == bos).all()
+        assert not (corrupted_inputs == inputs).all()
+        for seq_len in np.unique(seq_lens):
+            rows = seq_lens == seq_len
+            assert (np.sort(corrupted_inputs[rows], axis=0) == np.sort(inputs[rows], axis=0)).all()
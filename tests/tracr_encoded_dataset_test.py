@@ -0,0 +1,100 @@
+import pytest
+import torch as t
+from torch.utils.data import DataLoader
+
+from circuits_benchmark.benchmark.tracr_encoded_dataset import TracrEncodedDataset, TracrEncodedDatasetView, \
+    make_paired_loaders
+
+
+def make_padded_dataset(n_samples: int, causal: bool = True, pad_token_id: int = 9) -> TracrEncodedDataset:
+    """Returns a dataset of sequences of random length, whose targets hold the index of each sample."""
+    seq_lens = t.randint(2, 7, (n_samples,))
+    inputs = t.randint(0, 5, (n_samples, 6))
+    inputs[t.arange(6)[None, :] >= seq_lens[:, None]] = pad_token_id
+    targets = t.rand(n_samples, 6, 3)
+    targets[:, :, 0] = t.arange(n_samples, dtype=t.float)[:, None]
+    return TracrEncodedDataset(inputs, targets, pad_token_id=pad_token_id, causal=causal)
+
+
+class TestTracrEncodedDataset:
+
+    @pytest.mark.parametrize("shuffle", [False, True])
+    def test_batched_loader_matches_per_sample_loader(self, shuffle):
+        dataset = TracrEncodedDataset(t.randint(0, 5, (1000, 6)), t.rand(1000, 6, 3))
+
+        t.manual_seed(0)
+        expected_batches = list(DataLoader(dataset, batch_size=64, shuffle=shuffle,
+                                           collate_fn=lambda x: dataset.collate_fn(x, device="cpu")))
+        t.manual_seed(0)
+        batches = list(dataset.make_loader(batch_size=64, shuffle=shuffle, device="cpu"))
+
+        assert len(batches) == len(expected_batches)
+        for (inputs, targets), (expected_inputs, expected_targets) in zip(batches, expected_batches):
+            assert t.equal(inputs, expected_inputs)
+            assert t.equal(targets, expected_targets)
+
+    def test_dataset_view_gathers_rows_from_base_dataset(self):
+        dataset = TracrEncodedDataset(t.randint(0, 5, (100, 6)), t.rand(100, 6, 3))
+        indices = t.randperm(100)
+        view = TracrEncodedDatasetView(dataset, indices)
+
+        assert len(view) == 100
+        assert t.equal(view.get_inputs(), dataset.get_inputs()[indices])
+        assert t.equal(view[3][1], dataset.get_targets()[indices[3]])
+
+        batches = list(view.make_loader(batch_size=32, device="cpu"))
+        assert t.equal(t.cat([inputs for inputs, _ in batches]), dataset.get_inputs()[indices])
+
+    def test_dataset_view_can_be_bucketed_by_length(self):
+        dataset = make_padded_dataset(100)
+        view = TracrEncodedDatasetView(dataset, t.randperm(100)[:60])
+
+        batches = list(view.make_loader(batch_size=16, device="cpu", bucket_by_length=True))
+        for inputs, targets in batches:
+            assert t.equal(inputs, dataset.inputs[targets[:, 0, 0].long(), :inputs.shape[1]])
+        assert sorted(t.cat([targets[:, 0, 0] for _, targets in batches]).long().tolist()) == \
+               sorted(view.indices.tolist())
+
+    @pytest.mark.parametrize("shuffle", [False, True])
+    def test_length_bucketed_loader_trims_padding(self, shuffle):
+        dataset = make_padded_dataset(1000)
+        seq_lens = dataset.get_seq_lens()
+
+        seen_indices = []
+        for batch_inputs, batch_targets in dataset.make_loader(batch_size=64, shuffle=shuffle, device="cpu",
+                                                               bucket_by_length=True):
+            indices = batch_targets[:, 0, 0].long()
+            seen_indices.extend(indices.tolist())
+
+            assert batch_inputs.shape[1] == seq_lens[indices].max()
+            assert t.equal(batch_inputs, dataset.inputs[indices, :batch_inputs.shape[1]])
+            assert t.equal(batch_targets, dataset.targets[indices, :batch_inputs.shape[1]])
+
+        assert sorted(seen_indices) == list(range(1000))
+
+    def test_length_bucketed_loader_requires_causal_dataset(self):
+        with pytest.raises(ValueError):
+            make_padded_dataset(100, causal=False).make_loader(batch_size=64, device="cpu", bucket_by_length=True)
+
+    @pytest.mark.parametrize("bucket_by_length", [False, True])
+    def test_paired_loaders_keep_clean_and_corrupted_samples_together(self, bucket_by_length):
+        clean_data = make_padded_dataset(500)
+        corrupted_data = make_padded_dataset(500)
+        clean_loader, corrupted_loader = make_paired_loaders(clean_data, corrupted_data, batch_size=64, shuffle=True,
+                                                             device="cpu", bucket_by_length=bucket_by_length)
+
+        for _ in range(2):
+            seen_indices = []
+            for (clean_inputs, clean_targets), (corrupted_inputs, corrupted_targets) in zip(clean_loader,
+                                                                                           corrupted_loader):
+                assert clean_inputs.shape == corrupted_inputs.shape
+                assert t.equal(clean_targets[:, 0, 0], corrupted_targets[:, 0, 0])
+                seen_indices.extend(clean_targets[:, 0, 0].long().tolist())
+
+                # trimming only removes positions that are PAD in both clean and corrupted inputs
+                seq_len = clean_inputs.shape[1]
+                assert (clean_data.inputs[clean_targets[:, 0, 0].long(), seq_len:] == clean_data.pad_token_id).all()
+                assert (corrupted_data.inputs[corrupted_targets[:, 0, 0].long(), seq_len:] ==
+                        corrupted_data.pad_token_id).all()
+
+            assert sorted(seen_indices) == list(range(500))
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from circuits_benchmark.benchmark.tracr_token_ids import get_framed_vocab, enumerate_token_ids, token_ids_to_values, \
+    values_to_token_ids, get_seq_lens, frame_token_codes, encode_token_ids, decode_token_ids
+from circuits_benchmark.benchmark.vocabs import TRACR_BOS, TRACR_PAD
+
+
+class TestTracrTokenIds:
+    def test_enumerate_token_ids_matches_sequential_enumeration(self):
+        vocab = {"a", "b", "x"}
+        vals = sorted(vocab)
+        min_seq_len, max_seq_len = 2, 4
+
+        expected_inputs = []
+        for seq_len in range(min_seq_len, max_seq_len + 1):
+            for sample in np.ndindex(*([len(vals)] * (seq_len - 1))):
+                expected_inputs.append([TRACR_BOS] + [vals[i] for i in sample] + [TRACR_PAD] * (max_seq_len - seq_len))
+
+        framed_vocab = get_framed_vocab(vocab)
+        token_ids = enumerate_token_ids(len(vals), min_seq_len, max_seq_len)
+
+        assert token_ids.shape == (len(expected_inputs), max_seq_len)
+        assert token_ids_to_values(token_ids, framed_vocab).tolist() == expected_inputs
+        assert (values_to_token_ids(expected_inputs, framed_vocab) == token_ids).all()
+        assert get_seq_lens(token_ids, framed_vocab).tolist() == [len(x) - x.count(TRACR_PAD) for x in expected_inputs]
+
+    def test_framed_vocab_keeps_tuple_values(self):
+        framed_vocab = get_framed_vocab({(0, 1), (1, 0)})
+        assert framed_vocab.shape == (4,)
+        assert framed_vocab[1] == (0, 1)
+
+    def test_frame_token_codes(self):
+        framed_vocab = get_framed_vocab({"a", "b", "x"})
+        token_codes = np.array([[2, 0, 1], [1, 1, 0]])
+        token_ids = frame_token_codes(token_codes, np.array([4, 2]), n_vals=3)
+
+        assert token_ids_to_values(token_ids, framed_vocab).tolist() == [
+            [TRACR_BOS, "x", "a", "b"],
+            [TRACR_BOS, "b", TRACR_PAD, TRACR_PAD],
+        ]
+
+    def test_decode_token_ids_reverses_encoding(self):
+        framed_vocab = get_framed_vocab({"a", "b", "x"})
+        input_encoder = SimpleNamespace(encoding_map={TRACR_BOS: 3, "a": 0, "b": 1, "x": 2, TRACR_PAD: 4})
+        token_ids = enumerate_token_ids(3, 2, 4)
+
+        encoded_inputs = encode_token_ids(token_ids, framed_vocab, input_encoder)
+
+        assert (decode_token_ids(encoded_inputs, framed_vocab, input_encoder) == token_ids).all()